@@ -0,0 +1,163 @@
+"""
+Archive
+-------
+Cold storage for rows the bot only reads back as history. Sold accounts
+and transactions older than ARCHIVE_AFTER_DAYS move from the hot DB into
+database.archive_path() next to it (bot_data.archive.db), so the hot
+tables, their scans and the page cache only cover live data.
+
+- session strings are stored zlib-compressed; they are base64 around a
+  random auth key, so expect about a quarter off, not 10×
+- rows move in batches of BATCH, each batch its own short write
+  transaction, so purchases are never held up behind one long lock
+- the hot DB runs with auto_vacuum=INCREMENTAL and the pages freed are
+  handed back after every run. A DB created before this keeps its free
+  pages for reuse until `python archive.py vacuum` switches it over — one
+  full VACUUM that blocks writers, so run it with the bot stopped
+- purchase history, purchase counts, sold count, revenue and deposit
+  de-duplication in database.py read the archive as well
+
+Off by default (ARCHIVE_AFTER_DAYS = 0). When on, runs every
+ARCHIVE_INTERVAL for every shop; in cluster mode on the "archiver" leader
+only.
+
+    archiver = archive.Archiver(days=30).start()
+    archive.archive_once(days=30)      # the current shop, now
+
+    python archive.py run --days 30    # every shop, now
+    python archive.py stats
+    python archive.py vacuum           # one-time switch to incremental vacuum
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import database as db
+import shops
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+BATCH         = 500
+STARTUP_DELAY = 60       # first run shortly after start, not a full interval later
+
+
+def _size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def archive_once(days: float = ARCHIVE_AFTER_DAYS, batch: int = BATCH) -> dict:
+    """Archive the current shop's rows older than `days`; what moved and the hot DB size before/after."""
+    started = time.perf_counter()
+    before  = _size(db._db_path())
+    cutoff  = datetime.now() - timedelta(days=days)
+    db.init_archive()
+
+    moved = {"accounts": 0, "transactions": 0}
+    for key, fn, bound in (("accounts", db.archive_sold_accounts, cutoff.strftime("%Y-%m-%d %H:%M")),
+                           ("transactions", db.archive_transactions, cutoff.isoformat())):
+        while True:
+            n = fn(bound, batch)
+            moved[key] += n
+            if n < batch:
+                break
+
+    return {
+        **moved,
+        "pages_freed": db.reclaim_space(),
+        "hot_bytes_before": before,
+        "hot_bytes": _size(db._db_path()),
+        "archive_bytes": _size(db.archive_path()),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def stats() -> dict:
+    """The current shop's archive: rows in it and both files' sizes."""
+    return {**db.count_archived(), "hot_bytes": _size(db._db_path()), "archive_bytes": _size(db.archive_path())}
+
+
+class Archiver:
+    """Runs archive_once for every shop every `interval` seconds."""
+
+    def __init__(self, days: float = ARCHIVE_AFTER_DAYS, interval: float = ARCHIVE_INTERVAL):
+        self.days     = days
+        self.interval = interval
+        self.counters = {"runs": 0, "accounts": 0, "transactions": 0, "pages_freed": 0}
+        self.last_run = None
+        self._lock    = threading.Lock()     # one run at a time (timer and /archive run)
+        self._stop    = None
+
+    def start(self):
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), name="archiver", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def _run(self, stop: threading.Event):
+        wait = min(STARTUP_DELAY, self.interval)
+        while not stop.wait(wait):
+            wait = self.interval
+            try:
+                self.run()
+            except Exception as e:
+                logger.error(f"Archive run failed: {e}", exc_info=True)
+
+    def run(self) -> dict:
+        """One pass over all shops now; shop name → archive_once result."""
+        with self._lock:
+            results = {shop.name: shop.run(archive_once, self.days) for shop in shops.all()}
+        for result in results.values():
+            for key in ("accounts", "transactions", "pages_freed"):
+                self.counters[key] += result[key]
+        self.counters["runs"] += 1
+        self.last_run = datetime.now().strftime("%Y-%m-%d %H:%M")
+        for name, r in results.items():
+            if r["accounts"] or r["transactions"]:
+                logger.info(f"Archived {r['accounts']} account(s), {r['transactions']} transaction(s) "
+                            f"from {name}: {r['hot_bytes_before'] // 1024} → {r['hot_bytes'] // 1024} KiB")
+        return results
+
+
+def vacuum() -> dict:
+    """Switch the current shop's DB to auto_vacuum=INCREMENTAL if it isn't yet; sizes before/after."""
+    before = _size(db._db_path())
+    if db.incremental_vacuum_enabled():
+        return {"switched": False, "hot_bytes": before}
+    started = time.perf_counter()
+    db.enable_incremental_vacuum()
+    db.reclaim_space()
+    return {"switched": True, "hot_bytes_before": before, "hot_bytes": _size(db._db_path()),
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="archive every shop's old rows now")
+    p.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS)
+    sub.add_parser("stats", help="archived rows and file sizes per shop")
+    sub.add_parser("vacuum", help="one-time full VACUUM to enable incremental vacuum (stop the bot first)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if not args.days:
+            raise SystemExit("Pass --days N (ARCHIVE_AFTER_DAYS is 0)")
+        print(json.dumps(Archiver(days=args.days).run(), indent=2))
+    elif args.command == "stats":
+        print(json.dumps({shop.name: shop.run(stats) for shop in shops.all()}, indent=2))
+    elif args.command == "vacuum":
+        print(json.dumps({shop.name: shop.run(vacuum) for shop in shops.all()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
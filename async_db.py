@@ -0,0 +1,43 @@
+"""
+Async DB Facade
+---------------
+Awaitable versions of every function in database.py for code running on
+the event loop (ton_monitor, Telethon listeners, the asyncio runtime):
+
+    import async_db as adb
+    ok = await adb.record_transaction(uid, amount, tx_hash)
+
+Each call runs the synchronous database function on a small dedicated
+thread pool, so a slow SQLite write never stalls the loop and the loop
+never competes with handler threads for a connection. Wrappers are built
+on first use and cached as module attributes.
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+
+DB_WORKERS = 4
+
+executor = ThreadPoolExecutor(DB_WORKERS, thread_name_prefix="async-db")
+
+
+def _wrap(fn):
+    @functools.wraps(fn)
+    async def call(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # run_in_executor does not carry contextvars over — keep the caller's shop
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(executor, ctx.run, functools.partial(fn, *args, **kwargs))
+    return call
+
+
+def __getattr__(name: str):
+    fn = getattr(db, name, None)
+    if name.startswith("_") or not callable(fn):
+        raise AttributeError(f"module 'async_db' has no attribute '{name}'")
+    wrapped = globals()[name] = _wrap(fn)
+    return wrapped
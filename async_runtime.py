@@ -0,0 +1,167 @@
+"""
+Async Runtime
+-------------
+Moves the bot's I/O onto one asyncio event loop: getUpdates long polling,
+update dispatch, Telethon clients and the TON monitor all share the loop
+that session_manager already uses, instead of a polling thread, a
+dispatcher and a separate loop thread.
+
+It is not a single-threaded bot. The handlers are synchronous telebot
+handlers doing blocking SQLite and Bot API calls, so they still run on a
+pool of handler threads. Sends still go through outbound's lane threads,
+and admin ops, exports, archive and backup keep their own executors and
+threads. What the loop replaces is the polling thread and the per-user
+queues of UpdateWorkers. Thread-safety rules are the same as RUNTIME =
+"threads".
+
+- poll() long-polls getUpdates with httpx on the loop
+- dispatch() turns every update into a task. Tasks for the same user are
+  chained (each awaits the previous one), so one user's updates still run
+  strictly in order, while different users run concurrently
+- handlers are ordinary telebot handlers; the task runs them on a bounded
+  thread pool, so a handler that blocks on SQLite or a Bot API call never
+  stalls the loop. Coroutines the handler schedules with run_async() run on
+  the loop as before
+- at most max_inflight updates are held at once; beyond that poll() stops
+  fetching (back-pressure on getUpdates, like UpdateWorkers' full queues)
+
+install() also replaces bot.process_new_updates, so the webhook server's
+batcher thread feeds the same dispatcher.
+
+    runtime = AsyncRuntime(bot, loop, handler_threads=8).install()
+    loop.run_until_complete(runtime.poll())
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from telebot import types
+
+from metrics import Histogram
+from update_workers import BUCKETS, update_user_id
+
+logger = logging.getLogger(__name__)
+
+API_URL      = "https://api.telegram.org/bot{token}/getUpdates"
+POLL_TIMEOUT = 25      # seconds Telegram holds a getUpdates call open
+POLL_LIMIT   = 100
+
+
+class AsyncRuntime:
+    def __init__(self, bot, loop: asyncio.AbstractEventLoop, handler_threads: int = 8, max_inflight: int = 1000):
+        if bot.threaded:
+            raise ValueError("AsyncRuntime needs a TeleBot created with threaded=False")
+        self.bot          = bot
+        self.loop         = loop
+        self.executor     = ThreadPoolExecutor(handler_threads, thread_name_prefix="handler")
+        self.threads      = handler_threads
+        self.max_inflight = max_inflight
+        self.inflight     = 0
+        self.max_seen     = 0
+        self.handled      = 0
+        self.failed       = 0
+        self.queue_wait   = Histogram(BUCKETS)
+        self.handler_time = Histogram(BUCKETS)
+        self._slots       = asyncio.Semaphore(max_inflight)
+        self._tails       = {}      # user id → that user's last queued task
+        self._process     = bot.process_new_updates
+        self._stopped     = False
+
+    # ── Lifecycle ────────────────────────────────────────
+
+    def start(self):
+        return self
+
+    def install(self):
+        """Route every update the bot receives (polling or webhook) through the loop."""
+        self.bot.process_new_updates = self.submit
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self.bot.process_new_updates = self._process
+        self.executor.shutdown(wait=False)
+
+    # ── Polling ──────────────────────────────────────────
+
+    async def poll(self, timeout: int = POLL_TIMEOUT):
+        """Long-poll getUpdates on the loop until stop()."""
+        url = API_URL.format(token=self.bot.token)
+        backoff = 1
+        async with httpx.AsyncClient(timeout=timeout + 10) as client:
+            while not self._stopped:
+                try:
+                    r = await client.post(url, json={
+                        "offset": self.bot.last_update_id + 1,
+                        "timeout": timeout,
+                        "limit": POLL_LIMIT,
+                    })
+                    data = r.json()
+                    if not data.get("ok"):
+                        raise RuntimeError(f"getUpdates: {data.get('description')}")
+                    backoff = 1
+                    updates = [types.Update.de_json(u) for u in data["result"]]
+                    if updates:
+                        await self.dispatch(updates)
+                except Exception as e:
+                    logger.error(f"Polling error: {e}, retrying in {backoff}s")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+
+    # ── Dispatch ─────────────────────────────────────────
+
+    def submit(self, updates: list):
+        """Drop-in for TeleBot.process_new_updates, callable from any thread but the loop's."""
+        asyncio.run_coroutine_threadsafe(self.dispatch(updates), self.loop).result()
+
+    async def dispatch(self, updates: list):
+        now = time.perf_counter()
+        for update in updates:
+            if update.update_id > self.bot.last_update_id:
+                self.bot.last_update_id = update.update_id
+            await self._slots.acquire()
+            self.inflight += 1
+            if self.inflight > self.max_seen:
+                self.max_seen = self.inflight
+            uid  = update_user_id(update)
+            prev = self._tails.get(uid)
+            self._tails[uid] = self.loop.create_task(self._handle(uid, prev, update, now))
+
+    async def _handle(self, uid: int, prev, update, enqueued_at: float):
+        try:
+            if prev is not None:
+                await asyncio.wait((prev,))
+            started = time.perf_counter()
+            self.queue_wait.observe(started - enqueued_at)
+            try:
+                await self.loop.run_in_executor(self.executor, self._process, [update])
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Update {update.update_id} failed: {e}", exc_info=True)
+            finally:
+                self.handled += 1
+                self.handler_time.observe(time.perf_counter() - started)
+        finally:
+            self.inflight -= 1
+            self._slots.release()
+            if self._tails.get(uid) is asyncio.current_task():
+                del self._tails[uid]
+
+    # ── Metrics ──────────────────────────────────────────
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.threads,
+            "depth": [self.inflight],
+            "max_depth": [self.max_seen],
+            "users": len(self._tails),
+            "handled": self.handled,
+            "failed": self.failed,
+            "threads": threading.active_count(),
+            "queue_wait": self.queue_wait.snapshot(),
+            "handler_time": self.handler_time.snapshot(),
+        }
@@ -0,0 +1,253 @@
+"""
+Backup
+------
+Online backups of each shop's DB (and its archive, see archive.py) while
+the bot keeps serving. Copying the live file can catch it mid-write and
+locking it would stall every handler; this uses SQLite's backup API:
+
+- STEP_PAGES pages are copied per step from a background thread, sleeping
+  STEP_PAUSE between steps so handlers' queries get the disk and the GIL
+- the source is read inside one read transaction. Without it, any write
+  by a handler between two steps restarts the copy from page 1 — on a
+  busy bot it never finishes. In WAL mode the open read only keeps the
+  WAL from being checkpointed until the backup ends; writers carry on
+- the backup API writes to a database file, so the copy first lands
+  uncompressed in BACKUP_DIR/<db>-<stamp>.db.partial, is then gzipped to
+  BACKUP_DIR/<db>-<YYYYmmdd-HHMMSS>.db.gz and renamed into place only once
+  complete; the temp copy is removed. Plan on free disk in BACKUP_DIR of
+  about the DB's size plus its compressed size per run (≈2× the DB at
+  worst), on top of the BACKUP_KEEP backups kept per DB file
+- verify() restores a backup into a temp file and runs integrity_check
+
+Off by default (BACKUP_INTERVAL = 0). When set, runs every BACKUP_INTERVAL
+(in cluster mode on the "backup" leader); any time from /backup run or the
+command line:
+
+    python backup.py run                        # every shop, now
+    python backup.py list
+    python backup.py verify [file.db.gz]        # newest backup if no file
+    python backup.py restore file.db.gz restored.db
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import database as db
+import shops
+from config import BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP
+
+logger = logging.getLogger(__name__)
+
+STEP_PAGES    = 256           # 1 MiB per step at the default 4 KiB page size
+STEP_PAUSE    = 0.005
+CHUNK         = 1024 * 1024   # gzip streaming buffer
+STARTUP_DELAY = 5 * 60
+
+
+def copy_db(src_path: str, dst_path: str, pages: int = STEP_PAGES, pause: float = STEP_PAUSE) -> dict:
+    """Consistent copy of a live DB file with the backup API; {"pages", "steps", "seconds"}."""
+    started = time.perf_counter()
+    steps   = {"steps": 0, "pages": 0}
+
+    def progress(status, remaining, total):
+        steps["steps"] += 1
+        steps["pages"] = total
+        if pause and remaining:
+            time.sleep(pause)
+
+    src = sqlite3.connect(src_path, timeout=db.BUSY_TIMEOUT, isolation_level=None)
+    dst = sqlite3.connect(dst_path)
+    try:
+        # Pin one snapshot for every step
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages, progress=progress)
+        src.execute("COMMIT")
+    finally:
+        dst.close()
+        src.close()
+    return {**steps, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _backup_name(db_file: str) -> str:
+    return os.path.splitext(os.path.basename(db_file))[0]
+
+
+def list_backups(db_file: str = None, dest_dir: str = BACKUP_DIR) -> list:
+    """Backups of db_file (default: the current shop's DB) in dest_dir, newest first."""
+    pattern = re.compile(re.escape(_backup_name(db_file or db._db_path())) + r"-\d{8}-\d{6}\.db\.gz$")
+    if not os.path.isdir(dest_dir):
+        return []
+    return sorted((os.path.join(dest_dir, f) for f in os.listdir(dest_dir) if pattern.match(f)), reverse=True)
+
+
+def rotate(db_file: str, dest_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> list:
+    """Delete all but the newest `keep` backups of db_file; the removed paths."""
+    removed = list_backups(db_file, dest_dir)[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def backup_file(db_file: str, dest_dir: str = BACKUP_DIR, pages: int = STEP_PAGES,
+                pause: float = STEP_PAUSE) -> dict:
+    """Back up one DB file to dest_dir as gzip; the copy's stats plus file and sizes."""
+    os.makedirs(dest_dir, exist_ok=True)
+    final = os.path.join(dest_dir, f"{_backup_name(db_file)}-{datetime.now():%Y%m%d-%H%M%S}.db.gz")
+    # The backup API needs a database to write to: an uncompressed temp copy, gone once gzipped
+    raw = final[:-len(".gz")] + ".partial"
+    try:
+        stats = copy_db(db_file, raw, pages, pause)
+        started = time.perf_counter()
+        with open(raw, "rb") as f, gzip.open(final + ".partial", "wb", compresslevel=6) as out:
+            shutil.copyfileobj(f, out, CHUNK)
+        os.replace(final + ".partial", final)
+        stats["gzip_seconds"] = round(time.perf_counter() - started, 3)
+        stats["bytes"] = os.path.getsize(raw)
+    finally:
+        for leftover in (raw, final + ".partial"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return {"file": final, **stats, "gz_bytes": os.path.getsize(final)}
+
+
+def backup_once(dest_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> list:
+    """Back up the current shop's DB and archive, then rotate; one result per file."""
+    files = [db._db_path()] + ([db.archive_path()] if os.path.exists(db.archive_path()) else [])
+    results = []
+    for db_file in files:
+        result = backup_file(db_file, dest_dir)
+        result["rotated"] = len(rotate(db_file, dest_dir, keep))
+        results.append(result)
+    return results
+
+
+def restore(backup: str, dst_path: str):
+    """Unpack a backup to dst_path (written beside it first, then renamed over it)."""
+    tmp = dst_path + ".restoring"
+    with gzip.open(backup, "rb") as f, open(tmp, "wb") as out:
+        shutil.copyfileobj(f, out, CHUNK)
+    # A WAL left by the old file would be replayed onto the restored one
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(dst_path + suffix):
+            os.remove(dst_path + suffix)
+    os.replace(tmp, dst_path)
+
+
+def verify(backup: str) -> dict:
+    """Restore a backup into a temp dir and check it: integrity_check and row counts per table."""
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "verify.db")
+        restore(backup, path)
+        con = sqlite3.connect(path)
+        try:
+            integrity = [r[0] for r in con.execute("PRAGMA integrity_check")]
+            names = [r[0] for r in con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+            tables = {name: con.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in names}
+        finally:
+            con.close()
+    return {
+        "file": backup,
+        "ok": integrity == ["ok"],
+        "integrity": integrity[:10],
+        "tables": tables,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+class Backup:
+    """Runs backup_once for every shop every `interval` seconds."""
+
+    def __init__(self, interval: float = BACKUP_INTERVAL, dest_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP):
+        self.interval = interval
+        self.dest_dir = dest_dir
+        self.keep     = keep
+        self.counters = {"runs": 0, "files": 0, "bytes": 0, "failed": 0}
+        self.last_run = None
+        self._lock    = threading.Lock()     # one run at a time (timer and /backup run)
+        self._stop    = None
+
+    def start(self):
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), name="backup", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def _run(self, stop: threading.Event):
+        wait = min(STARTUP_DELAY, self.interval)
+        while not stop.wait(wait):
+            wait = self.interval
+            try:
+                self.run()
+            except Exception as e:
+                self.counters["failed"] += 1
+                logger.error(f"Backup failed: {e}", exc_info=True)
+
+    def run(self) -> dict:
+        """One backup of every shop now; shop name → backup_once results."""
+        with self._lock:
+            results = {shop.name: shop.run(backup_once, self.dest_dir, self.keep) for shop in shops.all()}
+        for name, files in results.items():
+            for r in files:
+                self.counters["files"] += 1
+                self.counters["bytes"] += r["gz_bytes"]
+                logger.info(f"Backed up {name}: {r['file']} ({r['bytes'] // 1024} → {r['gz_bytes'] // 1024} KiB, "
+                            f"{r['steps']} steps in {r['seconds']} s)")
+        self.counters["runs"] += 1
+        self.last_run = datetime.now().strftime("%Y-%m-%d %H:%M")
+        return results
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=BACKUP_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("run", help="back up every shop's DB now")
+    sub.add_parser("list", help="list backups, newest first")
+    p = sub.add_parser("verify", help="restore into a temp file and run integrity_check")
+    p.add_argument("file", nargs="?", help="default: the newest backup of the first shop's DB")
+    p = sub.add_parser("restore", help="unpack a backup (stop the bot first)")
+    p.add_argument("file")
+    p.add_argument("dest")
+    p.add_argument("--force", action="store_true", help="overwrite dest if it exists")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        print(json.dumps(Backup(dest_dir=args.dir).run(), indent=2))
+    elif args.command == "list":
+        for shop in shops.all():
+            for db_file in (shop.run(db._db_path), shop.run(db.archive_path)):
+                for path in list_backups(db_file, args.dir):
+                    print(f"{os.path.getsize(path):>12,}  {path}")
+    elif args.command == "verify":
+        path = args.file or next(iter(list_backups(dest_dir=args.dir)), None)
+        if path is None:
+            raise SystemExit(f"No backups in {args.dir}")
+        result = verify(path)
+        print(json.dumps(result, indent=2))
+        raise SystemExit(0 if result["ok"] else 1)
+    elif args.command == "restore":
+        if os.path.exists(args.dest) and not args.force:
+            raise SystemExit(f"{args.dest} exists; pass --force to overwrite it")
+        restore(args.file, args.dest)
+        print(f"Restored {args.file} → {args.dest}")
+
+
+if __name__ == "__main__":
+    main()
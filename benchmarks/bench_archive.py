@@ -0,0 +1,88 @@
+"""
+Cold-storage archival (archive.py): hot DB size and read latency before
+and after moving old rows out.
+
+Seeds a temp DB with --accounts accounts (80% sold, --old of the sold ones
+past the archive cutoff) carrying realistic Telethon session strings
+(base64 around a random 256-byte auth key), and as many transactions, then
+times the reads that walk the accounts table, runs archive.archive_once
+and times them again. Purchase history and totals must come out the same.
+
+    python benchmarks/bench_archive.py --accounts 100000 --old 0.9
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sqlite3
+
+import common
+import archive
+import database as db
+from suite import measure
+
+
+def seed(n: int, old: float):
+    rng = random.Random(n)
+    sold_at = lambda: "2020-01-01 00:00" if rng.random() < old else "2099-01-01 00:00"
+    con = sqlite3.connect(db.DB_PATH)
+    con.executemany(
+        "INSERT INTO accounts (phone, password_2fa, session_string, status, added_at, sold_at, buyer_id) "
+        "VALUES (?, '', ?, ?, '2020-01-01 00:00', ?, ?)",
+        ((f"+1{i:010d}", "1" + base64.urlsafe_b64encode(os.urandom(263)).decode(),
+          "sold" if i % 5 else "available",
+          sold_at() if i % 5 else None,
+          1_000_000 + i % (n // 10) if i % 5 else None) for i in range(n)))
+    con.executemany(
+        "INSERT INTO transactions (user_id, amount_ton, tx_hash, type, created_at) VALUES (?, 1.0, ?, ?, ?)",
+        ((1_000_000 + i % (n // 10), f"seed{i}", "deposit" if i % 3 else "purchase",
+          "2020-01-01T00:00:00" if rng.random() < old else "2099-01-01T00:00:00") for i in range(n)))
+    con.commit()
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+
+
+def reads(n: int, budget: float) -> tuple:
+    rng = random.Random(0)
+    uid = lambda: 1_000_000 + rng.randrange(n // 10)
+
+    def reserve_cancel():
+        db.reserve_account(1)
+        db.cancel_purchase(1)
+
+    answers = (db.get_sold_count(), round(db.get_total_revenue(), 3),
+               sum(len(db.get_user_purchases(1_000_000 + i)) for i in range(0, n // 10, max(1, n // 1000))))
+    return answers, {
+        "get_user_purchases":      measure(lambda: db.get_user_purchases(uid()), budget),
+        "get_user_purchase_count": measure(lambda: db.get_user_purchase_count(uid()), budget),
+        "get_sold_count":          measure(db.get_sold_count, budget),
+        "get_available_count":     measure(db.get_available_count, budget),
+        "reserve_cancel":          measure(reserve_cancel, budget),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--old", type=float, default=0.9, help="share of sold rows past the cutoff")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds per timed read")
+    args = parser.parse_args()
+
+    with common.temp_database() as path:
+        seed(args.accounts, args.old)
+        answers_before, before = reads(args.accounts, args.budget)
+        run = archive.archive_once(days=30)
+        answers_after, after = reads(args.accounts, args.budget)
+
+    print(json.dumps({
+        "accounts": args.accounts,
+        "archive_run": run,
+        "same_answers": answers_before == answers_after,
+        "p50_us": {name: {"before": before[name]["p50_us"], "after": after[name]["p50_us"]} for name in before},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Online backup (backup.py): copy throughput and what it does to writers.
+
+Seeds a temp DB with suite.seed(--rows), then keeps a writer thread doing
+what a deposit does (record_transaction + add_balance) every --interval-ms
+and records each write's latency. It runs once with no backup going (the
+baseline), then during backup.copy_db for every --pages step size, and
+during one full backup_file (copy + gzip). Reports MB/s for the copy and
+the writer p50 / p99 / max while it ran.
+
+    python benchmarks/bench_backup.py --rows 200000 --pages -1 64 256 1024
+"""
+
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+
+import common
+import backup
+import database as db
+from suite import seed
+
+
+class Writer:
+    def __init__(self, interval: float):
+        self.interval  = interval
+        self.latencies = []
+        self._seq      = itertools.count()
+        self._stop     = threading.Event()
+        self._thread   = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            i = next(self._seq)
+            start = time.perf_counter()
+            db.record_transaction(1_000_000 + i % 1000, 0.1, f"bench-{i}-{time.time_ns()}")
+            db.add_balance(1_000_000 + i % 1000, 0.1)
+            self.latencies.append(time.perf_counter() - start)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def phase(interval: float, fn) -> dict:
+    with Writer(interval) as writer:
+        result = fn()
+    return {**result, "writes": common.summarize(writer.latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[-1, 64, 256, 1024], help="-1: all in one step")
+    parser.add_argument("--pause", type=float, default=backup.STEP_PAUSE)
+    parser.add_argument("--interval-ms", type=float, default=2.0, help="writer pause between writes")
+    parser.add_argument("--idle", type=float, default=2.0, help="seconds of baseline writes")
+    args = parser.parse_args()
+
+    with common.temp_database() as path:
+        seed(args.rows)
+        size = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+        interval = args.interval_ms / 1000
+        out = os.path.join(os.path.dirname(path), "out")
+        os.makedirs(out)
+        runs = {"baseline": phase(interval, lambda: (time.sleep(args.idle), {})[1])}
+        for pages in args.pages:
+            target = os.path.join(out, f"copy{pages}.db")
+
+            def copy():
+                result = backup.copy_db(path, target, pages, args.pause)
+                os.remove(target)
+                return {**result, "mb_per_s": round(size / 1e6 / result["seconds"], 1)}
+            runs[f"copy_db pages={pages}"] = phase(interval, copy)
+        runs["backup_file"] = phase(interval, lambda: backup.backup_file(path, out))
+        verified = backup.verify(runs["backup_file"]["file"])
+
+    print(json.dumps({
+        "rows": args.rows,
+        "db_mb": round(size / 1e6, 1),
+        "pause_s": args.pause,
+        "verified": verified["ok"],
+        "runs": runs,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
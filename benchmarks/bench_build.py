@@ -0,0 +1,140 @@
+"""
+Micro-benchmark of the premium emoji engine behind send() / edit().
+
+Compares, per message:
+- legacy   — the old bot.build(): regexes recompiled per call, += string
+             growth, every fragment re-encoded to UTF-16
+- build    — emoji_engine.build() on an already formatted f-string
+             (parsed on every call; dynamic text is not cached)
+- render   — emoji_engine.render() on a cached template, measuring only
+             the {field} values
+
+All three must produce identical text + entities.
+
+    python benchmarks/bench_build.py --rounds 20000
+"""
+
+import argparse
+import json
+import re
+import time
+
+import common
+from telebot.types import MessageEntity
+from emoji_engine import EMOJI_IDS, build, render
+
+TEMPLATES = {
+    "welcome": (
+        "[E:👋] **Welcome, {name}!**\n\n"
+        "[E:🏠] **Fragment Account Shop**\n"
+        "[E:💎] Buy verified Telegram Fragment accounts instantly.\n\n"
+        "[E:🪙] Price: **{price} TON** per account\n"
+        "[E:☑️] Instant delivery after payment\n"
+        "[E:🔒] Safe & automated"
+    ),
+    "buy": (
+        "[E:🏪] **Buy Fragment Account**\n\n"
+        "[E:💎] Available Stock: **{stock}**\n"
+        "[E:🪙] Price: **{price} TON**\n"
+        "[E:💲] Your Balance: **{balance:.3f} TON**\n\n"
+        "[E:✅] Press confirm to proceed.\n"
+        "[E:🔒] **You will only be charged once you receive the login OTP.**\n"
+        "If cancelled before OTP arrives, no charge."
+    ),
+    "profile": (
+        "[E:👤] **Your Profile**\n\n"
+        "[E:🤖] Telegram ID: {uid}\n"
+        "[E:🪙] Balance: **{balance:.3f} TON**\n"
+        "[E:📈] Total Purchases: **{purchases}**\n"
+        "[E:💲] Account Price: **{price} TON**"
+    ),
+    "static": "[E:⚠️] **Out of Stock**\n\nNo accounts available right now. Check back soon!",
+}
+
+
+def legacy_build(text: str):
+    """bot.build() as it was before emoji_engine."""
+    pattern  = re.compile(r'\[E:(.+?)\]')
+    result_text = ""
+    result_entities = []
+    parts = pattern.split(text)
+    pos = 0
+    idx = 0
+    while idx < len(parts):
+        segment = parts[idx]
+        if idx % 2 == 0:
+            bold_pat = re.compile(r'\*\*(.+?)\*\*', re.DOTALL)
+            last = 0
+            for m in bold_pat.finditer(segment):
+                before = segment[last:m.start()]
+                result_text += before
+                pos += len(before.encode('utf-16-le')) // 2
+                bold_start = pos
+                inner = m.group(1)
+                result_text += inner
+                inner_len = len(inner.encode('utf-16-le')) // 2
+                result_entities.append(MessageEntity(type="bold", offset=bold_start, length=inner_len))
+                pos += inner_len
+                last = m.end()
+            tail = segment[last:]
+            result_text += tail
+            pos += len(tail.encode('utf-16-le')) // 2
+        else:
+            emoji_char = segment
+            emoji_id   = EMOJI_IDS.get(emoji_char)
+            result_text += emoji_char
+            char_len = len(emoji_char.encode('utf-16-le')) // 2
+            if emoji_id:
+                result_entities.append(MessageEntity(
+                    type="custom_emoji", offset=pos, length=char_len, custom_emoji_id=emoji_id
+                ))
+            pos += char_len
+        idx += 1
+    return result_text, result_entities
+
+
+def fields(i: int) -> dict:
+    return {"name": f"Юзер{i} 🦊", "price": 0.1, "stock": i % 97, "balance": i / 7, "uid": 10_000 + i, "purchases": i % 5}
+
+
+def as_dicts(result):
+    text, entities = result
+    dicts = [e.to_dict() if isinstance(e, MessageEntity) else e for e in entities]
+    return text, [{k: v for k, v in d.items() if v is not None} for d in dicts]
+
+
+def time_per_call(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for i in range(rounds):
+        fn(i)
+    return (time.perf_counter() - start) / rounds * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = {}
+    for name, template in TEMPLATES.items():
+        for i in range(50):
+            f = fields(i)
+            expected = as_dicts(legacy_build(template.format(**f)))
+            assert as_dicts(build(template.format(**f))) == expected, name
+            assert as_dicts(render(template, **f)) == expected, name
+
+        legacy_ns = time_per_call(lambda i: legacy_build(template.format(**fields(i))), args.rounds)
+        build_ns  = time_per_call(lambda i: build(template.format(**fields(i))), args.rounds)
+        render_ns = time_per_call(lambda i: render(template, **fields(i)), args.rounds)
+        base_ns   = time_per_call(lambda i: fields(i), args.rounds)
+        results[name] = {
+            "legacy_ns": round(legacy_ns - base_ns),
+            "build_ns": round(build_ns - base_ns),
+            "render_ns": round(render_ns - base_ns),
+            "speedup": round((legacy_ns - base_ns) / max(1.0, render_ns - base_ns), 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
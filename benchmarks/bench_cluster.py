@@ -0,0 +1,128 @@
+"""
+Cluster mode throughput: how update handling scales with worker processes.
+
+Fills update_queue in a temp DB with --updates messages from --users
+users, then starts W worker processes (for each W in --workers), each
+running cluster.Cluster + cluster.Consumer + UpdateWorkers exactly as
+bot.py does with CLUSTER = True. The handler stands in for a real one:
+a few DB calls (add_user, get_balance), --cpu-ms of pure-Python work
+(holds the GIL, like telebot parsing and markup building) and --io-ms of
+sleeping (a Bot API call).
+
+Reports updates/s per worker count, the speed-up over one worker, and
+checks every update was handled exactly once, in per-user order.
+Scaling needs free cores: on a single-CPU machine the workers only share it.
+
+    python benchmarks/bench_cluster.py --workers 1 2 4 --updates 4000 --cpu-ms 2
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import common
+import telebot
+from telebot import types
+
+import cluster
+import database as db
+import update_workers
+
+
+def burn(ms: float):
+    end = time.perf_counter() + ms / 1000
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+
+def worker(index: int, db_path: str, args, ready, go, results):
+    db.DB_PATH = db_path
+    bot = telebot.TeleBot("1:bench", threaded=False)
+    seen = []
+
+    @bot.message_handler(func=lambda m: True)
+    def handle(message):
+        db.add_user(message.from_user.id, message.from_user.username)
+        db.get_balance(message.from_user.id)
+        burn(args.cpu_ms)
+        time.sleep(args.io_ms / 1000)
+        seen.append((time.time(), message.from_user.id, int(message.text)))
+
+    node = cluster.Cluster(f"bench-{index}", ttl=5).start()
+    workers = update_workers.UpdateWorkers(bot, args.threads).start()
+    ready.wait()
+    node._beat()            # everyone has joined: settle on the final partitioning
+    go.wait()
+    consumer = cluster.Consumer(node, workers).start()
+    while db.count_queued_updates().keys() - {"done"}:
+        time.sleep(0.05)
+    consumer.stop()
+    node.stop()
+    results.put((os.getpid(), seen))
+
+
+def run(n_workers: int, args) -> dict:
+    with common.temp_database() as path:
+        db.enqueue_updates([
+            (i + 1, 1000 + i % args.users, json.dumps({
+                "update_id": i + 1,
+                "message": {"message_id": i + 1, "date": 0, "text": str(i + 1),
+                            "chat": {"id": 1000 + i % args.users, "type": "private"},
+                            "from": {"id": 1000 + i % args.users, "is_bot": False, "first_name": "bench",
+                                     "username": f"u{i % args.users}"}},
+            }), time.time())
+            for i in range(args.updates)
+        ])
+        ready, go = multiprocessing.Barrier(n_workers + 1), multiprocessing.Barrier(n_workers + 1)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(i, path, args, ready, go, results))
+                 for i in range(n_workers)]
+        for p in procs:
+            p.start()
+        ready.wait()
+        time.sleep(0.2)     # let the extra heartbeats land
+        go.wait()
+        start = time.perf_counter()
+        handled = [results.get() for _ in procs]
+        elapsed = time.perf_counter() - start
+        for p in procs:
+            p.join()
+
+        per_user = {}
+        for _, uid, update_id in sorted(e for _, seen in handled for e in seen):
+            per_user.setdefault(uid, []).append(update_id)
+        total = sum(len(v) for v in per_user.values())
+        return {
+            "workers": n_workers,
+            "handled": total,
+            "exactly_once": total == args.updates and len({u for v in per_user.values() for u in v}) == total,
+            "in_order": all(v == sorted(v) for v in per_user.values()),
+            "per_worker": [len(seen) for _, seen in handled],
+            "seconds": round(elapsed, 2),
+            "updates_per_s": round(total / elapsed, 1),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=4000)
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=8, help="UpdateWorkers threads per process")
+    parser.add_argument("--cpu-ms", type=float, default=2.0)
+    parser.add_argument("--io-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    rows = [run(n, args) for n in args.workers]
+    base = rows[0]["updates_per_s"]
+    for row in rows:
+        row["speedup"] = round(row["updates_per_s"] / base, 2)
+    print(json.dumps({"cpu_ms": args.cpu_ms, "io_ms": args.io_ms, "runs": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
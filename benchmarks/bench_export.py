@@ -0,0 +1,70 @@
+"""
+Admin exports (exporter.py): time and peak memory against table size.
+
+For each --sizes row count, seeds a temp DB with suite.seed, archives half
+of the sold accounts and transactions (so sales and deposits read both
+databases), then writes every export kind in both formats. Peak memory is
+tracemalloc's peak over the export, spool included (--spool-kb, default
+exporter.SPOOL_SIZE). It should stay flat as the tables grow.
+
+    python benchmarks/bench_export.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import gzip
+import json
+import sqlite3
+import time
+import tracemalloc
+
+import common
+import archive
+import database as db
+import exporter
+from suite import seed
+
+
+def run(kind: str, fmt: str, spool: int) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    with exporter.export(kind, fmt, spool) as (file, count):
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = len(file.read())
+        file.seek(0)
+        with gzip.open(file, "rt", encoding="utf-8") as text:
+            lines = sum(1 for _ in text)
+    return {
+        "rows": count,
+        "lines_ok": lines == count + (fmt == "csv"),
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(count / elapsed) if elapsed else 0,
+        "gz_kb": size // 1024,
+        "peak_kb": peak // 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--spool-kb", type=int, default=exporter.SPOOL_SIZE // 1024)
+    args = parser.parse_args()
+
+    results = {}
+    for n in args.sizes:
+        with common.temp_database() as path:
+            seed(n)
+            con = sqlite3.connect(path)
+            con.execute("UPDATE accounts SET sold_at = '2000-01-01 00:00' WHERE status = 'sold' AND id % 2 = 0")
+            con.execute("UPDATE transactions SET created_at = '2000-01-01' WHERE id % 2 = 0")
+            con.commit()
+            con.close()
+            archive.archive_once(days=30)
+            results[n] = {f"{kind}.{fmt}": run(kind, fmt, args.spool_kb * 1024)
+                          for kind in exporter.KINDS for fmt in exporter.FORMATS}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
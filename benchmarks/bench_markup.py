@@ -0,0 +1,91 @@
+"""
+Per-send CPU of cached keyboards / static screens vs building them per call.
+
+Runs bot.send_message() through telebot with the HTTP layer stubbed out
+(apihelper._make_request returns a canned Message), so the numbers are
+the CPU a handler spends building + serializing one reply:
+- built  — keyboard object built per call (the .build of a @frozen keyboard)
+           and serialized by telebot on every send
+- cached — the @frozen keyboard's ready JSON string
+
+    python benchmarks/bench_markup.py --rounds 20000
+"""
+
+import argparse
+import json
+import time
+
+import common
+from telebot import apihelper
+
+import bot
+import session_manager
+from config import BOT_WALLET
+
+FAKE_MESSAGE = {
+    "message_id": 1, "date": 0, "text": "ok",
+    "chat": {"id": 1, "type": "private"},
+    "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+}
+
+CASES = {
+    "main_menu_admin": (bot._main_menu, (True,)),
+    "admin_menu": (bot.admin_menu, ()),
+    "price_quick_kb": (bot.price_quick_kb, ()),
+    "confirm_purchase_kb": (bot.confirm_purchase_kb, ()),
+    "cancel_otp_kb": (bot.cancel_otp_kb, ()),
+    "add_balance_choose_kb": (bot.add_balance_choose_kb, ()),
+    "review_rating_kb": (session_manager._review_rating_kb, ()),
+}
+
+
+def legacy_manual_payment(uid: int) -> str:
+    return (
+        f"<tg-emoji emoji-id=\"6107289979895945232\">💎</tg-emoji> <b>Manual Payment</b>\n\n"
+        f"Send any amount of TON to the address below.\n"
+        f"<b>You must include your ID as memo</b> or it won\'t be credited.\n\n"
+        f"<tg-emoji emoji-id=\"6107289979895945232\">💎</tg-emoji> <b>Wallet Address:</b>\n"
+        f"<code>{BOT_WALLET}</code>\n\n"
+        f"<tg-emoji emoji-id=\"6106902616795519273\">🔒</tg-emoji> <b>Memo / Comment:</b>\n"
+        f"<code>{uid}</code>\n\n"
+        f"<tg-emoji emoji-id=\"5900104897885376843\">⏱</tg-emoji> Credited automatically within ~1 minute.\n"
+        f"<tg-emoji emoji-id=\"6106898459267177284\">⚠️</tg-emoji> Do not forget the memo!"
+    )
+
+
+def ns_per_send(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for i in range(rounds):
+        fn(i)
+    return (time.perf_counter() - start) / rounds * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    apihelper._make_request = lambda *a, **k: FAKE_MESSAGE
+    send = bot.bot.send_message
+
+    results = {}
+    for name, (cached, key) in CASES.items():
+        assert json.loads(cached(*key)) == json.loads(cached.build(*key).to_json()), name
+        built_ns  = ns_per_send(lambda i: send(1, "hi", reply_markup=cached.build(*key)), args.rounds)
+        cached_ns = ns_per_send(lambda i: send(1, "hi", reply_markup=cached(*key)), args.rounds)
+        results[name] = {"built_ns": round(built_ns), "cached_ns": round(cached_ns),
+                         "speedup": round(built_ns / cached_ns, 2)}
+
+    assert legacy_manual_payment(42) == bot.manual_payment_screen(42)
+    back = bot.topup_back_kb
+    built_ns  = ns_per_send(lambda i: send(1, legacy_manual_payment(i), parse_mode="HTML",
+                                           reply_markup=back.build()), args.rounds)
+    cached_ns = ns_per_send(lambda i: send(1, bot.manual_payment_screen(i), parse_mode="HTML",
+                                           reply_markup=back()), args.rounds)
+    results["manual_payment_screen"] = {"built_ns": round(built_ns), "cached_ns": round(cached_ns),
+                                        "speedup": round(built_ns / cached_ns, 2)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
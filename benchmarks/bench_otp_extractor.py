@@ -0,0 +1,69 @@
+"""
+Accuracy + throughput of otp_extractor on a corpus of 777000 messages.
+
+benchmarks/data/otp_corpus.json holds localized login-code messages and
+messages that must NOT yield a code (login alerts, notices). Reports the
+accuracy of otp_extractor.extract_otp next to the legacy first-run regex,
+and the per-message parse time of both (whole corpus, and login-code
+messages only — the path every delivered OTP takes).
+
+    python benchmarks/bench_otp_extractor.py --rounds 2000
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+import common
+import otp_extractor
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "otp_corpus.json")
+
+
+def legacy_extract(text: str):
+    match = re.search(r'(\d{5,6})', text)
+    return match.group(1) if match else None
+
+
+def extractor(text: str):
+    match = otp_extractor.extract_otp(text)
+    return match.code if match else None
+
+
+def accuracy(fn, corpus: list) -> dict:
+    wrong = [c["text"][:60] for c in corpus if fn(c["text"]) != c["code"]]
+    return {"correct": len(corpus) - len(wrong), "total": len(corpus), "wrong": wrong}
+
+
+def throughput(fn, corpus: list, rounds: int) -> float:
+    texts = [c["text"] for c in corpus]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - start) / (rounds * len(texts)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    codes   = [c for c in corpus if c["code"]]
+    results = {}
+    for name, fn in (("legacy_regex", legacy_extract), ("otp_extractor", extractor)):
+        results[name] = {
+            **accuracy(fn, corpus),
+            "ns_per_message": round(throughput(fn, corpus, args.rounds), 1),
+            "ns_per_login_code": round(throughput(fn, codes, args.rounds), 1),
+        }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Dispatch cost of router.Router vs telebot's linear handler chain.
+
+For menus of growing size, registers N text labels, N callback prefixes and
+N states both ways:
+- chain  — `message_handler(func=lambda m: m.text and "X" in m.text)` /
+           `callback_query_handler(func=lambda c: c.data.startswith(...))`
+           checked in order by telebot's own filter test, then a catch-all
+           running an if/elif state chain
+- router — Router dict / prefix trie / state table
+
+and times the lookup (not the handler) for the last menu label, the last
+callback prefix, and a state message that falls through every label.
+
+    python benchmarks/bench_router.py --sizes 15 100 1000
+"""
+
+import argparse
+import json
+import time
+
+import common
+import telebot
+from telebot import types
+from router import Router
+
+
+def message(text: str) -> types.Message:
+    return types.Message.de_json({
+        "message_id": 1, "date": 0, "text": text,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+    })
+
+
+def callback(data: str) -> types.CallbackQuery:
+    return types.CallbackQuery.de_json({
+        "id": "1", "chat_instance": "1", "data": data,
+        "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+    })
+
+
+def build_chain(n: int, states: dict):
+    bot = telebot.TeleBot("1:bench", threaded=False)
+
+    def noop(*_):
+        pass
+
+    for i in range(n):
+        bot.register_message_handler(noop, func=lambda m, label=f"Item #{i}.": m.text and label in m.text)
+        bot.register_callback_query_handler(noop, func=lambda c, p=f"cb{i}_": c.data.startswith(p))
+
+    def handle_text(m):
+        state = states.get(m.from_user.id)
+        for i in range(n):
+            if state == f"state{i}":
+                return i
+
+    bot.register_message_handler(handle_text, func=lambda m: True)
+
+    def dispatch(handlers, update):
+        for handler in handlers:
+            if bot._test_message_handler(handler, update):
+                return handler["function"](update)
+
+    return (
+        lambda m: dispatch(bot.message_handlers, m),
+        lambda c: dispatch(bot.callback_query_handlers, c),
+    )
+
+
+def build_router(n: int, states: dict):
+    router = Router(states.get, is_admin=lambda uid: True)
+    for i in range(n):
+        router.text(f"📦 Item #{i}.")(lambda m: None)
+        router.callback(prefix=f"cb{i}_")(lambda c: None)
+        router.state(f"state{i}")(lambda m, uid, text: None)
+    return router.resolve_message, lambda c: router.callbacks.match(c.data)
+
+
+def ns_per_call(fn, update, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(update)
+    return (time.perf_counter() - start) / rounds * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[15, 100, 1000])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {}
+    for n in args.sizes:
+        states = {1: f"state{n - 1}"}
+        cases  = {
+            "menu_text": message(f"📦 Item #{n - 1}."),
+            "callback": callback(f"cb{n - 1}_42"),
+            "state_text": message("0.25"),
+        }
+        chain_msg, chain_cb   = build_chain(n, states)
+        router_msg, router_cb = build_router(n, states)
+        row = {}
+        for name, update in cases.items():
+            chain, routed = (chain_cb, router_cb) if name == "callback" else (chain_msg, router_msg)
+            row[name] = {
+                "chain_ns": round(ns_per_call(chain, update, args.rounds)),
+                "router_ns": round(ns_per_call(routed, update, args.rounds)),
+            }
+        results[n] = row
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
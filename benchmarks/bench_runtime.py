@@ -0,0 +1,118 @@
+"""
+Handler latency and thread count: RUNTIME "threads" vs "asyncio".
+
+Feeds --updates synthetic messages from --users users into a
+threaded=False TeleBot whose handler does --handler-ms of blocking work
+(standing in for a SQLite read + Bot API call), through
+- threads — update_workers.UpdateWorkers plus a separate event loop
+            thread, as bot.py runs with RUNTIME = "threads"
+- asyncio — async_runtime.AsyncRuntime on one event loop with a pool of
+            the same number of handler threads
+
+Reports end-to-end latency (submit → handler finished), updates/s, and
+threading.active_count() while the load is running.
+
+    python benchmarks/bench_runtime.py --users 200 --updates 5000 --handler-ms 2
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import common
+import telebot
+from telebot import types
+
+import async_runtime
+import update_workers
+
+
+def make_updates(offset: int, n: int, users: int) -> list:
+    """update_id offset+1 … offset+n; each message's text is its submit timestamp."""
+    return [types.Update.de_json({
+        "update_id": i + 1,
+        "message": {
+            "message_id": i + 1, "date": 0, "text": str(time.perf_counter()),
+            "chat": {"id": 1000 + i % users, "type": "private"},
+            "from": {"id": 1000 + i % users, "is_bot": False, "first_name": "bench"},
+        },
+    }) for i in range(offset, offset + n)]
+
+
+def make_bot(handler_s: float, latencies: list, done: threading.Event, total: int):
+    bot = telebot.TeleBot("1:bench", threaded=False)
+    lock = threading.Lock()
+
+    @bot.message_handler(func=lambda m: True)
+    def handler(message):
+        time.sleep(handler_s)
+        with lock:
+            latencies.append(time.perf_counter() - float(message.text))
+            if len(latencies) == total:
+                done.set()
+
+    return bot
+
+
+def run_threads(args) -> dict:
+    latencies, done = [], threading.Event()
+    bot = make_bot(args.handler_ms / 1000, latencies, done, args.updates)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    workers = update_workers.UpdateWorkers(bot, args.workers).start().install()
+    threads = threading.active_count()
+    start = time.perf_counter()
+    for i in range(0, args.updates, 100):
+        bot.process_new_updates(make_updates(i, min(100, args.updates - i), args.users))
+    done.wait()
+    elapsed = time.perf_counter() - start
+    workers.stop(1)
+    loop.call_soon_threadsafe(loop.stop)
+    return result(latencies, elapsed, threads)
+
+
+def run_asyncio(args) -> dict:
+    latencies, done = [], threading.Event()
+    bot = make_bot(args.handler_ms / 1000, latencies, done, args.updates)
+    loop = asyncio.new_event_loop()
+    runtime = async_runtime.AsyncRuntime(bot, loop, args.workers)
+    threads = []
+
+    async def feed():
+        for i in range(0, args.updates, 100):
+            await runtime.dispatch(make_updates(i, min(100, args.updates - i), args.users))
+            threads.append(threading.active_count())
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+
+    start = time.perf_counter()
+    loop.run_until_complete(feed())
+    elapsed = time.perf_counter() - start
+    runtime.stop()
+    loop.close()
+    return result(latencies, elapsed, max(threads))
+
+
+def result(latencies: list, elapsed: float, threads: int) -> dict:
+    return {
+        "latency_ms": common.summarize(latencies),
+        "updates_per_s": round(len(latencies) / elapsed),
+        "threads": threads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--handler-ms", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    print(json.dumps({"threads": run_threads(args), "asyncio": run_asyncio(args)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
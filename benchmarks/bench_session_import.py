@@ -0,0 +1,59 @@
+"""
+Bulk session import throughput on top of fake_telethon.
+
+Writes a StringSession list (plus some garbage and duplicate lines),
+imports it twice through session_import.import_files and reports
+sessions per second and the imported / duplicate / invalid counts.
+
+    python benchmarks/bench_session_import.py --sessions 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import common
+import session_import
+import session_manager
+from fake_telethon import FakeTelegram, fake_session_string
+
+
+def write_list(path: str, sessions: int):
+    with open(path, "w") as f:
+        for i in range(sessions):
+            f.write(fake_session_string(f"+1777{i:07d}") + "\n")
+            if i % 100 == 0:
+                f.write("not-a-session\n")
+                f.write(fake_session_string(f"+1777{i:07d}") + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--rpc-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = FakeTelegram(connect_latency=args.rpc_latency, rpc_latency=args.rpc_latency, otp_delay=None)
+    session_manager.client_factory = server.client_factory
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, common.temp_database():
+        path = os.path.join(tmp, "sessions.txt")
+        write_list(path, args.sessions)
+        for run in ("first", "reimport"):
+            started = time.perf_counter()
+            report  = asyncio.run(session_import.import_files([(path, "sessions.txt")]))
+            elapsed = time.perf_counter() - started
+            results[run] = {
+                **report,
+                "elapsed_s": round(elapsed, 3),
+                "sessions_per_s": round(args.sessions / elapsed, 1),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Load test for session_manager on top of fake_telethon.
+
+Runs thousands of concurrent simulated purchases (start_otp_listener) plus a
+batch of admin logins (send_otp → verify_otp → verify_2fa) against the fake
+Telegram backend and reports:
+- OTP-arrival → buyer-delivery latency percentiles
+- memory per live listener (tracemalloc)
+- event-loop lag while everything runs
+- per-step latency of the admin flow
+
+    python benchmarks/bench_session_manager.py --buyers 2000 --admins 200
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import tracemalloc
+
+import common
+import database as db
+import session_manager
+from fake_telethon import FakeTelegram, fake_session_string
+
+
+class FakeBot:
+    """Records every Bot API send made by the listeners (called from executor threads)."""
+
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.otp_at  = {}
+        self.sent    = 0
+
+    def send_message(self, chat_id, text, **kwargs):
+        now = time.perf_counter()
+        with self.lock:
+            self.sent += 1
+            if "OTP Code" in text and chat_id not in self.otp_at:
+                self.otp_at[chat_id] = now
+
+
+def seed_purchases(buyers: int) -> list:
+    """Create users with balance + accounts and reserve one account per buyer."""
+    con = db._con()
+    con.executemany(
+        "INSERT INTO users (telegram_id, username, balance_ton, joined_at) VALUES (?, ?, 100.0, '')",
+        [(100_000 + i, f"buyer{i}") for i in range(buyers)]
+    )
+    con.executemany(
+        "INSERT INTO accounts (phone, password_2fa, session_string, status, added_at) VALUES (?, ?, ?, 'available', '')",
+        [(f"+1555{i:07d}", "pw" if i % 3 == 0 else "", fake_session_string(f"+1555{i:07d}")) for i in range(buyers)]
+    )
+    con.commit()
+    con.close()
+    return [(100_000 + i, db.reserve_account(100_000 + i)) for i in range(buyers)]
+
+
+async def sample_loop_lag(stop: asyncio.Event, lags: list, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - start - interval))
+
+
+async def sample_memory(stop: asyncio.Event, server: FakeTelegram, base: int, out: dict):
+    while not stop.is_set():
+        live = server.live_client_count()
+        if live > out["peak_listeners"]:
+            out["peak_listeners"] = live
+            out["bytes_at_peak"] = tracemalloc.get_traced_memory()[0] - base
+        await asyncio.sleep(0.05)
+
+
+async def run_buyers(args, server: FakeTelegram) -> dict:
+    purchases = seed_purchases(args.buyers)
+    bot       = FakeBot()
+    lags      = []
+    mem       = {"peak_listeners": 0, "bytes_at_peak": 0}
+    stop      = asyncio.Event()
+
+    tracemalloc.start()
+    base    = tracemalloc.get_traced_memory()[0]
+    samplers = [
+        asyncio.ensure_future(sample_loop_lag(stop, lags)),
+        asyncio.ensure_future(sample_memory(stop, server, base, mem)),
+    ]
+
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        session_manager.start_otp_listener(
+            bot, buyer_id, acc["phone"], acc["session_string"], acc["password_2fa"]
+        )
+        for buyer_id, acc in purchases
+    ])
+    elapsed = time.perf_counter() - started
+    # Let finalize / balance / review sends drain before the temp DB goes away
+    await asyncio.get_running_loop().run_in_executor(None, session_manager._followup_executor.shutdown)
+
+    stop.set()
+    await asyncio.gather(*samplers)
+    tracemalloc.stop()
+
+    latencies = [
+        bot.otp_at[buyer_id] - server.pushed_at[acc["session_string"]]
+        for buyer_id, acc in purchases
+        if buyer_id in bot.otp_at and acc["session_string"] in server.pushed_at
+    ]
+    listeners = mem["peak_listeners"] or 1
+    return {
+        "buyers": args.buyers,
+        "delivered": len(bot.otp_at),
+        "elapsed_s": round(elapsed, 3),
+        "otp_to_buyer_ms": common.summarize(latencies),
+        "peak_listeners": mem["peak_listeners"],
+        "kib_per_listener": round(mem["bytes_at_peak"] / listeners / 1024, 2),
+        "loop_lag_ms": common.summarize(lags),
+        "bot_sends": bot.sent,
+        "delivery_histogram": session_manager.delivery_stats()["latency"],
+    }
+
+
+async def run_admins(args, server: FakeTelegram) -> dict:
+    timings = {"send_otp": [], "verify_otp": [], "verify_2fa": []}
+    failures = {"send_otp": 0, "verify_otp": 0, "verify_2fa": 0}
+
+    async def one(i):
+        admin_id = 900_000 + i
+        phone    = f"+1666{i:07d}"
+
+        t = time.perf_counter()
+        ok, _ = await session_manager.send_otp(admin_id, phone)
+        timings["send_otp"].append(time.perf_counter() - t)
+        if not ok:
+            failures["send_otp"] += 1
+            return
+
+        t = time.perf_counter()
+        needs_2fa, ok, _ = await session_manager.verify_otp(admin_id, server.codes[phone])
+        timings["verify_otp"].append(time.perf_counter() - t)
+        if not ok:
+            failures["verify_otp"] += 1
+            return
+
+        if needs_2fa:
+            t = time.perf_counter()
+            ok, _ = await session_manager.verify_2fa(admin_id, server.passwords[phone])
+            timings["verify_2fa"].append(time.perf_counter() - t)
+            if not ok:
+                failures["verify_2fa"] += 1
+
+    for i in range(0, args.admins, 2):
+        server.passwords[f"+1666{i:07d}"] = "secret"
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(args.admins)])
+    return {
+        "logins": args.admins,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "failures": failures,
+        **{f"{step}_ms": common.summarize(v) for step, v in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=2000)
+    parser.add_argument("--admins", type=int, default=200)
+    parser.add_argument("--connect-latency", type=float, default=0.05)
+    parser.add_argument("--rpc-latency", type=float, default=0.02)
+    parser.add_argument("--otp-delay", type=float, default=2.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = FakeTelegram(
+        connect_latency=args.connect_latency,
+        rpc_latency=args.rpc_latency,
+        otp_delay=args.otp_delay,
+        flood_wait_rate=args.flood_rate,
+        seed=args.seed,
+    )
+    session_manager.client_factory = server.client_factory
+
+    with common.temp_database():
+        results = {
+            "buyers": asyncio.run(run_buyers(args, server)),
+            "admins": asyncio.run(run_admins(args, server)),
+            "fake_server": server.stats,
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Memory per extra shop when one process hosts several (shops.py).
+
+Starts bot.py's shared parts the way `python bot.py` does (DB, outbound
+dispatcher, state persistence, Telethon loop thread, update workers) for
+the first shop, then adds --shops more, each with its own temp DB, state
+store and getUpdates poller against fake_bot_api.FakeBotAPI. The TON
+monitor is left out (it would poll the real TonCenter).
+
+Reports the process RSS after the first shop (what every shop cost when
+each ran as its own process) and the RSS added per extra shop.
+
+    python benchmarks/bench_shops.py --shops 20
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+
+import common
+from telebot import apihelper
+
+import bot
+import database as db
+import outbound
+import shops
+from fake_bot_api import FakeBotAPI
+
+
+def rss_kb() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def start_shop(shop, tmp: str):
+    shop.db_path = os.path.join(tmp, f"{shop.name}.db")
+    shop.run(db.init_db)
+    outbound.dispatcher.install(shop.bot)
+    shop.run(shop.states.start_persistence)
+    shop.bot.process_new_updates = lambda updates, shop=shop: bot.workers.submit(updates, process=shop.process)
+    threading.Thread(target=shop.run, args=(shop.bot.infinity_polling,),
+                     kwargs={"timeout": 5, "long_polling_timeout": 1}, daemon=True).start()
+
+
+def settle() -> int:
+    time.sleep(1.5)
+    gc.collect()
+    return rss_kb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shops", type=int, default=20, help="shops added after the first")
+    args = parser.parse_args()
+
+    fake = FakeBotAPI().start()
+    apihelper.API_URL = fake.api_url
+    with tempfile.TemporaryDirectory() as tmp:
+        before = rss_kb()
+        threading.Thread(target=bot.run_telethon_loop, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), bot.telethon_loop).result()
+        bot.workers.start()
+        start_shop(shops.get(), tmp)
+        first = settle()
+
+        for i in range(args.shops):
+            shop = shops.add(f"shop{i}", f"{1000 + i}:bench", f"WALLET{i}")
+            shop.states = bot.new_states()
+            start_shop(shop, tmp)
+        last = settle()
+        threads = threading.active_count()
+        for shop in shops.all():
+            shop.bot.stop_polling()
+            shop.states.stop()
+        fake.stop()
+
+    per_shop = (last - first) / args.shops
+    print(json.dumps({
+        "shops": args.shops + 1,
+        "imports_kb": before,
+        "one_shop_process_kb": first,
+        "per_extra_shop_kb": round(per_shop, 1),
+        "extra_shop_vs_process": round(per_shop / first, 4),
+        "threads": threads,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
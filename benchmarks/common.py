@@ -0,0 +1,49 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Importing this module puts the repo root on sys.path, so benchmarks can
+`import database`, `import bot`, ... when run as `python benchmarks/<name>.py`.
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted sequence (0.0 if empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(values, scale: float = 1000.0) -> dict:
+    """p50/p90/p99/max of a list of seconds, reported in ms by default."""
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50) * scale, 3),
+        "p90": round(percentile(values, 90) * scale, 3),
+        "p99": round(percentile(values, 99) * scale, 3),
+        "max": round(max(values) * scale, 3) if values else 0.0,
+    }
+
+
+@contextmanager
+def temp_database():
+    """Point database.DB_PATH at a fresh temp file for the duration of a benchmark."""
+    import database as db
+    old_path = db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        try:
+            yield db.DB_PATH
+        finally:
+            db.DB_PATH = old_path
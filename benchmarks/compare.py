@@ -0,0 +1,70 @@
+"""
+Compare two suite.py result files and flag regressions.
+
+For every benchmark present in both runs, compares p50_us (lower is
+better) or, for throughput results, ops_per_s (higher is better). A change
+worse than --threshold (default 15%) is a regression; the exit status is
+1 if there is any, so CI can fail on it.
+
+    python benchmarks/compare.py before.json after.json --threshold 0.15
+"""
+
+import argparse
+import json
+import sys
+
+
+def metric(result: dict):
+    """(value, higher_is_better) for one benchmark result."""
+    if "ops_per_s" in result:
+        return result["ops_per_s"], True
+    return result["p50_us"], False
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    """Rows of (name, old, new, change, verdict); change > 0 means slower."""
+    rows = []
+    for name in sorted(old.keys() & new.keys()):
+        (a, higher_better), (b, _) = metric(old[name]), metric(new[name])
+        if not a or not b:
+            continue
+        change = (a / b - 1) if higher_better else (b / a - 1)
+        verdict = "REGRESSION" if change > threshold else "faster" if change < -threshold else ""
+        rows.append((name, a, b, change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    parser.add_argument("--all", action="store_true", help="also list benchmarks within the threshold")
+    args = parser.parse_args()
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{old['meta']['revision']} → {new['meta']['revision']} (threshold {args.threshold:.0%})")
+    rows = compare(old["results"], new["results"], args.threshold)
+    width = max((len(r[0]) for r in rows), default=10)
+    for name, a, b, change, verdict in rows:
+        if verdict or args.all:
+            print(f"{name:<{width}}  {a:>12,.3f}  {b:>12,.3f}  {change:>+8.1%}  {verdict}")
+
+    only_old = sorted(old["results"].keys() - new["results"].keys())
+    only_new = sorted(new["results"].keys() - old["results"].keys())
+    for label, names in (("missing in new run", only_old), ("new benchmarks", only_new)):
+        if names:
+            listed = ", ".join(names[:10]) + (f" … (+{len(names) - 10})" if len(names) > 10 else "")
+            print(f"{label}: {listed}")
+
+    regressions = [r for r in rows if r[4] == "REGRESSION"]
+    print(f"{len(rows)} compared, {len(regressions)} regression(s)")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
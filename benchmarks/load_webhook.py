@@ -0,0 +1,105 @@
+"""
+Load test of webhook_server: POSTs synthetic updates to a local endpoint.
+
+Starts a WebhookServer on a free local port feeding a threaded=False
+TeleBot through update_workers (handlers do --handler-ms of fake work),
+then fires --updates messages from --clients keep-alive connections.
+Reports ack latency (time to the 200), acks/s, and end-to-end updates/s
+until every update has been handled.
+
+    python benchmarks/load_webhook.py --clients 16 --updates 20000
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+
+import common
+import telebot
+import update_workers
+import webhook_server
+
+PATH   = "/telegram/webhook"
+SECRET = "bench-secret"
+
+
+def update_body(update_id: int, users: int) -> bytes:
+    uid = 1000 + update_id % users
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": "👤 My Profile",
+            "chat": {"id": uid, "type": "private"},
+            "from": {"id": uid, "is_bot": False, "first_name": "load"},
+        },
+    }).encode()
+
+
+def client(port: int, ids: range, users: int, latencies: list, errors: list):
+    conn    = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {"Content-Type": "application/json", webhook_server.SECRET_HEADER: SECRET}
+    for update_id in ids:
+        start = time.perf_counter()
+        conn.request("POST", PATH, body=update_body(update_id, users), headers=headers)
+        resp = conn.getresponse()
+        resp.read()
+        latencies.append(time.perf_counter() - start)
+        if resp.status != 200:
+            errors.append(resp.status)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--handler-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    bot = telebot.TeleBot("1:bench", threaded=False)
+
+    @bot.message_handler(func=lambda m: True)
+    def handle(message):
+        time.sleep(args.handler_ms / 1000)
+
+    workers = update_workers.UpdateWorkers(bot, args.workers, queue_size=args.updates).start().install()
+    server  = webhook_server.WebhookServer(bot, "127.0.0.1", 0, PATH, SECRET, queue_size=args.updates).start()
+
+    latencies, errors = [], []
+    per_client = args.updates // args.clients
+    threads = [
+        threading.Thread(target=client, args=(server.port, range(i * per_client + 1, (i + 1) * per_client + 1),
+                                              args.users, latencies, errors))
+        for i in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    acked = time.perf_counter() - start
+
+    total = per_client * args.clients
+    while workers.stats()["handled"] < total - len(errors):
+        time.sleep(0.01)
+    handled = time.perf_counter() - start
+    server.stop()
+    workers.stop()
+
+    print(json.dumps({
+        "updates": total,
+        "errors": len(errors),
+        "ack_latency_ms": common.summarize(latencies),
+        "acks_per_s": round(total / acked),
+        "handled_per_s": round(total / handled),
+        "server": server.stats(),
+        "workers": {k: v for k, v in workers.stats().items() if k in ("handled", "failed", "max_depth")},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
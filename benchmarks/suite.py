@@ -0,0 +1,334 @@
+"""
+Offline micro-benchmark suite for the hot paths, one JSON file per run.
+
+Groups (--only to pick some):
+- build       bot.build() on the message templates the handlers send
+- db          every database.py read and write, on tables seeded to each
+              --sizes row count (default 1k / 100k / 1M users, accounts and
+              transactions)
+- contention  reserve_account → finalize_purchase from --threads threads at
+              once: throughput, p99, lock errors and accounts handed to two
+              buyers
+- ton         ton_monitor.extract_memo / get_amount_ton / process_transaction
+              on recorded TonCenter payloads (data/ton_transactions.json)
+- otp         otp_extractor.extract_otp on data/otp_corpus.json, plus
+              building the OTP message
+
+Each result is {"runs", "mean_us", "p50_us", "p99_us"} (contention:
+{"ops_per_s", "p99_ms", ...}). Compare two runs with compare.py:
+
+    python benchmarks/suite.py --out before.json
+    ... change code ...
+    python benchmarks/suite.py --out after.json
+    python benchmarks/compare.py before.json after.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import threading
+import time
+
+import common
+import database as db
+import otp_extractor
+import session_manager
+import ton_monitor
+from bench_build import TEMPLATES, fields
+from emoji_engine import build    # what bot.build is
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def measure(fn, budget: float, min_runs: int = 5, max_runs: int = 200_000) -> dict:
+    """Call fn repeatedly for ~budget seconds; per-call latency stats in µs."""
+    times = []
+    deadline = time.perf_counter() + budget
+    while len(times) < min_runs or (time.perf_counter() < deadline and len(times) < max_runs):
+        start = time.perf_counter_ns()
+        fn()
+        times.append(time.perf_counter_ns() - start)
+    times.sort()
+    return {
+        "runs": len(times),
+        "mean_us": round(sum(times) / len(times) / 1000, 3),
+        "p50_us": round(times[len(times) // 2] / 1000, 3),
+        "p99_us": round(times[min(len(times) - 1, int(len(times) * 0.99))] / 1000, 3),
+    }
+
+
+# ── build ────────────────────────────────────────────
+
+def bench_build(args) -> dict:
+    results = {}
+    for name, template in TEMPLATES.items():
+        counter = itertools.count()
+        # Fresh values every call, like real sends (the formatted text is never the same twice)
+        results[f"build/{name}"] = measure(lambda: build(template.format(**fields(next(counter)))), args.budget)
+    return results
+
+
+# ── db ───────────────────────────────────────────────
+
+def seed(n: int):
+    """n users, n accounts (80% sold), n transactions, n/10 reviews."""
+    con = sqlite3.connect(db.DB_PATH)
+    con.executemany(
+        "INSERT INTO users (telegram_id, username, balance_ton, joined_at) VALUES (?, ?, ?, '2025-01-01 00:00')",
+        ((1_000_000 + i, f"user{i}", 10.0) for i in range(n)))
+    con.executemany(
+        "INSERT INTO accounts (phone, password_2fa, session_string, status, added_at, sold_at, buyer_id) "
+        "VALUES (?, '', ?, ?, '2025-01-01 00:00', ?, ?)",
+        ((f"+1{i:010d}", "s" * 350,
+          "sold" if i % 5 else "available",
+          "2025-01-02 00:00" if i % 5 else None,
+          1_000_000 + (i * 7) % n if i % 5 else None) for i in range(n)))
+    con.executemany(
+        "INSERT INTO transactions (user_id, amount_ton, tx_hash, type, created_at) VALUES (?, ?, ?, ?, '2025-01-01')",
+        ((1_000_000 + i % n, 1.0, f"seed{i}", "deposit" if i % 3 else "purchase") for i in range(n)))
+    con.executemany(
+        "INSERT INTO reviews (user_id, username, rating, review_text, rewarded, created_at) VALUES (?, ?, 5, 'ok', 1, '')",
+        ((1_000_000 + i, f"user{i}") for i in range(0, n, 10)))
+    con.commit()
+    con.close()
+
+
+def db_cases(n: int) -> dict:
+    """name → (callable, bulk). Bulk cases read whole tables and run only a few times."""
+    rng  = random.Random(n)
+    uid  = lambda: 1_000_000 + rng.randrange(n)
+    seq  = itertools.count()
+    job  = db.create_broadcast(1, "bench", "[]", n)
+    db.claim_broadcast(job, "bench", float("inf"), time.time())
+
+    def reserve_cancel():
+        buyer = 50_000_000 + next(seq)
+        db.reserve_account(buyer)
+        db.cancel_purchase(buyer)
+
+    def reserve_finalize():
+        buyer = 1_000_000 + next(seq) % n
+        if db.reserve_account(buyer):
+            db.finalize_purchase(buyer)
+
+    def save_and_delete():
+        i = next(seq)
+        db.save_account(f"+9{i:010d}", "", "s")
+        db.delete_account(db.get_account_by_phone(f"+9{i:010d}")["id"])
+
+    return {
+        # reads
+        "get_balance":                (lambda: db.get_balance(uid()), False),
+        "get_user_by_id":             (lambda: db.get_user_by_id(uid()), False),
+        "get_user_purchase_count":    (lambda: db.get_user_purchase_count(uid()), False),
+        "get_user_purchases":         (lambda: db.get_user_purchases(uid()), False),
+        "get_user_count":             (db.get_user_count, False),
+        "has_active_purchase":        (lambda: db.has_active_purchase(uid()), False),
+        "get_reserved_account":       (lambda: db.get_reserved_account(uid()), False),
+        "get_available_count":        (db.get_available_count, False),
+        "get_sold_count":             (db.get_sold_count, False),
+        "peek_available_account":     (db.peek_available_account, False),
+        "get_account_by_phone_id":    (lambda: db.get_account_by_phone_id(rng.randrange(1, n)), False),
+        "get_account_by_phone":       (lambda: db.get_account_by_phone(f"+1{rng.randrange(n):010d}"), False),
+        "get_total_revenue":          (db.get_total_revenue, False),
+        "get_price_ton":              (db.get_price_ton, False),
+        "has_reviewed":               (lambda: db.has_reviewed(uid()), False),
+        "count_broadcast_recipients": (db.count_broadcast_recipients, False),
+        "get_broadcast_recipients":   (lambda: db.get_broadcast_recipients(uid(), 200), False),
+        "get_broadcast":              (lambda: db.get_broadcast(job), False),
+        "get_running_broadcasts":     (db.get_running_broadcasts, False),
+        "load_user_states":           (lambda: db.load_user_states(time.time()), False),
+        "get_all_users":              (db.get_all_users, True),
+        "get_available_accounts":     (db.get_available_accounts, True),
+        "get_all_reviews":            (db.get_all_reviews, True),
+        # writes
+        "add_user":                   (lambda: db.add_user(60_000_000 + next(seq), "new"), False),
+        "add_balance":                (lambda: db.add_balance(uid(), 0.1), False),
+        "set_price_ton":              (lambda: db.set_price_ton(0.1), False),
+        "record_transaction":         (lambda: db.record_transaction(uid(), 1.0, f"bench{next(seq)}"), False),
+        "save_accounts_100":          (lambda: db.save_accounts(
+                                          [(f"+8{next(seq):010d}", "", "s") for _ in range(100)]), False),
+        "save_and_delete_account":    (save_and_delete, False),
+        "reserve_cancel":             (reserve_cancel, False),
+        "reserve_finalize":           (reserve_finalize, False),
+        "save_review":                (lambda: db.save_review(70_000_000 + next(seq), "u", 5, "ok"), False),
+        "mark_review_rewarded":       (lambda: db.mark_review_rewarded(uid()), False),
+        "save_user_states_10":        (lambda: db.save_user_states(
+                                          [(uid(), "topup_custom", None, time.time() + 60) for _ in range(10)], []), False),
+        "mark_users_blocked_10":      (lambda: db.mark_users_blocked([uid() for _ in range(10)]), False),
+        "create_broadcast":           (lambda: db.create_broadcast(1, "bench", "[]", n), False),
+        "update_broadcast":           (lambda: db.update_broadcast(job, sent=next(seq)), False),
+        "save_broadcast":             (lambda: db.save_broadcast(job, "bench", float("inf"), sent=next(seq)), False),
+    }
+
+
+def bench_db(args) -> dict:
+    results = {}
+    for n in args.sizes:
+        with common.temp_database():
+            started = time.perf_counter()
+            seed(n)
+            print(f"  seeded {n:,} rows in {time.perf_counter() - started:.1f}s", flush=True)
+            for name, (fn, bulk) in db_cases(n).items():
+                if bulk:
+                    results[f"db/{n}/{name}"] = measure(fn, args.budget, min_runs=1, max_runs=5)
+                else:
+                    results[f"db/{n}/{name}"] = measure(fn, args.budget)
+    return results
+
+
+# ── contention ───────────────────────────────────────
+
+def bench_contention(args) -> dict:
+    per_thread = args.contention_ops
+    with common.temp_database():
+        total = args.threads * per_thread
+        seed(1000)
+        db.save_accounts([(f"+7{i:010d}", "", "s") for i in range(total)])
+        handed = {}             # account id → buyers that got it
+        latencies, errors = [], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(args.threads)
+
+        def worker(t: int):
+            barrier.wait()
+            for i in range(per_thread):
+                buyer = 1_000_000 + (t * per_thread + i) % 1000
+                start = time.perf_counter()
+                try:
+                    account = db.reserve_account(buyer)
+                    if account:
+                        db.finalize_purchase(buyer)
+                except sqlite3.OperationalError as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    if account:
+                        handed.setdefault(account["id"], []).append(buyer)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(args.threads)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        summary = common.summarize(latencies)
+        return {"contention/reserve_finalize": {
+            "threads": args.threads,
+            "ops_per_s": round(len(latencies) / elapsed, 1),
+            "p50_ms": summary["p50"],
+            "p99_ms": summary["p99"],
+            "lock_errors": len(errors),
+            "double_reserved": sum(1 for buyers in handed.values() if len(buyers) > 1),
+        }}
+
+
+# ── ton ──────────────────────────────────────────────
+
+class _SilentBot:
+    def send_message(self, *args, **kwargs):
+        pass
+
+
+def bench_ton(args) -> dict:
+    with open(os.path.join(DATA, "ton_transactions.json"), encoding="utf-8") as f:
+        txs = json.load(f)
+    cycle = itertools.cycle(txs)
+    results = {
+        "ton/extract_memo": measure(lambda: ton_monitor.extract_memo(next(cycle)), args.budget),
+        "ton/get_amount_ton": measure(lambda: ton_monitor.get_amount_ton(next(cycle)), args.budget),
+    }
+    with common.temp_database():
+        seed(1000)
+        loop = asyncio.new_event_loop()
+        seq = itertools.count()
+        bot = _SilentBot()
+
+        def process():
+            tx = dict(next(cycle))
+            # A new hash each time, or record_transaction dedupes it away
+            tx["transaction_id"] = {"hash": f"bench{next(seq)}"}
+            loop.run_until_complete(ton_monitor.process_transaction(bot, tx))
+
+        results["ton/process_transaction"] = measure(process, args.budget)
+        loop.close()
+    return results
+
+
+# ── otp ──────────────────────────────────────────────
+
+def bench_otp(args) -> dict:
+    with open(os.path.join(DATA, "otp_corpus.json"), encoding="utf-8") as f:
+        corpus = json.load(f)
+    codes = itertools.cycle([c["text"] for c in corpus if c["code"]])
+    others = itertools.cycle([c["text"] for c in corpus if not c["code"]] or [""])
+    return {
+        "otp/extract_otp_code": measure(lambda: otp_extractor.extract_otp(next(codes)), args.budget),
+        "otp/extract_otp_other": measure(lambda: otp_extractor.extract_otp(next(others)), args.budget),
+        "otp/otp_message": measure(lambda: session_manager._otp_message("+15550001111", "48213", "pw"), args.budget),
+    }
+
+
+GROUPS = {
+    "build": bench_build,
+    "db": bench_db,
+    "contention": bench_contention,
+    "ton": bench_ton,
+    "otp": bench_otp,
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=common.ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(GROUPS), default=list(GROUPS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--budget", type=float, default=0.3, help="seconds per benchmark")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--contention-ops", type=int, default=200, help="purchases per thread")
+    parser.add_argument("--out", help="write results JSON here (default: stdout)")
+    args = parser.parse_args()
+
+    results = {}
+    for group in args.only:
+        print(f"{group}...", flush=True)
+        results.update(GROUPS[group](args))
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"wrote {len(results)} results to {args.out}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,121 +1,61 @@
 import logging
 import asyncio
+import functools
+import os
+import re
+import tempfile
 import threading
+import time
+from html import escape
+from concurrent.futures import ThreadPoolExecutor
 import telebot
 from telebot import types
-from telebot.types import MessageEntity
 import database as db
+import db_profiler
+import diagnostics
 import ton_monitor
+import broadcast
+import metrics
+import outbound
 import session_manager
-from config import BOT_TOKEN, ADMIN_ID, BOT_WALLET
+import async_db
+import session_import
+import state_store
+import update_workers
+import async_runtime
+import webhook_server
+import cluster
+import shops
+import archive
+import backup
+import exporter
+from router import Router
+from emoji_engine import build, render
+from markup_cache import frozen
+from config import (
+    ADMIN_ID, UPDATE_WORKERS, UPDATE_MODE, RUNTIME, STATE_TTL, STATE_MAX_ENTRIES,
+    METRICS_LISTEN, METRICS_PORT, DB_PROFILE, DB_SLOW_MS, LOOP_LAG_THRESHOLD_MS, TRACEMALLOC,
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    CLUSTER, WORKER_ID, CLUSTER_LEASE_TTL, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL,
+    BACKUP_INTERVAL,
+)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
-bot = telebot.TeleBot(BOT_TOKEN, parse_mode=None)
+# The current shop's TeleBot (see shops.py; one shop unless SHOPS is set).
+# threaded=False: handlers run on update_workers' per-user ordered threads
+# (or async_runtime's handler pool)
+bot = shops.Proxy("bot")
 
 # ─────────────────────── PREMIUM EMOJI ENGINE ─────────
-# Bots CAN send premium custom emojis using MessageEntity
-# with type="custom_emoji" — no HTML tags needed.
-# Each emoji occupies exactly 2 chars in the string (the
-# placeholder we put is the fallback Unicode char, 1 char,
-# but Telegram counts emoji as 2 UTF-16 code units).
-# We build messages as plain text + entity list.
-
-EMOJI_IDS = {
-    "👋": "6104922173015597346",   # wave
-    "👤": "6107017202228009498",   # profile
-    "⚠️": "6106898459267177284",   # warning
-    "🔒": "6106902616795519273",   # secure
-    "🤖": "6107323579425104140",   # bot
-    "🎁": "6107325885822540958",   # gift
-    "✅": "6106981506754814207",   # verified tick
-    "🏪": "6107212468621154692",   # shop
-    "💎": "6107289979895945232",   # fragment logo
-    "🪙": "6106898347598027963",   # toncoin
-    "💲": "6107061783988542265",   # dollar
-    "📈": "6104943961384688402",   # graph
-    "🏠": "6008258140108231117",   # main menu
-    "⏱": "5900104897885376843",    # timer/clock
-    "☑️": "5951665890079544884",    # verified check
-}
-
-def build(text: str):
-    """
-    Parse a string containing emoji placeholders marked with [E:char].
-    Returns (plain_text, entities_list) ready to pass to send_message.
-
-    Usage in message strings:
-        f"[E:👋] Welcome!\n[E:🪙] Price: {price} TON"
+# Messages are written with [E:x] emoji and **bold** markers — see
+# emoji_engine. Pass {field} values as keyword arguments to send()/edit()
+# so the template is parsed once and only the fields are measured.
 
-    Each [E:X] is replaced with the emoji char X in the final string,
-    and a custom_emoji MessageEntity is attached at that position.
-    """
-    import re
-    plain   = ""
-    entities = []
-    pattern  = re.compile(r'\[E:(.+?)\]')
-    cursor   = 0
-    bold_ranges = []
-
-    # First pass — resolve [E:x] markers and **bold** markers
-    # We support **text** for bold inline
-    i = 0
-    segments = pattern.split(text)
-    # pattern.split gives: [before, emoji_char, between, emoji_char, ...]
-    result_text = ""
-    result_entities = []
-
-    parts = pattern.split(text)
-    # parts alternates: plain_text, emoji_char, plain_text, emoji_char ...
-    pos = 0
-    idx = 0
-    while idx < len(parts):
-        segment = parts[idx]
-        if idx % 2 == 0:
-            # Plain text segment — handle **bold**
-            bold_pat = re.compile(r'\*\*(.+?)\*\*', re.DOTALL)
-            last = 0
-            for m in bold_pat.finditer(segment):
-                before = segment[last:m.start()]
-                result_text += before
-                pos += len(before.encode('utf-16-le')) // 2
-                bold_start = pos
-                inner = m.group(1)
-                result_text += inner
-                inner_len = len(inner.encode('utf-16-le')) // 2
-                result_entities.append(
-                    MessageEntity(type="bold", offset=bold_start, length=inner_len)
-                )
-                pos += inner_len
-                last = m.end()
-            tail = segment[last:]
-            result_text += tail
-            pos += len(tail.encode('utf-16-le')) // 2
-        else:
-            # Emoji char
-            emoji_char = segment
-            emoji_id   = EMOJI_IDS.get(emoji_char)
-            result_text += emoji_char
-            char_len = len(emoji_char.encode('utf-16-le')) // 2
-            if emoji_id:
-                result_entities.append(
-                    MessageEntity(
-                        type="custom_emoji",
-                        offset=pos,
-                        length=char_len,
-                        custom_emoji_id=emoji_id
-                    )
-                )
-            pos += char_len
-        idx += 1
-
-    return result_text, result_entities
-
-
-def send(chat_id, text, reply_markup=None):
-    """Send a message with premium emojis. Falls back to plain text if entities fail."""
-    plain, entities = build(text)
+def send(chat_id, text, reply_markup=None, **fields):
+    """Send a message with premium emojis. Falls back to plain text if the entities are rejected."""
+    plain, entities = render(text, **fields) if fields else build(text)
     try:
         bot.send_message(
             chat_id,
@@ -124,13 +64,15 @@ def send(chat_id, text, reply_markup=None):
             reply_markup=reply_markup
         )
     except Exception as e:
+        if not outbound.is_entity_error(e):
+            raise
         logger.warning(f"send() with entities failed ({e}), falling back to plain")
         bot.send_message(chat_id, plain, reply_markup=reply_markup)
 
 
-def edit(chat_id, message_id, text, reply_markup=None):
-    """Edit a message with premium emojis. Falls back to plain text if entities fail."""
-    plain, entities = build(text)
+def edit(chat_id, message_id, text, reply_markup=None, **fields):
+    """Edit a message with premium emojis. Falls back to plain text if the entities are rejected."""
+    plain, entities = render(text, **fields) if fields else build(text)
     try:
         bot.edit_message_text(
             plain,
@@ -140,50 +82,161 @@ def edit(chat_id, message_id, text, reply_markup=None):
             reply_markup=reply_markup
         )
     except Exception as e:
+        if not outbound.is_entity_error(e):
+            raise
         logger.warning(f"edit() with entities failed ({e}), falling back to plain")
         bot.edit_message_text(plain, chat_id, message_id, reply_markup=reply_markup)
 
 
 # ─────────────────────── STATE ────────────────────────
-user_states = {}
-state_data  = {}
+# Conversation state lives in a TTL + LRU bounded store (see state_store),
+# persisted to the DB so flows survive a restart. Login / batch / OTP
+# states hold live Telethon clients and are kept in memory only.
+# Each shop has its own store; `states` is the current shop's.
+def new_states():
+    return state_store.StateStore(
+        max_entries=STATE_MAX_ENTRIES,
+        default_ttl=STATE_TTL,
+        ttls={"awaiting_otp": 10 * 60, "writing_review": 24 * 60 * 60},
+        volatile=("enter_phone", "enter_otp", "enter_2fa", "batch_phones", "batch_codes", "awaiting_otp"),
+    )
+
+for _shop in shops.all():
+    _shop.states = new_states()
+states = shops.Proxy("states")
 
 def set_state(uid, state, data=None):
-    user_states[uid] = state
-    if data is not None:
-        state_data[uid] = data
+    states.set(uid, state, data)
 
-def get_state(uid):      return user_states.get(uid)
-def get_state_data(uid): return state_data.get(uid)
+def get_state(uid):      return states.get(uid)
+def get_state_data(uid): return states.get_data(uid)
 
 def clear_state(uid):
-    user_states.pop(uid, None)
-    state_data.pop(uid, None)
+    states.clear(uid)
+
+
+# Every text message and callback goes through one router (see router.py):
+# menu labels and callback prefixes are looked up, not filtered one by one.
+router = Router(get_state, is_admin=lambda uid: uid == ADMIN_ID)
 
 telethon_loop = asyncio.new_event_loop()
 
 def run_async(coro):
+    """Schedule coro on telethon_loop and return its Future without waiting for it.
+    Handlers must not block on the loop: in RUNTIME = "asyncio" it is the
+    loop that dispatches their updates."""
     future = asyncio.run_coroutine_threadsafe(coro, telethon_loop)
-    return future.result(timeout=60)
+    future.add_done_callback(_log_async_failure)
+    return future
+
+
+def _log_async_failure(future):
+    if not future.cancelled() and future.exception():
+        logger.warning(f"Background Telethon call failed: {future.exception()}")
+
+
+# Admin Telethon steps (send code, sign in, 2FA) run in the background so the
+# handler returns at once; the result reaches the admin through a callback.
+# One step per key at a time — the admin's uid, or (uid, phone) for the
+# phones of a batch: key → (step name, Future)
+ADMIN_OP_TIMEOUT = 60
+admin_ops = {}
+_admin_op_executor = ThreadPoolExecutor(2, thread_name_prefix="admin-op")
+
+
+def start_admin_op(uid: int, chat_id: int, name: str, coro, on_result, key=None) -> bool:
+    """
+    Schedule coro on telethon_loop and return immediately. on_result(*result)
+    (no arguments if it returned None) runs on a worker thread when it
+    finishes. False (and coro is discarded)
+    if a step with the same key (default: uid) is already running.
+    """
+    key = uid if key is None else key
+    if key in admin_ops:
+        coro.close()
+        return False
+    future = asyncio.run_coroutine_threadsafe(asyncio.wait_for(coro, ADMIN_OP_TIMEOUT), telethon_loop)
+    admin_ops[key] = (name, future)
+    # Done-callbacks fire on the loop thread; sending blocks, so hand off (in this shop)
+    finish = shops.bind(_finish_admin_op)
+    future.add_done_callback(lambda f: _admin_op_executor.submit(finish, uid, key, chat_id, name, f, on_result))
+    return True
+
+
+def _finish_admin_op(uid: int, key, chat_id: int, name: str, future, on_result):
+    if admin_ops.get(key, (None, None))[1] is future:
+        admin_ops.pop(key, None)
+    if future.cancelled():
+        return
+    # A failed step of a batch only concerns its phone; the rest of the batch goes on
+    in_batch = get_state(uid) in BATCH_STATES
+    try:
+        result = future.result()
+    except TimeoutError:
+        logger.warning(f"Admin step {name} for {uid} timed out after {ADMIN_OP_TIMEOUT}s")
+        if in_batch:
+            bot.send_message(chat_id, f"⏰ {name}: Telegram did not answer within {ADMIN_OP_TIMEOUT}s. Try again.")
+            return
+        run_async(session_manager.cancel_pending(uid))
+        clear_state(uid)
+        bot.send_message(chat_id, f"⏰ Telegram did not answer within {ADMIN_OP_TIMEOUT}s. Start again.",
+                         reply_markup=admin_menu())
+        return
+    except Exception as e:
+        logger.error(f"Admin step {name} for {uid} failed: {e}", exc_info=True)
+        if in_batch:
+            bot.send_message(chat_id, f"❌ {name}: {e}")
+            return
+        clear_state(uid)
+        bot.send_message(chat_id, f"❌ Error: {e}", reply_markup=admin_menu())
+        return
+    try:
+        on_result(*(result or ()))
+    except Exception as e:
+        logger.error(f"Admin step {name} result handling failed for {uid}: {e}", exc_info=True)
+
+
+def when_done(future, fn):
+    """Call fn(future) on the admin-op executor, in the caller's shop, once future is done.
+    Done-callbacks fire on the loop thread, where a blocking Bot API call would stall the loop."""
+    fn = shops.bind(fn)
+    future.add_done_callback(lambda f: _admin_op_executor.submit(fn, f))
+
+
+def cancel_admin_op(uid: int):
+    """Cancel the admin's running step and those of their batch phones."""
+    for key in [k for k in admin_ops if k == uid or (isinstance(k, tuple) and k[0] == uid)]:
+        op = admin_ops.pop(key, None)
+        if op is not None:
+            op[1].cancel()
 
 
 # ─────────────────────── KEYBOARDS ────────────────────
+# @frozen keyboards are built once and returned as ready-to-send JSON
+# (see markup_cache); keyboards with per-user data are built per call.
 
 def main_menu(user_id):
+    return _main_menu(user_id == ADMIN_ID)
+
+
+@frozen
+def _main_menu(is_admin: bool):
     m = types.ReplyKeyboardMarkup(resize_keyboard=True)
     m.row(types.KeyboardButton("💰 Add Balance"), types.KeyboardButton("🛒 Buy Account"))
     m.row(types.KeyboardButton("👤 My Profile"),  types.KeyboardButton("📋 My Purchases"))
-    if user_id == ADMIN_ID:
+    if is_admin:
         m.row(types.KeyboardButton("⚙️ Admin Panel"))
     return m
 
 
+@frozen
 def admin_menu():
     m = types.ReplyKeyboardMarkup(resize_keyboard=True)
     m.row(types.KeyboardButton("➕ Add Account"),  types.KeyboardButton("📦 Stock Info"))
     m.row(types.KeyboardButton("💵 Change Price"), types.KeyboardButton("👥 All Users"))
     m.row(types.KeyboardButton("📢 Broadcast"),    types.KeyboardButton("💳 Add User Balance"))
-    m.row(types.KeyboardButton("📋 Manage Stock"))
+    m.row(types.KeyboardButton("📋 Manage Stock"), types.KeyboardButton("📥 Batch Add"))
+    m.row(types.KeyboardButton("🗂 Import Sessions"))
     m.row(types.KeyboardButton("🔙 Back to Menu"))
     return m
 
@@ -223,6 +276,7 @@ def account_action_kb(account_id: int, page: int = 0):
     return m
 
 
+@frozen
 def price_quick_kb():
     m = types.InlineKeyboardMarkup(row_width=3)
     m.add(
@@ -234,13 +288,16 @@ def price_quick_kb():
     return m
 
 
-def confirm_purchase_kb(account_id):
+@frozen
+def confirm_purchase_kb():
+    # The buyer gets whichever account is reserved on confirm; the id is just the old callback format
     m = types.InlineKeyboardMarkup()
-    m.add(types.InlineKeyboardButton("✅ Confirm Purchase", callback_data=f"buy_{account_id}"))
+    m.add(types.InlineKeyboardButton("✅ Confirm Purchase", callback_data="buy_0"))
     m.add(types.InlineKeyboardButton("❌ Cancel",           callback_data="cancel_buy"))
     return m
 
 
+@frozen
 def cancel_otp_kb():
     m = types.InlineKeyboardMarkup()
     m.add(types.InlineKeyboardButton("❌ Cancel & Get Refund", callback_data="cancel_otp"))
@@ -263,7 +320,7 @@ def add_balance_amount_kb(price: float):
 def payment_method_kb(uid: int, amount_ton: float):
     """Show Tonkeeper deep link button + manual method info."""
     nano       = int(amount_ton * 1_000_000_000)
-    tk_link    = f"https://app.tonkeeper.com/transfer/{BOT_WALLET}?amount={nano}&text={uid}"
+    tk_link    = f"https://app.tonkeeper.com/transfer/{shops.get().wallet}?amount={nano}&text={uid}"
     m = types.InlineKeyboardMarkup()
     m.add(types.InlineKeyboardButton("💎 Pay with Tonkeeper", url=tk_link))
     m.add(types.InlineKeyboardButton("🔄 Choose Different Amount", callback_data="topup_back"))
@@ -272,25 +329,27 @@ def payment_method_kb(uid: int, amount_ton: float):
 
 # ─────────────────────── /START ───────────────────────
 
-@bot.message_handler(commands=["start"])
+@router.command("start")
 def cmd_start(message):
     uid   = message.from_user.id
     db.add_user(uid, message.from_user.username or "")
     name  = message.from_user.first_name or "User"
     price = db.get_price_ton()
     send(uid,
-        f"[E:👋] **Welcome, {name}!**\n\n"
-        f"[E:🏠] **Fragment Account Shop**\n"
-        f"[E:💎] Buy verified Telegram Fragment accounts instantly.\n\n"
-        f"[E:🪙] Price: **{price} TON** per account\n"
-        f"[E:☑️] Instant delivery after payment\n"
-        f"[E:🔒] Safe & automated",
-        reply_markup=main_menu(uid)
+        "[E:👋] **Welcome, {name}!**\n\n"
+        "[E:🏠] **Fragment Account Shop**\n"
+        "[E:💎] Buy verified Telegram Fragment accounts instantly.\n\n"
+        "[E:🪙] Price: **{price} TON** per account\n"
+        "[E:☑️] Instant delivery after payment\n"
+        "[E:🔒] Safe & automated",
+        reply_markup=main_menu(uid),
+        name=name, price=price
     )
 
 
 # ─────────────────────── ADD BALANCE ──────────────────
 
+@frozen
 def add_balance_choose_kb():
     """Two buttons — manual or Tonkeeper."""
     m = types.InlineKeyboardMarkup()
@@ -299,32 +358,66 @@ def add_balance_choose_kb():
     return m
 
 
+@frozen
+def topup_back_kb():
+    m = types.InlineKeyboardMarkup()
+    m.add(types.InlineKeyboardButton("🔙 Back", callback_data="topup_back"))
+    return m
+
+
+# Fully static screens, and the manual payment screen split around the uid
+ADD_BALANCE_SCREEN = (
+    "<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Add Balance</b>\n\n"
+    "Choose your preferred payment method:"
+)
+TONKEEPER_AMOUNT_SCREEN = (
+    "<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Tonkeeper Payment</b>\n\n"
+    "How much TON do you want to deposit?\n"
+    "Type the amount and send it. Example: <code>1.5</code>"
+)
+_MANUAL_PAYMENT_HEAD = (
+    "<tg-emoji emoji-id=\"6107289979895945232\">💎</tg-emoji> <b>Manual Payment</b>\n\n"
+    "Send any amount of TON to the address below.\n"
+    "<b>You must include your ID as memo</b> or it won\'t be credited.\n\n"
+    "<tg-emoji emoji-id=\"6107289979895945232\">💎</tg-emoji> <b>Wallet Address:</b>\n"
+    "<code>"
+)
+_MANUAL_PAYMENT_MEMO = (
+    "</code>\n\n"
+    "<tg-emoji emoji-id=\"6106902616795519273\">🔒</tg-emoji> <b>Memo / Comment:</b>\n"
+    "<code>"
+)
+_MANUAL_PAYMENT_TAIL = (
+    "</code>\n\n"
+    "<tg-emoji emoji-id=\"5900104897885376843\">⏱</tg-emoji> Credited automatically within ~1 minute.\n"
+    "<tg-emoji emoji-id=\"6106898459267177284\">⚠️</tg-emoji> Do not forget the memo!"
+)
+
+
+def manual_payment_screen(uid: int) -> str:
+    return _MANUAL_PAYMENT_HEAD + shops.get().wallet + _MANUAL_PAYMENT_MEMO + str(uid) + _MANUAL_PAYMENT_TAIL
+
+
 def tonkeeper_payment_kb(uid: int, amount_ton: float):
     """Tonkeeper deep link button + back."""
     nano    = int(amount_ton * 1_000_000_000)
-    tk_link = f"https://app.tonkeeper.com/transfer/{BOT_WALLET}?amount={nano}&text={uid}"
+    tk_link = f"https://app.tonkeeper.com/transfer/{shops.get().wallet}?amount={nano}&text={uid}"
     m = types.InlineKeyboardMarkup()
     m.add(types.InlineKeyboardButton("💎 Open Tonkeeper & Pay", url=tk_link))
     m.add(types.InlineKeyboardButton("🔙 Back",                 callback_data="topup_back"))
     return m
 
 
-@bot.message_handler(func=lambda m: m.text and "Add Balance" in m.text)
+@router.text("💰 Add Balance")
 def add_balance(message):
     uid = message.from_user.id
     db.add_user(uid, message.from_user.username or "")
-    bot.send_message(
-        uid,
-        f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Add Balance</b>\n\n"
-        f"Choose your preferred payment method:",
-        parse_mode="HTML",
-        reply_markup=add_balance_choose_kb()
-    )
+    bot.send_message(uid, ADD_BALANCE_SCREEN, parse_mode="HTML", reply_markup=add_balance_choose_kb())
 
 
 # ─────────────── TOPUP CALLBACKS ─────────────────────
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("topup_"))
+@router.callback(prefix="topup_")
 def topup_cb(call):
     uid = call.from_user.id
     val = call.data.split("_", 1)[1]
@@ -332,8 +425,7 @@ def topup_cb(call):
     # ── Back to method selection ───────────────────────
     if val == "back":
         bot.edit_message_text(
-            f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Add Balance</b>\n\n"
-            f"Choose your preferred payment method:",
+            ADD_BALANCE_SCREEN,
             call.message.chat.id, call.message.message_id,
             parse_mode="HTML", reply_markup=add_balance_choose_kb()
         )
@@ -343,20 +435,10 @@ def topup_cb(call):
     # ── Manual payment — show wallet + memo immediately ─
     if val == "manual":
         bot.edit_message_text(
-            f"<tg-emoji emoji-id=\"6107289979895945232\">💎</tg-emoji> <b>Manual Payment</b>\n\n"
-            f"Send any amount of TON to the address below.\n"
-            f"<b>You must include your ID as memo</b> or it won\'t be credited.\n\n"
-            f"<tg-emoji emoji-id=\"6107289979895945232\">💎</tg-emoji> <b>Wallet Address:</b>\n"
-            f"<code>{BOT_WALLET}</code>\n\n"
-            f"<tg-emoji emoji-id=\"6106902616795519273\">🔒</tg-emoji> <b>Memo / Comment:</b>\n"
-            f"<code>{uid}</code>\n\n"
-            f"<tg-emoji emoji-id=\"5900104897885376843\">⏱</tg-emoji> Credited automatically within ~1 minute.\n"
-            f"<tg-emoji emoji-id=\"6106898459267177284\">⚠️</tg-emoji> Do not forget the memo!",
+            manual_payment_screen(uid),
             call.message.chat.id, call.message.message_id,
             parse_mode="HTML",
-            reply_markup=types.InlineKeyboardMarkup().add(
-                types.InlineKeyboardButton("🔙 Back", callback_data="topup_back")
-            )
+            reply_markup=topup_back_kb()
         )
         bot.answer_callback_query(call.id)
         return
@@ -365,14 +447,10 @@ def topup_cb(call):
     if val == "tonkeeper":
         set_state(uid, "topup_custom")
         bot.edit_message_text(
-            f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Tonkeeper Payment</b>\n\n"
-            f"How much TON do you want to deposit?\n"
-            f"Type the amount and send it. Example: <code>1.5</code>",
+            TONKEEPER_AMOUNT_SCREEN,
             call.message.chat.id, call.message.message_id,
             parse_mode="HTML",
-            reply_markup=types.InlineKeyboardMarkup().add(
-                types.InlineKeyboardButton("🔙 Back", callback_data="topup_back")
-            )
+            reply_markup=topup_back_kb()
         )
         bot.answer_callback_query(call.id)
         return
@@ -398,7 +476,7 @@ def topup_cb(call):
 
 # ─────────────────────── BUY ACCOUNT ──────────────────
 
-@bot.message_handler(func=lambda m: m.text and "Buy Account" in m.text)
+@router.text("🛒 Buy Account")
 def buy_account(message):
     uid = message.from_user.id
     db.add_user(uid, message.from_user.username or "")
@@ -421,31 +499,35 @@ def buy_account(message):
     if balance < price:
         needed = price - balance
         send(uid,
-            f"[E:🏪] **Buy Fragment Account**\n\n"
-            f"[E:🪙] Price: **{price} TON**\n"
-            f"[E:💲] Your Balance: **{balance:.3f} TON**\n\n"
-            f"[E:⚠️] Insufficient balance. You need **{needed:.3f} more TON**.\n"
-            f"Use 💰 Add Balance to top up."
+            "[E:🏪] **Buy Fragment Account**\n\n"
+            "[E:🪙] Price: **{price} TON**\n"
+            "[E:💲] Your Balance: **{balance:.3f} TON**\n\n"
+            "[E:⚠️] Insufficient balance. You need **{needed:.3f} more TON**.\n"
+            "Use 💰 Add Balance to top up.",
+            price=price, balance=balance, needed=needed
         )
         return
 
     send(uid,
-        f"[E:🏪] **Buy Fragment Account**\n\n"
-        f"[E:💎] Available Stock: **{stock}**\n"
-        f"[E:🪙] Price: **{price} TON**\n"
-        f"[E:💲] Your Balance: **{balance:.3f} TON**\n\n"
-        f"[E:✅] Press confirm to proceed.\n"
-        f"[E:🔒] **You will only be charged once you receive the login OTP.**\n"
-        f"If cancelled before OTP arrives, no charge.",
-        reply_markup=confirm_purchase_kb(0)
+        "[E:🏪] **Buy Fragment Account**\n\n"
+        "[E:💎] Available Stock: **{stock}**\n"
+        "[E:🪙] Price: **{price} TON**\n"
+        "[E:💲] Your Balance: **{balance:.3f} TON**\n\n"
+        "[E:✅] Press confirm to proceed.\n"
+        "[E:🔒] **You will only be charged once you receive the login OTP.**\n"
+        "If cancelled before OTP arrives, no charge.",
+        reply_markup=confirm_purchase_kb(),
+        stock=stock, price=price, balance=balance
     )
 
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("buy_"))
+@router.callback(prefix="buy_")
 def confirm_buy(call):
+    started = time.perf_counter()
     uid = call.from_user.id
 
     if db.has_active_purchase(uid):
+        session_manager.PURCHASES["already_active"].inc()
         bot.answer_callback_query(call.id, "⚠️ You already have an active purchase!", show_alert=True)
         return
 
@@ -453,13 +535,16 @@ def confirm_buy(call):
     price   = db.get_price_ton()
 
     if balance < price:
+        session_manager.PURCHASES["insufficient_balance"].inc()
         bot.answer_callback_query(call.id, "❌ Insufficient balance!", show_alert=True)
         return
 
     account = db.reserve_account(uid)
     if not account:
+        session_manager.PURCHASES["no_stock"].inc()
         bot.answer_callback_query(call.id, "❌ No accounts available right now!", show_alert=True)
         return
+    session_manager.FUNNEL["reserved"].observe(time.perf_counter() - started)
 
     phone          = account["phone"]
     session_string = account["session_string"]
@@ -482,18 +567,18 @@ def confirm_buy(call):
     bot.answer_callback_query(call.id)
 
     asyncio.run_coroutine_threadsafe(
-        session_manager.start_otp_listener(bot, uid, phone, session_string, password_2fa),
+        session_manager.start_otp_listener(bot, uid, phone, session_string, password_2fa, started),
         telethon_loop
     )
 
 
-@bot.callback_query_handler(func=lambda c: c.data == "cancel_buy")
+@router.callback("cancel_buy")
 def cancel_buy(call):
     bot.edit_message_text("❌ Purchase cancelled.", call.message.chat.id, call.message.message_id)
     bot.answer_callback_query(call.id)
 
 
-@bot.callback_query_handler(func=lambda c: c.data == "cancel_otp")
+@router.callback("cancel_otp")
 def cancel_otp_cb(call):
     uid = call.from_user.id
     cancelled = session_manager.cancel_buyer_listener(uid)
@@ -511,7 +596,7 @@ def cancel_otp_cb(call):
 
 # ─────────────────────── MY PROFILE ───────────────────
 
-@bot.message_handler(func=lambda m: m.text and "My Profile" in m.text)
+@router.text("👤 My Profile")
 def my_profile(message):
     uid = message.from_user.id
     db.add_user(uid, message.from_user.username or "")
@@ -519,17 +604,18 @@ def my_profile(message):
     purchases = db.get_user_purchase_count(uid)
     price     = db.get_price_ton()
     send(uid,
-        f"[E:👤] **Your Profile**\n\n"
-        f"[E:🤖] Telegram ID: {uid}\n"
-        f"[E:🪙] Balance: **{balance:.3f} TON**\n"
-        f"[E:📈] Total Purchases: **{purchases}**\n"
-        f"[E:💲] Account Price: **{price} TON**"
+        "[E:👤] **Your Profile**\n\n"
+        "[E:🤖] Telegram ID: {uid}\n"
+        "[E:🪙] Balance: **{balance:.3f} TON**\n"
+        "[E:📈] Total Purchases: **{purchases}**\n"
+        "[E:💲] Account Price: **{price} TON**",
+        uid=uid, balance=balance, purchases=purchases, price=price
     )
 
 
 # ─────────────────────── MY PURCHASES ─────────────────
 
-@bot.message_handler(func=lambda m: m.text and "My Purchases" in m.text)
+@router.text("📋 My Purchases")
 def my_purchases(message):
     uid       = message.from_user.id
     purchases = db.get_user_purchases(uid)
@@ -545,37 +631,44 @@ def my_purchases(message):
 
 # ─────────────────────── ADMIN PANEL ──────────────────
 
-@bot.message_handler(func=lambda m: m.text and "Admin Panel" in m.text)
+@router.text("⚙️ Admin Panel")
 def admin_panel(message):
     if message.from_user.id != ADMIN_ID:
         return
     send(message.chat.id, f"[E:🤖] **Admin Panel**", reply_markup=admin_menu())
 
 
-@bot.message_handler(func=lambda m: m.text and "Back to Menu" in m.text)
+@router.text("🔙 Back to Menu")
 def back_to_menu(message):
     uid   = message.from_user.id
     state = get_state(uid)
     if state in ("enter_otp", "enter_2fa", "enter_phone"):
+        cancel_admin_op(uid)
         run_async(session_manager.cancel_pending(uid))
+    elif state in BATCH_STATES:
+        cancel_batch(uid, message.chat.id)
     clear_state(uid)
     bot.send_message(message.chat.id, "🏠 Main Menu", reply_markup=main_menu(uid))
 
 
-@bot.message_handler(func=lambda m: m.text and "Stock Info" in m.text)
+@router.text("📦 Stock Info")
 def stock_info(message):
     if message.from_user.id != ADMIN_ID:
         return
     send(message.chat.id,
-        f"[E:📈] **Stock Info**\n\n"
-        f"[E:✅] Available: **{db.get_available_count()}**\n"
-        f"🔴 Sold: **{db.get_sold_count()}**\n"
-        f"[E:🪙] Total Revenue: **{db.get_total_revenue():.3f} TON**\n"
-        f"[E:💲] Current Price: **{db.get_price_ton()} TON**"
+        "[E:📈] **Stock Info**\n\n"
+        "[E:✅] Available: **{available}**\n"
+        "🔴 Sold: **{sold}**\n"
+        "[E:🪙] Total Revenue: **{revenue:.3f} TON**\n"
+        "[E:💲] Current Price: **{price} TON**",
+        available=db.get_available_count(),
+        sold=db.get_sold_count(),
+        revenue=db.get_total_revenue(),
+        price=db.get_price_ton()
     )
 
 
-@bot.message_handler(func=lambda m: m.text and "All Users" in m.text)
+@router.text("👥 All Users")
 def all_users(message):
     if message.from_user.id != ADMIN_ID:
         return
@@ -588,13 +681,13 @@ def all_users(message):
         uname = f"@{u['username']}" if u['username'] else "no username"
         lines += f"• {u['telegram_id']} {uname} — {u['balance_ton']:.3f} TON — {u['purchases']} purchase(s)\n"
     if len(users) > 30:
-        lines += f"\n...and {len(users)-30} more"
+        lines += f"\n...and {len(users)-30} more (/export users for all of them)"
     send(message.chat.id, lines)
 
 
 # ─────────────── ADD ACCOUNT FLOW ─────────────────────
 
-@bot.message_handler(func=lambda m: m.text and "Add Account" in m.text)
+@router.text("➕ Add Account")
 def add_account_start(message):
     if message.from_user.id != ADMIN_ID:
         return
@@ -607,22 +700,209 @@ def add_account_start(message):
     )
 
 
+# ─────────────── BATCH ADD FLOW ───────────────────────
+# Admin pastes many phones; codes are requested in the background and every
+# OTP / 2FA prompt arrives as its own message. The admin answers by replying
+# to a prompt (or sending "<phone> <code>"), and each account is saved as
+# soon as it signs in.
+
+BATCH_STATES = ("batch_phones", "batch_codes")
+PHONE_RE     = re.compile(r"\+?\d{7,15}")
+
+
+@router.text("📥 Batch Add")
+def batch_add_start(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    set_state(message.from_user.id, "batch_phones")
+    send(message.chat.id,
+        f"[E:💎] **Batch Add Accounts**\n\n"
+        f"Send all **phone numbers** at once, one per line.\n"
+        f"Include country code. Example: +14155552671\n\n"
+        f"Send /cancel to abort."
+    )
+
+
+def batch_prompt(admin_id, chat_id, phone, msg):
+    """Send an OTP / 2FA prompt and remember which phone a reply to it belongs to."""
+    prompt = bot.send_message(chat_id, msg, parse_mode="HTML")
+    data = get_state_data(admin_id)
+    if get_state(admin_id) == "batch_codes" and data is not None:
+        data["prompts"][prompt.message_id] = phone
+
+
+_batch_lock = threading.Lock()
+
+
+def batch_finish(admin_id) -> bool:
+    """End the batch if no phone is left (nothing pending, no code request in flight).
+    True for the one caller that ended it."""
+    with _batch_lock:
+        if get_state(admin_id) != "batch_codes" or session_manager.batch_remaining(admin_id):
+            return False
+        clear_state(admin_id)
+        return True
+
+
+def cancel_batch(uid, chat_id):
+    """Stop checking answers and disconnect the batch's pending logins, off the handler thread."""
+    cancel_admin_op(uid)
+    start_admin_op(uid, chat_id, "cancel batch", session_manager.cancel_batch(uid), lambda: None)
+
+
+def batch_start(admin_id, chat_id, phones):
+    set_state(admin_id, "batch_codes", data={"prompts": {}, "total": len(phones), "saved": 0})
+
+    def on_result(phone, ok, msg):
+        if ok:
+            batch_prompt(admin_id, chat_id, phone, msg)
+        else:
+            bot.send_message(chat_id, msg, parse_mode="HTML")
+
+    def on_done(future):
+        try:
+            sent, failed = future.result()
+        except Exception as e:
+            logger.error(f"Batch code requests failed: {e}")
+            return
+        summary = f"📤 Code requests finished — {sent} sent, {failed} failed."
+        # Every code may already have been answered while the last requests were going out
+        if batch_finish(admin_id):
+            bot.send_message(chat_id, summary + " Batch complete.", reply_markup=admin_menu())
+            return
+        bot.send_message(chat_id, summary)
+
+    when_done(asyncio.run_coroutine_threadsafe(
+        session_manager.send_otp_batch(admin_id, phones, on_result),
+        telethon_loop
+    ), on_done)
+
+
+def batch_reply(message, uid, text):
+    """Route one admin answer to the phone it belongs to."""
+    data  = get_state_data(uid)
+    phone = None
+    reply = message.reply_to_message
+    if reply is not None:
+        phone = data["prompts"].get(reply.message_id)
+    if phone is None:
+        parts = text.split(maxsplit=1)
+        if len(parts) == 2 and PHONE_RE.fullmatch(parts[0]):
+            phone, text = parts
+    if phone is None:
+        send(message.chat.id, f"[E:⚠️] Reply to a prompt, or send **<phone> <code>**.")
+        return
+
+    chat_id = message.chat.id
+    if session_manager.batch_stage(uid, phone) == "2fa":
+        started = start_admin_op(uid, chat_id, f"2FA for {phone}",
+                                 session_manager.verify_batch_2fa(uid, phone, text),
+                                 lambda ok, msg: batch_verified(uid, chat_id, phone, ok, msg),
+                                 key=(uid, phone))
+    else:
+        started = start_admin_op(uid, chat_id, f"OTP for {phone}",
+                                 session_manager.verify_batch_otp(uid, phone, text.replace(" ", "")),
+                                 lambda needs_2fa, ok, msg: batch_verified(uid, chat_id, phone,
+                                                                           ok and not needs_2fa, msg),
+                                 key=(uid, phone))
+    if not started:
+        send(chat_id, "[E:⏱] Still checking the last answer for **{phone}** — send this one again in a moment.",
+             phone=phone)
+
+
+def batch_verified(uid, chat_id, phone, saved, msg):
+    """A batch answer has been checked: prompt again (wrong code, 2FA needed) or count the save."""
+    if not saved:
+        batch_prompt(uid, chat_id, phone, msg)
+        return
+    with _batch_lock:
+        data = get_state_data(uid)
+        if get_state(uid) != "batch_codes" or data is None:
+            bot.send_message(chat_id, msg, parse_mode="HTML")     # batch cancelled meanwhile
+            return
+        data["saved"] += 1
+        msg += f"\n\n📦 {data['saved']}/{data['total']} saved"
+    if batch_finish(uid):
+        bot.send_message(chat_id, msg + " — batch complete.", parse_mode="HTML", reply_markup=admin_menu())
+        return
+    bot.send_message(chat_id, msg, parse_mode="HTML")
+
+
+# ─────────────── IMPORT SESSIONS ──────────────────────
+
+@router.text("🗂 Import Sessions")
+def import_sessions_start(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    set_state(message.from_user.id, "import_sessions")
+    send(message.chat.id,
+        f"[E:💎] **Import Sessions**\n\n"
+        f"Send a Telethon **.session** file, a **.zip** of session files,\n"
+        f"or a **.txt** list — one StringSession per line, or\n"
+        f"phone:session:2fa\n\n"
+        f"Every session is checked live before it is added.\n"
+        f"Send /cancel to abort."
+    )
+
+
+@bot.message_handler(content_types=["document"])
+def import_sessions_file(message):
+    uid = message.from_user.id
+    if uid != ADMIN_ID or get_state(uid) != "import_sessions":
+        return
+    doc = message.document
+    send(message.chat.id, "[E:⏱] Importing **{name}**...", name=doc.file_name)
+
+    suffix = os.path.splitext(doc.file_name or "")[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(bot.download_file(bot.get_file(doc.file_id).file_path))
+    path = tmp.name
+
+    def on_done(future):
+        os.unlink(path)
+        try:
+            report = future.result()
+        except Exception as e:
+            bot.send_message(message.chat.id, f"❌ Import failed: {e}")
+            return
+        skipped = report.pop("skipped")
+        listed  = "".join(f"\n• {phone} — {status}" for phone, status in skipped[:20])
+        if len(skipped) > 20:
+            listed += f"\n...and {len(skipped) - 20} more"
+        send(message.chat.id,
+            "[E:✅] **Import Finished**\n\n"
+            "[E:📈] Imported: **{imported}**\n"
+            "🔄 Updated (already in stock): **{updated}**\n"
+            "[E:⚠️] Duplicate: **{duplicate}**\n"
+            "❌ Invalid: **{invalid}**\n"
+            "⛔ Skipped (sold or in a purchase): **{n_skipped}**{listed}\n\n"
+            "Send another file, or /cancel when done.",
+            n_skipped=len(skipped), listed=listed, **report
+        )
+
+    when_done(asyncio.run_coroutine_threadsafe(
+        session_import.import_files([(path, doc.file_name or "upload")]),
+        telethon_loop
+    ), on_done)
+
+
 # ─────────────── CHANGE PRICE ─────────────────────────
 
-@bot.message_handler(func=lambda m: m.text and "Change Price" in m.text)
+@router.text("💵 Change Price")
 def change_price_menu(message):
     if message.from_user.id != ADMIN_ID:
         return
     price = db.get_price_ton()
     send(message.chat.id,
-        f"[E:💲] **Change Account Price**\n\n"
-        f"[E:🪙] Current price: **{price} TON**\n\n"
-        f"Pick a quick preset or enter a custom price:",
-        reply_markup=price_quick_kb()
+        "[E:💲] **Change Account Price**\n\n"
+        "[E:🪙] Current price: **{price} TON**\n\n"
+        "Pick a quick preset or enter a custom price:",
+        reply_markup=price_quick_kb(),
+        price=price
     )
 
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("qprice_"))
+@router.callback(prefix="qprice_")
 def quick_price_cb(call):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id)
@@ -638,7 +918,8 @@ def quick_price_cb(call):
             new_price = float(val)
             db.set_price_ton(new_price)
             edit(call.message.chat.id, call.message.message_id,
-                f"[E:✅] Price updated to **{new_price} TON**"
+                "[E:✅] Price updated to **{new_price} TON**",
+                new_price=new_price
             )
         except ValueError:
             bot.answer_callback_query(call.id, "Invalid price", show_alert=True)
@@ -647,7 +928,7 @@ def quick_price_cb(call):
 
 # ─────────────── BROADCAST ────────────────────────────
 
-@bot.message_handler(func=lambda m: m.text and "Broadcast" in m.text)
+@router.text("📢 Broadcast")
 def broadcast_start(message):
     if message.from_user.id != ADMIN_ID:
         return
@@ -662,7 +943,7 @@ def broadcast_start(message):
 
 # ─────────────── ADD USER BALANCE ─────────────────────
 
-@bot.message_handler(func=lambda m: m.text and "Add User Balance" in m.text)
+@router.text("💳 Add User Balance")
 def add_user_balance_start(message):
     if message.from_user.id != ADMIN_ID:
         return
@@ -677,12 +958,15 @@ def add_user_balance_start(message):
 
 # ─────────────── CANCEL ───────────────────────────────
 
-@bot.message_handler(commands=["cancel"])
+@router.command("cancel")
 def cancel_cmd(message):
     uid   = message.from_user.id
     state = get_state(uid)
     if state in ("enter_otp", "enter_2fa", "enter_phone"):
+        cancel_admin_op(uid)
         run_async(session_manager.cancel_pending(uid))
+    elif state in BATCH_STATES:
+        cancel_batch(uid, message.chat.id)
     clear_state(uid)
     bot.send_message(message.chat.id, "❌ Cancelled.", reply_markup=main_menu(uid))
 
@@ -696,7 +980,7 @@ def stock_list_text(accounts):
     return f"📦 <b>Manage Stock</b>\n\n<b>{len(accounts)}</b> account(s) in stock.\nTap an account to view details or delete it."
 
 
-@bot.message_handler(func=lambda m: m.text and "Manage Stock" in m.text)
+@router.text("📋 Manage Stock")
 def manage_stock(message):
     if message.from_user.id != ADMIN_ID:
         return
@@ -712,7 +996,7 @@ def manage_stock(message):
     )
 
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("stock_page_"))
+@router.callback(prefix="stock_page_")
 def stock_page_cb(call):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id)
@@ -732,7 +1016,7 @@ def stock_page_cb(call):
     bot.answer_callback_query(call.id)
 
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("stock_view_"))
+@router.callback(prefix="stock_view_")
 def stock_view_cb(call):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id)
@@ -757,7 +1041,7 @@ def stock_view_cb(call):
     bot.answer_callback_query(call.id)
 
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("stock_delete_"))
+@router.callback(prefix="stock_delete_")
 def stock_delete_cb(call):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id)
@@ -781,205 +1065,238 @@ def stock_delete_cb(call):
     )
 
 
-@bot.callback_query_handler(func=lambda c: c.data == "stock_close")
+@router.callback("stock_close")
 def stock_close_cb(call):
     bot.delete_message(call.message.chat.id, call.message.message_id)
     bot.answer_callback_query(call.id)
 
 
+# ─────────────── STATE HANDLERS ───────────────────────
+# Text that is not a menu label or command goes to the handler of the
+# sender's current state; admin=True states ignore everyone but ADMIN_ID.
 
-@bot.message_handler(func=lambda m: True)
-def handle_text(message):
-    uid   = message.from_user.id
-    state = get_state(uid)
-    text  = message.text.strip() if message.text else ""
+@router.state("enter_phone", admin=True)
+def on_enter_phone(message, uid, text):
+    chat_id = message.chat.id
 
-    if state == "enter_phone" and uid == ADMIN_ID:
-        send(message.chat.id, f"[E:💎] Sending OTP to {text}...")
-        ok, msg = run_async(session_manager.send_otp(uid, text))
+    def sent(ok, msg):
         set_state(uid, "enter_otp") if ok else clear_state(uid)
-        bot.send_message(message.chat.id, msg)
+        bot.send_message(chat_id, msg)
+
+    if start_admin_op(uid, chat_id, "send_otp", session_manager.send_otp(uid, text), sent):
+        send(chat_id, "[E:💎] Sending OTP to {text}...", text=text)
+    else:
+        bot.send_message(chat_id, "⏳ Still working on the previous step, please wait.")
 
-    elif state == "enter_otp" and uid == ADMIN_ID:
-        code = text.replace(" ", "")
-        needs_2fa, ok, msg = run_async(session_manager.verify_otp(uid, code))
+
+@router.state("enter_otp", admin=True)
+def on_enter_otp(message, uid, text):
+    chat_id = message.chat.id
+    code = text.replace(" ", "")
+
+    def verified(needs_2fa, ok, msg):
         if not ok:
-            bot.send_message(message.chat.id, msg)
+            bot.send_message(chat_id, msg)
         elif needs_2fa:
             set_state(uid, "enter_2fa")
-            bot.send_message(message.chat.id, msg)
+            bot.send_message(chat_id, msg)
         else:
             clear_state(uid)
-            bot.send_message(message.chat.id, msg, reply_markup=admin_menu())
+            bot.send_message(chat_id, msg, reply_markup=admin_menu())
+
+    if not start_admin_op(uid, chat_id, "verify_otp", session_manager.verify_otp(uid, code), verified):
+        bot.send_message(chat_id, "⏳ Still checking the previous code, please wait.")
+
 
-    elif state == "enter_2fa" and uid == ADMIN_ID:
-        ok, msg = run_async(session_manager.verify_2fa(uid, text))
+@router.state("enter_2fa", admin=True)
+def on_enter_2fa(message, uid, text):
+    chat_id = message.chat.id
+
+    def verified(ok, msg):
         if ok:
             clear_state(uid)
-            bot.send_message(message.chat.id, msg, reply_markup=admin_menu())
+            bot.send_message(chat_id, msg, reply_markup=admin_menu())
         else:
-            bot.send_message(message.chat.id, msg)
+            bot.send_message(chat_id, msg)
 
-    elif state == "set_price" and uid == ADMIN_ID:
-        try:
-            new_price = float(text)
-            db.set_price_ton(new_price)
-            clear_state(uid)
-            send(message.chat.id,
-                f"[E:✅] Price updated to **{new_price} TON**",
-                reply_markup=admin_menu()
-            )
-        except ValueError:
-            send(message.chat.id, f"[E:⚠️] Invalid. Send a number like 0.25")
+    if not start_admin_op(uid, chat_id, "verify_2fa", session_manager.verify_2fa(uid, text), verified):
+        bot.send_message(chat_id, "⏳ Still checking the previous password, please wait.")
+
+
+@router.state("batch_phones", admin=True)
+def on_batch_phones(message, uid, text):
+    phones = list(dict.fromkeys(PHONE_RE.findall(text)))
+    if not phones:
+        send(message.chat.id, f"[E:⚠️] No phone numbers found. Send one per line, e.g. +14155552671")
+        return
+    send(message.chat.id, "[E:💎] Requesting codes for **{count}** number(s)...", count=len(phones))
+    batch_start(uid, message.chat.id, phones)
 
-    elif state == "broadcast" and uid == ADMIN_ID:
+
+@router.state("batch_codes", admin=True)
+def on_batch_codes(message, uid, text):
+    batch_reply(message, uid, text)
+
+
+@router.state("set_price", admin=True)
+def on_set_price(message, uid, text):
+    try:
+        new_price = float(text)
+        db.set_price_ton(new_price)
         clear_state(uid)
-        all_users_list = db.get_all_users()
-        sent = 0
-        failed = 0
-        bot.send_message(message.chat.id, f"📤 Sending to {len(all_users_list)} users...")
-        # Build once with premium emojis — reuse plain+entities for all users
-        plain, entities = build(f"[E:📢] **Message from Shop**\n\n{text}")
-        for user in all_users_list:
-            try:
-                bot.send_message(
-                    user["telegram_id"],
-                    plain,
-                    entities=entities if entities else None
-                )
-                sent += 1
-            except Exception:
-                failed += 1
         send(message.chat.id,
-            f"[E:✅] **Broadcast Complete**\n\n"
-            f"[E:📈] Sent: **{sent}**\n"
-            f"❌ Failed: **{failed}** (blocked/deleted)",
-            reply_markup=admin_menu()
+            "[E:✅] Price updated to **{new_price} TON**",
+            reply_markup=admin_menu(),
+            new_price=new_price
         )
+    except ValueError:
+        send(message.chat.id, f"[E:⚠️] Invalid. Send a number like 0.25")
 
-    elif state == "add_bal_uid" and uid == ADMIN_ID:
-        if not text.isdigit():
-            send(message.chat.id, f"[E:⚠️] Not a valid Telegram ID. Numbers only.")
-            return
-        target_uid = int(text)
-        user = db.get_user_by_id(target_uid)
-        if not user:
-            send(message.chat.id, f"[E:⚠️] User {target_uid} not found in database.")
-            return
-        uname = f"@{user['username']}" if user['username'] else "no username"
-        set_state(uid, "add_bal_amount", data=target_uid)
-        send(message.chat.id,
-            f"[E:🎁] **Add Balance — Step 2**\n\n"
-            f"[E:👤] User: {target_uid} {uname}\n"
-            f"[E:🪙] Current Balance: **{user['balance_ton']:.3f} TON**\n\n"
-            f"How much TON to add? (e.g. 1.5)"
-        )
 
-    elif state == "add_bal_amount" and uid == ADMIN_ID:
-        target_uid = get_state_data(uid)
-        try:
-            amount = float(text)
-            if amount <= 0:
-                raise ValueError
-            db.add_balance(target_uid, amount)
-            new_bal = db.get_balance(target_uid)
-            clear_state(uid)
-            send(message.chat.id,
-                f"[E:✅] **Balance Added!**\n\n"
-                f"[E:👤] User: {target_uid}\n"
-                f"[E:🪙] Added: +{amount} TON\n"
-                f"[E:📈] New Balance: **{new_bal:.3f} TON**",
-                reply_markup=admin_menu()
-            )
-            try:
-                send(target_uid,
-                    f"[E:🎁] **Balance Added by Admin!**\n\n"
-                    f"[E:🪙] Added: **+{amount} TON**\n"
-                    f"[E:💲] New Balance: **{new_bal:.3f} TON**"
-                )
-            except Exception:
-                pass
-        except ValueError:
-            send(message.chat.id, f"[E:⚠️] Invalid amount. Send a positive number like 1.5")
+@router.state("broadcast", admin=True)
+def on_broadcast(message, uid, text):
+    clear_state(uid)
+    # Rendered once with premium emojis; the engine reuses plain+entities for every user
+    plain, entities = render("[E:📢] **Message from Shop**\n\n{text}", text=text)
+    broadcast.start(bot, message.chat.id, plain, entities)
 
-    # ── Buyer: tonkeeper amount input ─────────────────────
-    elif state == "topup_custom":
-        try:
-            amount = float(text)
-            if amount <= 0:
-                raise ValueError
-            clear_state(uid)
-            nano    = int(amount * 1_000_000_000)
-            tk_link = f"https://app.tonkeeper.com/transfer/{BOT_WALLET}?amount={nano}&text={uid}"
-            tk_kb   = types.InlineKeyboardMarkup()
-            tk_kb.add(types.InlineKeyboardButton("💎 Open Tonkeeper & Pay", url=tk_link))
-            tk_kb.add(types.InlineKeyboardButton("🔙 Back", callback_data="topup_back"))
-            bot.send_message(
-                uid,
-                f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Tonkeeper Payment — {amount:.3f} TON</b>\n\n"
-                f"Tap the button below. Your wallet address, amount and memo\n"
-                f"are all pre-filled — just open and confirm.\n\n"
-                f"<tg-emoji emoji-id=\"5951665890079544884\">☑️</tg-emoji> Amount: <b>{amount:.3f} TON</b>\n"
-                f"<tg-emoji emoji-id=\"6106902616795519273\">🔒</tg-emoji> Memo: <code>{uid}</code>\n\n"
-                f"<tg-emoji emoji-id=\"5900104897885376843\">⏱</tg-emoji> Credited automatically within ~1 minute.",
-                parse_mode="HTML",
-                reply_markup=tk_kb
-            )
-        except ValueError:
-            bot.send_message(
-                uid,
-                f"<tg-emoji emoji-id=\"6106898459267177284\">⚠️</tg-emoji> Invalid amount. Send a number like <code>2.5</code>",
-                parse_mode="HTML"
-            )
+
+@router.callback(prefix="bcast_stop_")
+def broadcast_stop_cb(call):
+    if call.from_user.id != ADMIN_ID:
+        bot.answer_callback_query(call.id)
         return
+    stopped = broadcast.stop(int(call.data.rsplit("_", 1)[1]))
+    bot.answer_callback_query(call.id, "⏹ Stopping..." if stopped else "Broadcast already finished.")
 
-    # ── Buyer: writing review text ─────────────────────
-    elif state == "writing_review":
-        rating   = get_state_data(uid) or 5
-        stars    = "⭐" * rating
-        username = message.from_user.username or ""
 
-        if db.has_reviewed(uid):
-            clear_state(uid)
-            bot.send_message(uid, "✅ You already submitted a review. Thank you!")
-            return
+@router.state("add_bal_uid", admin=True)
+def on_add_bal_uid(message, uid, text):
+    if not text.isdigit():
+        send(message.chat.id, f"[E:⚠️] Not a valid Telegram ID. Numbers only.")
+        return
+    target_uid = int(text)
+    user = db.get_user_by_id(target_uid)
+    if not user:
+        send(message.chat.id, "[E:⚠️] User {target_uid} not found in database.", target_uid=target_uid)
+        return
+    uname = f"@{user['username']}" if user['username'] else "no username"
+    set_state(uid, "add_bal_amount", data=target_uid)
+    send(message.chat.id,
+        "[E:🎁] **Add Balance — Step 2**\n\n"
+        "[E:👤] User: {target_uid} {uname}\n"
+        "[E:🪙] Current Balance: **{balance:.3f} TON**\n\n"
+        "How much TON to add? (e.g. 1.5)",
+        target_uid=target_uid, uname=uname, balance=user["balance_ton"]
+    )
 
-        saved = db.save_review(uid, username, rating, text)
-        if not saved:
-            bot.send_message(uid, "❌ Could not save review. Please try again.")
-            return
 
-        # Reward buyer with 0.5 TON
-        db.add_balance(uid, REVIEW_REWARD)
-        db.mark_review_rewarded(uid)
-        new_bal = db.get_balance(uid)
+@router.state("add_bal_amount", admin=True)
+def on_add_bal_amount(message, uid, text):
+    target_uid = get_state_data(uid)
+    try:
+        amount = float(text)
+        if amount <= 0:
+            raise ValueError
+        db.add_balance(target_uid, amount)
+        new_bal = db.get_balance(target_uid)
         clear_state(uid)
+        send(message.chat.id,
+            "[E:✅] **Balance Added!**\n\n"
+            "[E:👤] User: {target_uid}\n"
+            "[E:🪙] Added: +{amount} TON\n"
+            "[E:📈] New Balance: **{new_bal:.3f} TON**",
+            reply_markup=admin_menu(),
+            target_uid=target_uid, amount=amount, new_bal=new_bal
+        )
+        try:
+            send(target_uid,
+                "[E:🎁] **Balance Added by Admin!**\n\n"
+                "[E:🪙] Added: **+{amount} TON**\n"
+                "[E:💲] New Balance: **{new_bal:.3f} TON**",
+                amount=amount, new_bal=new_bal
+            )
+        except Exception:
+            pass
+    except ValueError:
+        send(message.chat.id, f"[E:⚠️] Invalid amount. Send a positive number like 1.5")
+
 
-        # Thank buyer
+# ── Buyer: tonkeeper amount input ─────────────────────
+
+@router.state("topup_custom")
+def on_topup_custom(message, uid, text):
+    try:
+        amount = float(text)
+        if amount <= 0:
+            raise ValueError
+        clear_state(uid)
         bot.send_message(
             uid,
-            f"<tg-emoji emoji-id=\"6106981506754814207\">✅</tg-emoji> <b>Review Submitted! Thank you!</b>\n\n"
-            f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>+{REVIEW_REWARD} TON</b> has been added to your balance.\n"
-            f"<tg-emoji emoji-id=\"6107061783988542265\">💲</tg-emoji> New Balance: <b>{new_bal:.3f} TON</b>",
+            f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Tonkeeper Payment — {amount:.3f} TON</b>\n\n"
+            f"Tap the button below. Your wallet address, amount and memo\n"
+            f"are all pre-filled — just open and confirm.\n\n"
+            f"<tg-emoji emoji-id=\"5951665890079544884\">☑️</tg-emoji> Amount: <b>{amount:.3f} TON</b>\n"
+            f"<tg-emoji emoji-id=\"6106902616795519273\">🔒</tg-emoji> Memo: <code>{uid}</code>\n\n"
+            f"<tg-emoji emoji-id=\"5900104897885376843\">⏱</tg-emoji> Credited automatically within ~1 minute.",
             parse_mode="HTML",
-            reply_markup=main_menu(uid)
+            reply_markup=tonkeeper_payment_kb(uid, amount)
+        )
+    except ValueError:
+        bot.send_message(
+            uid,
+            f"<tg-emoji emoji-id=\"6106898459267177284\">⚠️</tg-emoji> Invalid amount. Send a number like <code>2.5</code>",
+            parse_mode="HTML"
         )
 
-        # Forward review to admin
-        uname_display = f"@{username}" if username else f"ID: {uid}"
-        try:
-            bot.send_message(
-                ADMIN_ID,
-                f"<tg-emoji emoji-id=\"6104943961384688402\">📈</tg-emoji> <b>New Review Received!</b>\n\n"
-                f"<tg-emoji emoji-id=\"6107017202228009498\">👤</tg-emoji> User: {uname_display} (<code>{uid}</code>)\n"
-                f"⭐ Rating: <b>{stars} ({rating}/5)</b>\n\n"
-                f"💬 <b>Review:</b>\n{text}",
-                parse_mode="HTML"
-            )
-        except Exception:
-            pass
 
+# ── Buyer: writing review text ─────────────────────
 
+@router.state("writing_review")
+def on_writing_review(message, uid, text):
+    rating   = get_state_data(uid) or 5
+    stars    = "⭐" * rating
+    username = message.from_user.username or ""
+
+    if db.has_reviewed(uid):
+        clear_state(uid)
+        bot.send_message(uid, "✅ You already submitted a review. Thank you!")
+        return
+
+    saved = db.save_review(uid, username, rating, text)
+    if not saved:
+        bot.send_message(uid, "❌ Could not save review. Please try again.")
+        return
+
+    # Reward buyer with 0.5 TON
+    db.add_balance(uid, REVIEW_REWARD)
+    db.mark_review_rewarded(uid)
+    new_bal = db.get_balance(uid)
+    clear_state(uid)
+
+    # Thank buyer
+    bot.send_message(
+        uid,
+        f"<tg-emoji emoji-id=\"6106981506754814207\">✅</tg-emoji> <b>Review Submitted! Thank you!</b>\n\n"
+        f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>+{REVIEW_REWARD} TON</b> has been added to your balance.\n"
+        f"<tg-emoji emoji-id=\"6107061783988542265\">💲</tg-emoji> New Balance: <b>{new_bal:.3f} TON</b>",
+        parse_mode="HTML",
+        reply_markup=main_menu(uid)
+    )
+
+    # Forward review to admin
+    uname_display = f"@{username}" if username else f"ID: {uid}"
+    try:
+        bot.send_message(
+            ADMIN_ID,
+            f"<tg-emoji emoji-id=\"6104943961384688402\">📈</tg-emoji> <b>New Review Received!</b>\n\n"
+            f"<tg-emoji emoji-id=\"6107017202228009498\">👤</tg-emoji> User: {uname_display} (<code>{uid}</code>)\n"
+            f"⭐ Rating: <b>{stars} ({rating}/5)</b>\n\n"
+            f"💬 <b>Review:</b>\n{text}",
+            parse_mode="HTML"
+        )
+    except Exception:
+        pass
 
 
 # ─────────────────────── REVIEW FLOW ──────────────────
@@ -987,7 +1304,7 @@ def handle_text(message):
 
 REVIEW_REWARD = 0.5  # TON rewarded for leaving a review
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("review_"))
+@router.callback(prefix="review_")
 def handle_rating(call):
     uid = call.from_user.id
 
@@ -1011,17 +1328,401 @@ def handle_rating(call):
     )
 
 
+# ─────────────────────── RUNTIME STATS ────────────────
+
+if RUNTIME == "asyncio":
+    workers = async_runtime.AsyncRuntime(bot, telethon_loop, UPDATE_WORKERS)
+else:
+    workers = update_workers.UpdateWorkers(bot, UPDATE_WORKERS)
+
+# CLUSTER: this process is one of several workers sharing the DB
+node = cluster.Cluster(WORKER_ID or None, CLUSTER_LEASE_TTL) if CLUSTER else None
+
+# Moves old sold accounts / transactions to cold storage (ARCHIVE_AFTER_DAYS = 0: never)
+archiver = archive.Archiver(ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL)
+
+# Online gzipped backups every BACKUP_INTERVAL (0: only /backup run and `python backup.py run`)
+backups = backup.Backup(BACKUP_INTERVAL)
+
+
+@router.command("workers")
+def workers_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    s = workers.stats()
+    o = outbound.dispatcher.stats()
+    bot.send_message(
+        message.chat.id,
+        f"⚙️ <b>Update Workers ({s['workers']})</b>\n\n"
+        f"Queue depth: <code>{' '.join(map(str, s['depth']))}</code>\n"
+        f"Max depth:   <code>{' '.join(map(str, s['max_depth']))}</code>\n"
+        f"Handled: <b>{s['handled']}</b> | Failed: <b>{s['failed']}</b>\n"
+        f"Avg queue wait: <b>{s['queue_wait']['avg'] * 1000:.1f} ms</b>\n"
+        f"Avg handler time: <b>{s['handler_time']['avg'] * 1000:.1f} ms</b>\n"
+        f"Runtime: <b>{RUNTIME}</b> | Threads: <b>{threading.active_count()}</b>\n\n"
+        f"📤 <b>Outbound</b>\n"
+        f"Sent: <b>{o['sent']}</b> | Throttled: <b>{o['throttled']}</b> | "
+        f"Retried: <b>{o['retried']}</b> | Failed: <b>{o['failed']}</b>\n"
+        f"Queued: <code>{' '.join(map(str, o['queued']))}</code>",
+        parse_mode="HTML"
+    )
+
+
+@router.command("shops")
+def shops_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    lines = []
+    for shop in shops.all():
+        users, stock, revenue = shop.run(lambda: (db.get_user_count(), db.get_available_count(),
+                                                  db.get_total_revenue()))
+        lines.append(f"<b>{escape(shop.name)}</b>: {users} users | {stock} in stock | "
+                     f"{revenue:.2f} TON | {len(shop.states)} states")
+    bot.send_message(message.chat.id, "🏬 <b>Shops</b>\n\n" + "\n".join(lines), parse_mode="HTML")
+
+
+@router.command("cluster")
+def cluster_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    if node is None:
+        bot.send_message(message.chat.id, "Single process (CLUSTER = False).")
+        return
+    s = node.stats()
+    leaders = "\n".join(f"  {name}: <code>{escape(holder)}</code>" for name, holder in s["leaders"].items())
+    queue = " | ".join(f"{k}: <b>{v}</b>" for k, v in s["queue"].items()) or "empty"
+    bot.send_message(
+        message.chat.id,
+        f"🖧 <b>Cluster ({len(s['members'])} workers)</b>\n\n"
+        f"This worker: <code>{escape(s['worker'])}</code> (partition {s['partition'][0]})\n"
+        f"Rebalances: <b>{s['rebalances']}</b>\n"
+        f"Leaders:\n{leaders}\n"
+        f"Update queue: {queue}",
+        parse_mode="HTML"
+    )
+
+
+@router.command("archive")
+def archive_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    arg = message.text.split()[-1]
+    if arg == "run":
+        if not ARCHIVE_AFTER_DAYS:
+            bot.send_message(message.chat.id, "Archiving is off (ARCHIVE_AFTER_DAYS = 0).")
+            return
+        bot.send_message(message.chat.id, "🗄 Archiving…")
+
+        def run_and_report():
+            try:
+                results = archiver.run()
+            except Exception as e:
+                logger.error(f"Archive run failed: {e}", exc_info=True)
+                bot.send_message(message.chat.id, f"❌ Archive run failed: {e}")
+                return
+            lines = [f"<b>{escape(name)}</b>: {r['accounts']} account(s), {r['transactions']} transaction(s) | "
+                     f"{r['hot_bytes_before'] // 1024} → {r['hot_bytes'] // 1024} KiB ({r['seconds']} s)"
+                     for name, r in results.items()]
+            bot.send_message(message.chat.id, "🗄 <b>Archive run</b>\n\n" + "\n".join(lines), parse_mode="HTML")
+
+        _admin_op_executor.submit(shops.bind(run_and_report))
+        return
+    if arg.isdigit():
+        account = db.get_archived_account(int(arg))
+        if not account:
+            bot.send_message(message.chat.id, f"No archived account #{arg}.")
+            return
+        bot.send_message(
+            message.chat.id,
+            f"🗄 <b>Archived Account #{account['id']}</b>\n\n"
+            f"📞 Phone: <code>{account['phone']}</code>\n"
+            f"🔒 2FA: <code>{escape(account['password_2fa'] or 'None')}</code>\n"
+            f"👤 Buyer: <code>{account['buyer_id']}</code>\n"
+            f"📅 Added: {account['added_at']} | Sold: {account['sold_at']} | Archived: {account['archived_at']}",
+            parse_mode="HTML"
+        )
+        return
+    s = archive.stats()
+    c = archiver.counters
+    bot.send_message(
+        message.chat.id,
+        f"🗄 <b>Archive</b> ({f'after {ARCHIVE_AFTER_DAYS} days' if ARCHIVE_AFTER_DAYS else 'off'})\n\n"
+        f"Archived: <b>{s['accounts']}</b> accounts | <b>{s['transactions']}</b> transactions\n"
+        f"Hot DB: <b>{s['hot_bytes'] // 1024} KiB</b> | Archive: <b>{s['archive_bytes'] // 1024} KiB</b>\n"
+        f"Runs: {c['runs']} (last {archiver.last_run or 'never'}) | Pages freed: {c['pages_freed']}\n\n"
+        f"/archive run — archive now\n"
+        f"/archive &lt;account id&gt; — look up an archived sale",
+        parse_mode="HTML"
+    )
+
+
+@router.command("backup")
+def backup_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    arg = message.text.split()[-1]
+    if arg in ("run", "verify"):
+        bot.send_message(message.chat.id, "💾 Backing up…" if arg == "run" else "💾 Verifying…")
+
+        def run_and_report():
+            try:
+                if arg == "run":
+                    lines = [f"<code>{escape(os.path.basename(r['file']))}</code> "
+                             f"{r['bytes'] // 1024} → {r['gz_bytes'] // 1024} KiB ({r['seconds']} s)"
+                             for files in backups.run().values() for r in files]
+                else:
+                    latest = backup.list_backups(dest_dir=backups.dest_dir)
+                    if not latest:
+                        bot.send_message(message.chat.id, "No backups yet.")
+                        return
+                    v = backup.verify(latest[0])
+                    lines = [f"<code>{escape(os.path.basename(v['file']))}</code>: "
+                             f"{'✅ ok' if v['ok'] else '❌ ' + escape('; '.join(v['integrity']))}",
+                             ", ".join(f"{name} {n}" for name, n in v["tables"].items())]
+            except Exception as e:
+                logger.error(f"/backup {arg} failed: {e}", exc_info=True)
+                bot.send_message(message.chat.id, f"❌ Backup {arg} failed: {e}")
+                return
+            bot.send_message(message.chat.id, "💾 <b>Backup</b>\n\n" + "\n".join(lines), parse_mode="HTML")
+
+        _admin_op_executor.submit(shops.bind(run_and_report))
+        return
+    files = backup.list_backups(dest_dir=backups.dest_dir)
+    listed = "\n".join(f"<code>{escape(os.path.basename(f))}</code> {os.path.getsize(f) // 1024} KiB"
+                        for f in files) or "none yet"
+    c = backups.counters
+    bot.send_message(
+        message.chat.id,
+        f"💾 <b>Backups</b> (newest {backups.keep} kept)\n\n{listed}\n\n"
+        f"Runs: {c['runs']} (last {backups.last_run or 'never'}) | Failed: {c['failed']}\n\n"
+        f"/backup run — back up now\n/backup verify — check the newest backup",
+        parse_mode="HTML"
+    )
+
+
+@router.command("export")
+def export_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    args = message.text.split()[1:]
+    kind = args[0] if args else ""
+    fmt  = args[1] if len(args) > 1 else "csv"
+    if kind not in exporter.KINDS or fmt not in exporter.FORMATS:
+        bot.send_message(message.chat.id,
+                         f"Usage: /export {'|'.join(exporter.KINDS)} [{'|'.join(exporter.FORMATS)}]")
+        return
+
+    def run_and_send():
+        try:
+            exporter.send(bot, message.chat.id, kind, fmt)
+        except Exception as e:
+            logger.error(f"/export {kind} failed: {e}", exc_info=True)
+            bot.send_message(message.chat.id, f"❌ Export failed: {e}")
+
+    # Off the handler thread: a big export must not hold up this user's lane
+    _admin_op_executor.submit(shops.bind(run_and_send))
+
+
+@router.command("states")
+def states_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    s = states.stats()
+    bot.send_message(
+        message.chat.id,
+        f"🗂 <b>Conversation States</b>\n\n"
+        f"Entries: <b>{s['entries']}</b> / {s['max_entries']} (~{s['memory_bytes'] // 1024} KiB)\n"
+        f"Hits: {s['hits']} | Misses: {s['misses']}\n"
+        f"Expired: {s['expired']} | Evicted: {s['evicted']}\n"
+        f"Pending writes: {s['pending_writes']} | Flushes: {s['flushes']}",
+        parse_mode="HTML"
+    )
+
+
+metrics.register(workers.queue_wait, "bot_update_queue_wait_seconds", "Update received to handler start")
+metrics.register(workers.handler_time, "bot_handler_seconds", "Time spent in update handlers")
+metrics.gauge("bot_states", "Conversation states held in memory",
+              fn=lambda: sum(len(shop.states) for shop in shops.all()))
+metrics.gauge("bot_threads", "Live threads", fn=threading.active_count)
+metrics.gauge("outbound_queued", "Bot API calls waiting in the outbound dispatcher",
+              fn=lambda: sum(outbound.dispatcher.stats()["queued"]))
+for _name in ("sent", "throttled", "retried", "failed"):
+    metrics.gauge(f"outbound_{_name}", f"Outbound Bot API calls {_name} since start",
+                  fn=lambda n=_name: outbound.dispatcher.counters[n])
+
+
+@router.command("metrics")
+def metrics_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    text = metrics.summary() or "no data yet"
+    if len(text) > 3900:
+        text = text[:3900] + "\n…"
+    bot.send_message(message.chat.id, f"📈 <b>Metrics</b>\n\n<pre>{escape(text)}</pre>", parse_mode="HTML")
+
+
+loop_monitor = diagnostics.LoopMonitor(telethon_loop, threshold=LOOP_LAG_THRESHOLD_MS / 1000)
+diagnostics.register_executor("otp-delivery", session_manager._delivery_executor)
+diagnostics.register_executor("otp-followup", session_manager._followup_executor)
+diagnostics.register_executor("async-db", async_db.executor)
+diagnostics.register_executor("admin-op", _admin_op_executor)
+if RUNTIME == "asyncio":
+    diagnostics.register_executor("handler", workers.executor)
+
+
+@router.command("health")
+def health_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    text = diagnostics.report(loop_monitor)
+    if len(text) > 3900:
+        text = text[:3900] + "\n…"
+    bot.send_message(message.chat.id, f"🩺 <b>Runtime Health</b>\n\n<pre>{escape(text)}</pre>", parse_mode="HTML")
+
+
+@router.command("dbstats")
+def dbstats_cmd(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    if not db_profiler.enabled():
+        bot.send_message(message.chat.id, "DB profiling is off. Set DB_PROFILE = True in config.py and restart.")
+        return
+    if message.text.split()[-1] == "reset":
+        db_profiler.reset()
+        bot.send_message(message.chat.id, "🗑 DB stats cleared.")
+        return
+    text = db_profiler.report()
+    if len(text) > 3900:
+        text = text[:3900] + "\n…"
+    bot.send_message(message.chat.id, f"🗄 <b>DB Stats</b>\n\n<pre>{escape(text)}</pre>", parse_mode="HTML")
+
+
 # ─────────────────────── STARTUP ──────────────────────
 
+router.attach(bot)
+
+
 def run_telethon_loop():
     asyncio.set_event_loop(telethon_loop)
     telethon_loop.run_forever()
 
 
+def run_webhook(block: bool = True):
+    if not WEBHOOK_SECRET:
+        raise SystemExit("UPDATE_MODE = \"webhook\" needs WEBHOOK_SECRET set in config.py")
+    server = webhook_server.WebhookServer(bot, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+    bot.remove_webhook()
+    bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, max_connections=100)
+    if block:
+        server.serve_forever()
+    else:
+        return server.start()
+
+
+def run_cluster():
+    """CLUSTER = True: share the DB with the other workers; singletons run on whichever holds their lease."""
+    if RUNTIME == "asyncio" or len(shops.registry) > 1:
+        raise SystemExit("CLUSTER = True needs RUNTIME = \"threads\" and a single shop")
+    broadcast.holder = node.worker_id
+    ingest  = cluster.Ingest(bot, (lambda: run_webhook(block=False)) if UPDATE_MODE == "webhook" else None)
+    sweeper = cluster.Sweeper(node)
+    monitor = {}
+
+    def start_ton_monitor():
+        # Taking over: the last page may hold deposits the previous leader never saw
+        monitor["future"] = asyncio.run_coroutine_threadsafe(
+            ton_monitor.start_monitoring(bot, skip_existing=False), telethon_loop)
+
+    def on_rebalance(index, workers):
+        # Users moved between workers; each worker gets its share of Telegram's global limit
+        states.drop_cache()
+        outbound.dispatcher.global_bucket.rate = outbound.GLOBAL_RATE / workers
+        outbound.dispatcher.global_bucket.capacity = outbound.GLOBAL_RATE / workers
+
+    node.on_rebalance.append(on_rebalance)
+    node.singleton("ingest", ingest.start, ingest.stop)
+    node.singleton("ton-monitor", start_ton_monitor, lambda: monitor.pop("future").cancel())
+    node.singleton("sweeper", sweeper.start, sweeper.stop)
+    resumer = broadcast.Resumer(bot)
+    node.singleton("broadcast", resumer.start, resumer.stop)
+    if ARCHIVE_AFTER_DAYS:
+        node.singleton("archiver", archiver.start, archiver.stop)
+    if BACKUP_INTERVAL:
+        node.singleton("backup", backups.start, backups.stop)
+    workers.start()
+    node.start()
+    cluster.Consumer(node, workers).start()
+    logger.info(f"✅ Bot started! (cluster worker {node.worker_id}, {UPDATE_MODE})")
+    threading.Event().wait()
+
+
+def run_shops():
+    """SHOPS: each shop long-polls with its own token; all feed the shared update workers."""
+    if RUNTIME == "asyncio" or UPDATE_MODE == "webhook":
+        raise SystemExit("SHOPS needs UPDATE_MODE = \"polling\" and RUNTIME = \"threads\"")
+    workers.start()
+    for shop in shops.all():
+        shop.bot.process_new_updates = functools.partial(workers.submit, process=shop.process)
+        shop.bot.remove_webhook()
+        threading.Thread(target=shop.run, args=(shop.bot.infinity_polling,),
+                         name=f"polling-{shop.name}", daemon=True).start()
+    logger.info(f"✅ Bot started! ({len(shops.registry)} shops: {', '.join(shops.registry)})")
+    threading.Event().wait()
+
+
+def run_asyncio():
+    """RUNTIME = "asyncio": the main thread runs telethon_loop for everything."""
+    asyncio.set_event_loop(telethon_loop)
+    if UPDATE_MODE == "webhook":
+        run_webhook(block=False)
+        telethon_loop.run_forever()
+    else:
+        bot.remove_webhook()
+        telethon_loop.run_until_complete(workers.poll())
+
+
 if __name__ == "__main__":
-    db.init_db()
-    loop_thread = threading.Thread(target=run_telethon_loop, daemon=True)
-    loop_thread.start()
-    asyncio.run_coroutine_threadsafe(ton_monitor.start_monitoring(bot), telethon_loop)
-    logger.info("✅ Bot started!")
-    bot.infinity_polling()
+    if DB_PROFILE:
+        db_profiler.enable(DB_SLOW_MS)
+    if TRACEMALLOC:
+        diagnostics.start_tracemalloc()
+    for shop in shops.all():
+        shop.run(db.init_db)
+    if METRICS_PORT:
+        # Cluster workers on one machine take the next free port up from METRICS_PORT
+        port = METRICS_PORT
+        while True:
+            try:
+                metrics.serve(METRICS_LISTEN, port)
+                break
+            except OSError:
+                if not CLUSTER or port - METRICS_PORT >= 63:
+                    raise
+                port += 1
+    for shop in shops.all():
+        outbound.dispatcher.install(shop.bot)
+        shop.run(shop.states.start_persistence, shared=CLUSTER)
+    if RUNTIME != "asyncio":
+        threading.Thread(target=run_telethon_loop, daemon=True).start()
+    loop_monitor.start()
+    if CLUSTER:
+        run_cluster()
+    for shop in shops.all():
+        shop.run(broadcast.Resumer(shop.bot).start)
+        # Queued until the loop runs, whichever thread that ends up being; the task keeps the shop
+        shop.run(asyncio.run_coroutine_threadsafe, ton_monitor.start_monitoring(shop.bot), telethon_loop)
+    if ARCHIVE_AFTER_DAYS:
+        archiver.start()
+    if BACKUP_INTERVAL:
+        backups.start()
+    if len(shops.registry) > 1:
+        run_shops()
+    workers.start().install()
+    logger.info(f"✅ Bot started! ({UPDATE_MODE}, {RUNTIME})")
+    if RUNTIME == "asyncio":
+        run_asyncio()
+    elif UPDATE_MODE == "webhook":
+        run_webhook()
+    else:
+        bot.remove_webhook()
+        bot.infinity_polling()
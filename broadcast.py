@@ -0,0 +1,307 @@
+"""
+Broadcast Engine
+----------------
+Sends an admin broadcast to every reachable user in the background.
+
+- the job (text, entities, cursor, counters) lives in broadcast_jobs and is
+  saved as each send finishes, so a crash or restart resumes right after
+  the last recipient whose send (and every one before it) finished
+  (resume_pending)
+- a job is sent by one process at a time: _launch claims it in the DB
+  (holder + lease_until), every progress save renews the lease and only
+  succeeds while the claim holds, and a process that loses it stops.
+  Resumer re-claims jobs whose holder died once the lease runs out; in
+  cluster mode it runs on the "broadcast" leader, and stepping down hands
+  this process's jobs back (handover) for the next leader to resume
+- recipients are read a page at a time with keyset pagination on
+  telegram_id instead of loading every user through get_all_users()
+- BROADCAST_CONCURRENCY sender threads share one global token bucket at
+  BROADCAST_RATE msg/s (Telegram allows ~30/s for the whole bot)
+- sends go through the outbound dispatcher at BROADCAST priority, so OTPs
+  and receipts overtake them; a 429 that outlives the dispatcher's own
+  retries pauses the bucket for retry_after and the message is retried
+- 403 (bot blocked / user deactivated) marks the user blocked; later
+  broadcasts skip them until they write to the bot again
+- one progress message is edited in place at most every PROGRESS_INTERVAL s
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+import database as db
+import outbound
+import shops
+from config import BROADCAST_RATE, BROADCAST_CONCURRENCY
+from emoji_engine import render
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE         = 200
+PROGRESS_INTERVAL = 3.0
+MAX_ATTEMPTS      = 4
+LEASE_TTL         = 60     # seconds a claim outlives its last save; saved at least every LEASE_TTL / 3
+
+SENT, FAILED, BLOCKED, SKIPPED = "sent", "failed", "blocked", "skipped"
+
+# Shared by every broadcast in this process
+bucket = TokenBucket(BROADCAST_RATE)
+
+# { job_id: Broadcast } — jobs running in this process
+running = {}
+
+# Claims are taken as this; run_cluster sets the cluster's worker id
+holder = f"{socket.gethostname()}-{os.getpid()}"
+
+
+def retry_after(e: ApiTelegramException) -> float:
+    return float((e.result_json.get("parameters") or {}).get("retry_after", 5))
+
+
+class Broadcast:
+    def __init__(self, bot, job: dict):
+        self.bot       = bot
+        self.job       = job
+        self.id        = job["id"]
+        self.entities  = json.loads(job["entities"]) if job["entities"] else None
+        self.stopped   = threading.Event()
+        self.handover  = False     # stopping after this page for another process to resume
+        self.lost      = False     # claim lost or job cancelled elsewhere
+        self.throttled = 0
+        self.run_sent  = 0
+        self.started   = time.perf_counter()
+        self._last_progress = 0.0
+        self._saved_at = time.time()
+
+    # ── Sending ──────────────────────────────────────────
+
+    def _send(self, uid: int) -> str:
+        for attempt in range(MAX_ATTEMPTS):
+            bucket.acquire()
+            # A handover lets the page finish: skipping sends out of order would
+            # leave sent recipients past the cursor, to be sent again
+            if self.stopped.is_set() and not self.handover:
+                return SKIPPED
+            try:
+                with outbound.priority(outbound.BROADCAST):
+                    self.bot.send_message(uid, self.job["text"], entities=self.entities)
+                return SENT
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    self.throttled += 1
+                    bucket.pause(retry_after(e))
+                    continue
+                if e.error_code == 403:
+                    return BLOCKED
+                return FAILED
+            except Exception as e:
+                # Network hiccup — back off and retry
+                logger.warning(f"Broadcast {self.id}: send to {uid} failed ({e}), attempt {attempt + 1}")
+                time.sleep(1 + attempt)
+        return FAILED
+
+    def run(self):
+        job = self.job
+        try:
+            with ThreadPoolExecutor(max_workers=BROADCAST_CONCURRENCY,
+                                    thread_name_prefix=f"broadcast-{self.id}") as pool:
+                while not self.stopped.is_set():
+                    page = db.get_broadcast_recipients(job["cursor"], PAGE_SIZE)
+                    if not page:
+                        break
+                    self._send_page(pool, page)
+        except Exception as e:
+            logger.error(f"Broadcast {self.id} crashed: {e}", exc_info=True)
+            try:
+                self._save()
+                db.release_broadcast(self.id, holder)
+            except Exception as e:
+                logger.error(f"Broadcast {self.id}: saving progress failed: {e}")
+            return   # stays 'running' → resumed by the next Resumer pass
+        finally:
+            running.pop(self.id, None)
+
+        if self.handover and self._save():
+            db.release_broadcast(self.id, holder)
+            logger.info(f"Broadcast {self.id} handed over at {job['cursor']}")
+            return
+        status = "cancelled" if self.stopped.is_set() else "done"
+        if not self.lost and self._save(status=status, finished_at=datetime.now().strftime("%Y-%m-%d %H:%M")):
+            self._finish(status)
+        elif db.get_broadcast(self.id)["status"] == "cancelled":
+            self._finish("cancelled")   # stopped from another process
+        else:
+            logger.warning(f"Broadcast {self.id}: claim lost, another process continues it")
+
+    def _send_page(self, pool, page: list):
+        job     = self.job
+        futures = {pool.submit(shops.bind(self._send), uid): uid for uid in page}
+        results = {}
+        done    = 0     # page[:done] is finished and counted
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=LEASE_TTL / 3, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                results[futures[future]] = result
+                if result == SENT:
+                    self.run_sent += 1
+            # The cursor moves over the finished prefix only, so a restart resends
+            # nothing already sent; a skipped send (stopped) is not finished
+            blocked = []
+            start   = done
+            while done < len(page) and results.get(page[done], SKIPPED) != SKIPPED:
+                uid = page[done]
+                result = results.pop(uid)
+                job[result] += 1
+                if result == BLOCKED:
+                    blocked.append(uid)
+                job["cursor"] = uid
+                done += 1
+            db.mark_users_blocked(blocked)
+            # Even with no progress (a send held up by a long 429) the save keeps the claim alive
+            if done > start or time.time() - self._saved_at > LEASE_TTL / 3:
+                self._save()
+            if done > start:
+                self._progress()
+
+    def _save(self, **fields) -> bool:
+        """Save progress and renew the claim; a lost claim stops the job."""
+        job = self.job
+        saved = db.save_broadcast(self.id, holder, time.time() + LEASE_TTL, cursor=job["cursor"],
+                                  sent=job["sent"], failed=job["failed"], blocked=job["blocked"], **fields)
+        self._saved_at = time.time()
+        if not saved and not self.lost:
+            self.lost = True
+            self.stopped.set()
+        return saved
+
+    # ── Progress reporting ───────────────────────────────
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.run_sent / elapsed if elapsed > 0 else 0.0
+
+    def _progress(self):
+        now = time.perf_counter()
+        if now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        job  = self.job
+        done = job["sent"] + job["failed"] + job["blocked"]
+        pct  = done * 100 // job["total"] if job["total"] else 100
+        try:
+            self.bot.edit_message_text(
+                f"📤 <b>Broadcast #{self.id}</b> — {done}/{job['total']} ({pct}%)\n\n"
+                f"✅ Sent: {job['sent']}   ❌ Failed: {job['failed']}   🚫 Blocked: {job['blocked']}\n"
+                f"⚡ {self.rate():.1f} msg/s" + (f"   ⏳ throttled {self.throttled}x" if self.throttled else ""),
+                job["admin_chat_id"], job["progress_message_id"],
+                parse_mode="HTML",
+                reply_markup=stop_kb(self.id)
+            )
+        except Exception as e:
+            logger.debug(f"Broadcast {self.id}: progress edit skipped ({e})")
+
+    def _finish(self, status: str):
+        job = self.job
+        plain, entities = render(
+            "[E:✅] **Broadcast {title}**\n\n"
+            "[E:📈] Sent: **{sent}**\n"
+            "❌ Failed: **{failed}**\n"
+            "🚫 Blocked: **{blocked}** (skipped from now on)\n"
+            "[E:⏱] Rate: **{rate:.1f} msg/s**",
+            title="Complete" if status == "done" else "Stopped",
+            sent=job["sent"], failed=job["failed"], blocked=job["blocked"], rate=self.rate()
+        )
+        try:
+            self.bot.edit_message_text(plain, job["admin_chat_id"], job["progress_message_id"], entities=entities)
+        except Exception:
+            self.bot.send_message(job["admin_chat_id"], plain, entities=entities)
+        logger.info(f"Broadcast {self.id} {status}: {job['sent']} sent, {self.rate():.1f} msg/s")
+
+
+def stop_kb(job_id: int):
+    m = types.InlineKeyboardMarkup()
+    m.add(types.InlineKeyboardButton("⏹ Stop Broadcast", callback_data=f"bcast_stop_{job_id}"))
+    return m
+
+
+def _launch(bot, job_id: int):
+    """Claim the job and start sending it; None if another process holds it."""
+    if job_id in running or not db.claim_broadcast(job_id, holder, time.time() + LEASE_TTL, time.time()):
+        return None
+    job = db.get_broadcast(job_id)
+    b = running[job_id] = Broadcast(bot, job)
+    threading.Thread(target=shops.bind(b.run), name=f"broadcast-{job_id}", daemon=True).start()
+    return b
+
+
+def start(bot, admin_chat_id: int, text: str, entities: list) -> int:
+    """Create a job for all reachable users and start sending it in the background."""
+    total  = db.count_broadcast_recipients()
+    job_id = db.create_broadcast(admin_chat_id, text, json.dumps(entities) if entities else "", total)
+    msg    = bot.send_message(admin_chat_id, f"📤 <b>Broadcast #{job_id}</b> — sending to {total} users...",
+                              parse_mode="HTML", reply_markup=stop_kb(job_id))
+    db.update_broadcast(job_id, progress_message_id=msg.message_id)
+    _launch(bot, job_id)
+    return job_id
+
+
+def stop(job_id: int) -> bool:
+    b = running.get(job_id)
+    if b is None:
+        # Sent by another process (or nobody yet): it stops at its next save
+        return db.cancel_broadcast(job_id)
+    b.stopped.set()
+    return True
+
+
+def handover():
+    """Stop every job sending in this process, leaving them 'running' for the next holder."""
+    for b in list(running.values()):
+        b.handover = True
+        b.stopped.set()
+
+
+def resume_pending(bot):
+    """Claim and restart running broadcasts that no live process holds (left by a crash or restart)."""
+    for job_id in db.get_running_broadcasts():
+        if job_id not in running and _launch(bot, job_id):
+            logger.info(f"Resuming broadcast {job_id}")
+
+
+class Resumer:
+    """resume_pending() now and every LEASE_TTL, so a job whose holder died is picked up once its claim runs out."""
+
+    def __init__(self, bot):
+        self.bot   = bot
+        self._stop = None
+
+    def start(self):
+        self._stop = threading.Event()
+        threading.Thread(target=shops.bind(self._run), args=(self._stop,), name="broadcast-resumer",
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+        handover()
+
+    def _run(self, stop: threading.Event):
+        while True:
+            try:
+                resume_pending(self.bot)
+            except Exception as e:
+                logger.error(f"Broadcast resume failed: {e}", exc_info=True)
+            if stop.wait(LEASE_TTL):
+                return
@@ -0,0 +1,341 @@
+"""
+Cluster
+-------
+Multi-process mode (config.CLUSTER): several bot workers on one machine
+share bot_data.db (WAL) instead of one process doing everything.
+
+- leases: named, time-limited locks in the leases table. Every worker
+  renews "worker:<id>" as its heartbeat — the unexpired ones are the
+  membership. Singletons (update ingest, TON deposit monitor, sweeper)
+  each have a lease too; the worker holding it runs the job, and when
+  that worker dies the lease expires and another one takes over
+- ingest: the leader polls getUpdates (or serves the webhook) and appends
+  every update to update_queue; update_id is the key, so an update seen
+  twice across a handover is stored once
+- consumer: every worker claims updates of its share of users
+  (user_id % live workers) and runs them on its UpdateWorkers. A user's
+  updates are claimed one at a time, oldest first, so they stay in order
+  even while users move between workers; a user sticks to one worker
+  while membership is stable, which keeps in-memory flows (admin logins,
+  OTP listeners) working
+- sweeper: hands back updates claimed by dead workers, prunes old queue
+  rows and releases reservations whose OTP listener died with its worker
+
+Conversation state is shared through StateStore's shared mode and
+reservations are atomic in database.py.
+
+    node = cluster.Cluster(WORKER_ID).singleton("sweeper", sweeper.start, sweeper.stop)
+    node.start()
+    cluster.Consumer(node, workers).start()
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from telebot import types
+
+import database as db
+import metrics
+from update_workers import update_user_id
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL         = 15            # seconds a lease outlives its last renewal
+WORKER_PREFIX     = "worker:"
+CLAIM_WAIT        = 0.05          # idle wait between claims when the queue is empty
+KEEP_DONE         = 24 * 3600     # finished updates remembered to drop re-polled ids
+SWEEP_INTERVAL    = 30
+STALE_RESERVATION = 10 * 60       # OTP listeners give up after 5 minutes
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def update_payload(update) -> str:
+    """JSON for a parsed Update — each parsed field keeps the dict it came from in .json."""
+    data = {"update_id": update.update_id}
+    for field, value in vars(update).items():
+        raw = getattr(value, "json", None)
+        if isinstance(raw, dict):
+            data[field] = raw
+    return json.dumps(data)
+
+
+class Singleton:
+    def __init__(self, name: str, start, stop):
+        self.name       = name
+        self.start      = start
+        self.stop       = stop
+        self.running    = False
+        self.renewed_at = 0.0
+
+
+class Cluster:
+    def __init__(self, worker_id: str = None, ttl: float = LEASE_TTL):
+        self.worker_id  = worker_id or default_worker_id()
+        self.ttl        = ttl
+        self.singletons = {}
+        self.members    = []          # live worker ids, sorted — index in it = partition
+        self.index      = 0
+        self.rebalances = 0
+        self.on_rebalance = []        # callbacks (index, workers)
+        self._stop      = threading.Event()
+        self._thread    = None
+        metrics.gauge("cluster_workers", "Live workers sharing the DB", fn=lambda: len(self.members))
+        metrics.gauge("cluster_singletons", "Singletons this worker is running",
+                      fn=lambda: sum(s.running for s in self.singletons.values()))
+
+    def singleton(self, name: str, start, stop):
+        """Run start() while this worker holds lease `name`, stop() when it loses it."""
+        self.singletons[name] = Singleton(name, start, stop)
+        return self
+
+    # ── Lifecycle ────────────────────────────────────────
+
+    def start(self):
+        self._beat()    # joined before the first claim
+        self._thread = threading.Thread(target=self._run, name="cluster-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.ttl)
+        for s in self.singletons.values():
+            if s.running:
+                self._step_down(s)
+            db.release_lease(s.name, self.worker_id)
+        db.release_lease(WORKER_PREFIX + self.worker_id, self.worker_id)
+
+    def partition(self) -> tuple:
+        """(index, workers): this worker handles users with user_id % workers == index."""
+        return self.index, max(len(self.members), 1)
+
+    # ── Heartbeat ────────────────────────────────────────
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self._beat()
+            except Exception as e:
+                logger.error(f"Cluster heartbeat failed: {e}", exc_info=True)
+
+    def _beat(self):
+        now = time.time()
+        # A heartbeat that stalled past the TTL may already have been replaced
+        for s in self.singletons.values():
+            if s.running and now - s.renewed_at > self.ttl:
+                logger.warning(f"Lease {s.name} lapsed, stepping down")
+                self._step_down(s)
+
+        db.acquire_lease(WORKER_PREFIX + self.worker_id, self.worker_id, self.ttl, now)
+        members = sorted(db.get_leases(now, WORKER_PREFIX).values())
+        if self.worker_id not in members:
+            members = sorted(members + [self.worker_id])
+        if members != self.members:
+            self.members = members
+            self.index = members.index(self.worker_id)
+            self.rebalances += 1
+            logger.info(f"Cluster: {len(members)} worker(s), {self.worker_id} has partition {self.index}")
+            for callback in self.on_rebalance:
+                callback(self.index, len(members))
+
+        for s in self.singletons.values():
+            held = db.acquire_lease(s.name, self.worker_id, self.ttl, now)
+            if held:
+                s.renewed_at = now
+                if not s.running:
+                    logger.info(f"Cluster: {self.worker_id} is now running {s.name}")
+                    s.running = True
+                    s.start()
+            elif s.running:
+                self._step_down(s)
+
+    def _step_down(self, s: Singleton):
+        s.running = False
+        try:
+            s.stop()
+        except Exception as e:
+            logger.error(f"Stopping {s.name} failed: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "worker": self.worker_id,
+            "members": list(self.members),
+            "partition": self.partition(),
+            "rebalances": self.rebalances,
+            "leaders": {name: holder for name, holder in db.get_leases(now).items()
+                        if not name.startswith(WORKER_PREFIX)},
+            "queue": db.count_queued_updates(),
+        }
+
+
+class Ingest:
+    """The update source, run by the "ingest" leader: getUpdates polling, or the
+    webhook server when `webhook` (a factory returning a started WebhookServer) is given."""
+
+    def __init__(self, bot, webhook=None):
+        self.bot      = bot
+        self.webhook  = webhook
+        self.enqueued = 0
+        self.repeated = 0
+        self._server  = None
+        self._poller  = None
+        bot.process_new_updates = self.enqueue
+
+    def enqueue(self, updates: list):
+        """Drop-in for TeleBot.process_new_updates: store the batch for the consumers."""
+        now  = time.time()
+        rows = []
+        for update in updates:
+            if update.update_id > self.bot.last_update_id:
+                self.bot.last_update_id = update.update_id
+            rows.append((update.update_id, update_user_id(update), update_payload(update), now))
+        added = db.enqueue_updates(rows)
+        self.enqueued += added
+        self.repeated += len(rows) - added
+
+    def start(self):
+        if self.webhook is not None:
+            self._server = self.webhook()
+            return
+        previous = self._poller
+        self._poller = threading.Thread(target=self._poll, args=(previous,), name="ingest-poller", daemon=True)
+        self._poller.start()
+
+    def _poll(self, previous):
+        # A poller from an earlier term may still sit in its last long poll
+        if previous is not None:
+            previous.join()
+        self.bot.remove_webhook()
+        self.bot.infinity_polling()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+        else:
+            self.bot.stop_polling()
+
+
+class Consumer:
+    """Claims this worker's share of update_queue, runs it on UpdateWorkers and
+    marks each update done once its handler returned."""
+
+    def __init__(self, cluster: Cluster, workers, capacity: int = None):
+        self.cluster  = cluster
+        self.workers  = workers
+        self.capacity = capacity or 4 * len(workers.queues)
+        self.inflight = set()
+        self.claimed  = 0
+        self.queue_wait = metrics.histogram("cluster_queue_wait_seconds",
+                                            "Time an update waited in update_queue before a worker claimed it")
+        self._done    = []
+        self._lock    = threading.Lock()
+        self._wake    = threading.Event()
+        self._stop    = threading.Event()
+        self._thread  = None
+        workers.on_done = self._on_done
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cluster-consumer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _on_done(self, update):
+        with self._lock:
+            self._done.append(update.update_id)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                idle = self._step()
+            except Exception as e:
+                logger.error(f"Update consumer failed: {e}", exc_info=True)
+                idle = True
+            if idle:
+                self._wake.wait(CLAIM_WAIT)
+            self._wake.clear()
+
+    def _step(self) -> bool:
+        """Ack finished updates and claim more; True when there was nothing to do."""
+        with self._lock:
+            done, self._done = self._done, []
+        if done:
+            db.finish_updates(done, time.time())
+            self.inflight.difference_update(done)
+
+        room = self.capacity - len(self.inflight)
+        if room <= 0:
+            return True
+        index, workers = self.cluster.partition()
+        rows = db.claim_updates(self.cluster.worker_id, index, workers, room)
+        now = time.time()
+        updates = []
+        for update_id, payload, enqueued_at in rows:
+            self.queue_wait.observe(now - enqueued_at)
+            try:
+                updates.append(types.Update.de_json(payload))
+                self.inflight.add(update_id)
+            except Exception as e:
+                logger.warning(f"Dropping malformed queued update {update_id}: {e}")
+                db.finish_updates([update_id], now)
+        self.claimed += len(updates)
+        if updates:
+            self.workers.submit(updates)
+        return not rows and not done
+
+    def stats(self) -> dict:
+        return {**self.workers.stats(), "claimed": self.claimed, "inflight": len(self.inflight),
+                "cluster_wait": self.queue_wait.snapshot()}
+
+
+class Sweeper:
+    """Cluster housekeeping, run by the "sweeper" leader every SWEEP_INTERVAL seconds."""
+
+    def __init__(self, cluster: Cluster, interval: float = SWEEP_INTERVAL):
+        self.cluster  = cluster
+        self.interval = interval
+        self.counters = {"requeued": 0, "pruned": 0, "released": 0}
+        self._stop    = None
+
+    def start(self):
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), name="cluster-sweeper", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Cluster sweep failed: {e}", exc_info=True)
+
+    def sweep(self):
+        now = time.time()
+        requeued = db.requeue_updates(self.cluster.members)
+        pruned   = db.prune_updates(now - KEEP_DONE)
+        cutoff   = datetime.fromtimestamp(now - STALE_RESERVATION).strftime("%Y-%m-%d %H:%M")
+        released = db.release_stale_reservations(cutoff)
+        self.counters["requeued"] += requeued
+        self.counters["pruned"]   += pruned
+        self.counters["released"] += released
+        if requeued or released:
+            logger.info(f"Cluster sweep: {requeued} update(s) requeued, {released} reservation(s) released")
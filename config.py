@@ -12,11 +12,101 @@ BOT_WALLET = "UQDMJGcR5hdy06f1lJIgZr17kXKbfqeePIx279I9cupQPqx9"
 
 TON_API_KEY = "640b4486094ffd81a5e49a4bb7c599fb55e8bfa3d391f140fb02b12b10c032ca"
 
+# ── Shops ──────────────────────────────────────────────
+# Host several storefronts in this one process (polling, RUNTIME "threads").
+# Each needs its own token, wallet and DB file; the admin is ADMIN_ID for all.
+# Empty → one shop from BOT_TOKEN / BOT_WALLET / bot_data.db. Example:
+# SHOPS = [
+#     {"name": "main",   "token": BOT_TOKEN,  "wallet": BOT_WALLET, "db_path": "bot_data.db"},
+#     {"name": "second", "token": "123:ABC…", "wallet": "UQ…",      "db_path": "second.db",
+#      "ton_api_key": "…"},   # optional, defaults to TON_API_KEY
+# ]
+SHOPS = []
+
 # ── Telegram API (for Telethon userbot) ────────────────
 # Get these from https://my.telegram.org → App Configuration
 API_ID = 21752358          # Replace with your api_id (integer)
 API_HASH = "fb46a136fed4a4de27ab057c7027fec3"       # Replace with your api_hash (string)
 
+# ── Update delivery ────────────────────────────────────
+# "polling" (getUpdates) or "webhook" (Telegram POSTs to WEBHOOK_URL)
+UPDATE_MODE = "polling"
+
+# Public HTTPS URL Telegram posts to; a reverse proxy forwards it to
+# WEBHOOK_LISTEN:WEBHOOK_PORT + WEBHOOK_PATH
+WEBHOOK_URL    = "https://example.com/telegram/webhook"
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT   = 8080
+WEBHOOK_PATH   = "/telegram/webhook"
+# Random 1-256 chars of A-Z a-z 0-9 _ - ; Telegram echoes it in a header
+WEBHOOK_SECRET = ""
+
+# ── Update processing ──────────────────────────────────
+# Handler threads; each user's updates always run in order on one of them
+UPDATE_WORKERS = 8
+# "threads": polling thread + UPDATE_WORKERS worker threads + a Telethon loop thread
+# "asyncio": one event loop runs polling, dispatch, Telethon and the TON monitor;
+#            handlers still run on a pool of UPDATE_WORKERS threads (they block
+#            on SQLite and the Bot API), and sends on outbound's lane threads
+RUNTIME = "threads"
+
+# ── Cluster ────────────────────────────────────────────
+# Run several `python bot.py` processes on one machine sharing bot_data.db:
+# leader-elected polling / TON monitor, updates spread over the workers.
+# Needs RUNTIME = "threads"
+CLUSTER = False
+# Unique per process; "" → hostname-pid
+WORKER_ID = ""
+# Seconds before a dead worker's singletons move to another worker
+CLUSTER_LEASE_TTL = 15
+
+# ── Metrics ────────────────────────────────────────────
+# Prometheus scrape endpoint (GET /metrics); keep it on localhost. 0 disables
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT   = 9108
+
+# ── Diagnostics ────────────────────────────────────────
+# Event loop blocked longer than this → warning with the blocking stack
+LOOP_LAG_THRESHOLD_MS = 100
+# Track allocations for /health (costs memory and some CPU; debugging only)
+TRACEMALLOC = False
+
+# ── DB profiling ───────────────────────────────────────
+# Times every database.py call and SQL statement (admin /dbstats); small
+# overhead per query, so leave off unless investigating
+DB_PROFILE = False
+# Statements slower than this are logged with their EXPLAIN QUERY PLAN
+DB_SLOW_MS = 50
+
+# ── Broadcast ──────────────────────────────────────────
+# Telegram allows ~30 msg/s per bot in total; leave room for normal traffic
+BROADCAST_RATE        = 25
+BROADCAST_CONCURRENCY = 8
+
+# ── Conversation state ─────────────────────────────────
+# Idle seconds before an unfinished flow (e.g. "enter amount") is forgotten
+STATE_TTL         = 30 * 60
+STATE_MAX_ENTRIES = 50_000
+
+# ── Archive ────────────────────────────────────────────
+# Sold accounts and transactions older than this move to bot_data.archive.db
+# (still shown in purchase history and totals). 0 disables; e.g. 30 to opt in.
+# A DB created before archiving existed only hands freed pages back to the
+# filesystem after a one-time `python archive.py vacuum` (bot stopped)
+ARCHIVE_AFTER_DAYS = 0
+# Seconds between archive runs
+ARCHIVE_INTERVAL   = 6 * 3600
+
+# ── Backup ─────────────────────────────────────────────
+# Online backups (backup.py) of each shop's DB and archive, gzipped here
+BACKUP_DIR      = "backups"
+# Seconds between scheduled backups, e.g. 24 * 3600 to opt in. 0 disables
+# (`python backup.py run` still works). Each run needs free disk in BACKUP_DIR
+# of about 2× the DB: an uncompressed temp copy, then the gzipped backup
+BACKUP_INTERVAL = 0
+# Newest backups kept per DB file
+BACKUP_KEEP     = 7
+
 # ── Pricing ────────────────────────────────────────────
 ACCOUNT_PRICE_USD = 4.99
 
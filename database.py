@@ -1,12 +1,30 @@
+import os
+import pathlib
 import sqlite3
+import zlib
 from datetime import datetime
 
 DB_PATH = "bot_data.db"
 
+# Seconds a connection waits for another writer's lock before "database is locked"
+BUSY_TIMEOUT = 30
+
+# Connection class used by _con(); db_profiler swaps in a timing subclass
+_connection_factory = sqlite3.Connection
+
+
+def _db_path() -> str:
+    """File _con() opens; shops.py swaps in the current shop's DB."""
+    return DB_PATH
+
 
 def init_db():
-    con = sqlite3.connect(DB_PATH)
+    con = sqlite3.connect(_db_path())
     cur = con.cursor()
+    # Lets archive.py hand freed pages back with PRAGMA incremental_vacuum. Only
+    # takes effect before the first table exists; older DBs switch on their first
+    # archive run (database.reclaim_space)
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
     cur.executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY,
@@ -52,18 +70,82 @@ def init_db():
             rewarded INTEGER DEFAULT 0,
             created_at TEXT
         );
+        CREATE TABLE IF NOT EXISTS user_states (
+            user_id INTEGER PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            expires_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_chat_id INTEGER,
+            progress_message_id INTEGER,
+            text TEXT,
+            entities TEXT,
+            status TEXT DEFAULT 'running',
+            cursor INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            created_at TEXT,
+            finished_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT,
+            expires_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS update_queue (
+            update_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            payload TEXT,
+            status TEXT DEFAULT 'queued',
+            claimed_by TEXT,
+            enqueued_at REAL,
+            finished_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_update_queue_status ON update_queue (status, update_id);
+        CREATE INDEX IF NOT EXISTS idx_update_queue_open ON update_queue (user_id, update_id) WHERE status != 'done';
     """)
+    # WAL lets readers run alongside the one writer — needed once several
+    # processes share the file. The mode is stored in the DB, so once is enough.
+    cur.execute("PRAGMA journal_mode=WAL")
+    # Migrations for databases created before these columns existed
+    user_cols = {r[1] for r in cur.execute("PRAGMA table_info(users)")}
+    if "blocked" not in user_cols:
+        cur.execute("ALTER TABLE users ADD COLUMN blocked INTEGER DEFAULT 0")
+    job_cols = {r[1] for r in cur.execute("PRAGMA table_info(broadcast_jobs)")}
+    if "holder" not in job_cols:
+        # Which process is sending the job, until lease_until (broadcast.py)
+        cur.execute("ALTER TABLE broadcast_jobs ADD COLUMN holder TEXT")
+        cur.execute("ALTER TABLE broadcast_jobs ADD COLUMN lease_until REAL DEFAULT 0")
     cur.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('price_ton', '0.1')")
     con.commit()
     con.close()
 
 
 def _con():
-    con = sqlite3.connect(DB_PATH)
+    con = sqlite3.connect(_db_path(), timeout=BUSY_TIMEOUT, factory=_connection_factory)
     con.row_factory = sqlite3.Row
     return con
 
 
+def archive_path() -> str:
+    """The current DB's cold-storage file: bot_data.db → bot_data.archive.db."""
+    root, ext = os.path.splitext(_db_path())
+    return f"{root}.archive{ext or '.db'}"
+
+
+def _attach_archive(con) -> bool:
+    """Attach the archive as `archive` for reads that include history; False if nothing was archived yet."""
+    path = archive_path()
+    if not os.path.exists(path):
+        return False
+    con.execute("ATTACH DATABASE ? AS archive", (path,))
+    return True
+
+
 # ─── USER FUNCTIONS ───────────────────────────────────
 
 def add_user(telegram_id: int, username: str):
@@ -72,6 +154,8 @@ def add_user(telegram_id: int, username: str):
         "INSERT OR IGNORE INTO users (telegram_id, username, balance_ton, joined_at) VALUES (?, ?, 0.0, ?)",
         (telegram_id, username, datetime.now().strftime("%Y-%m-%d %H:%M"))
     )
+    # Writing to us means they no longer block the bot
+    con.execute("UPDATE users SET blocked = 0 WHERE telegram_id = ? AND blocked = 1", (telegram_id,))
     con.commit()
     con.close()
 
@@ -92,17 +176,23 @@ def add_balance(telegram_id: int, amount: float):
 
 def get_user_purchase_count(telegram_id: int) -> int:
     con = _con()
-    row = con.execute("SELECT COUNT(*) as cnt FROM accounts WHERE buyer_id = ?", (telegram_id,)).fetchone()
+    sql = "SELECT COUNT(*) as cnt FROM accounts WHERE buyer_id = ?"
+    if _attach_archive(con):
+        sql = f"SELECT ({sql}) + (SELECT COUNT(*) FROM archive.sold_accounts WHERE buyer_id = ?) as cnt"
+        row = con.execute(sql, (telegram_id, telegram_id)).fetchone()
+    else:
+        row = con.execute(sql, (telegram_id,)).fetchone()
     con.close()
     return row["cnt"] if row else 0
 
 
 def get_user_purchases(telegram_id: int) -> list:
     con = _con()
-    rows = con.execute(
-        "SELECT phone, sold_at as purchased_at FROM accounts WHERE buyer_id = ? ORDER BY sold_at DESC",
-        (telegram_id,)
-    ).fetchall()
+    sql, params = "SELECT phone, sold_at as purchased_at FROM accounts WHERE buyer_id = ?", (telegram_id,)
+    if _attach_archive(con):
+        sql += " UNION ALL SELECT phone, sold_at FROM archive.sold_accounts WHERE buyer_id = ?"
+        params += (telegram_id,)
+    rows = con.execute(sql + " ORDER BY purchased_at DESC", params).fetchall()
     con.close()
     return [dict(r) for r in rows]
 
@@ -116,11 +206,16 @@ def get_user_count() -> int:
 
 def get_all_users() -> list:
     con = _con()
-    rows = con.execute("""
+    if _attach_archive(con):
+        archived = "SELECT buyer_id, COUNT(*) AS cnt FROM archive.sold_accounts GROUP BY buyer_id"
+    else:
+        archived = "SELECT NULL AS buyer_id, 0 AS cnt"
+    rows = con.execute(f"""
         SELECT u.telegram_id, u.username, u.balance_ton,
-               COUNT(a.id) as purchases
+               COUNT(a.id) + COALESCE(MAX(x.cnt), 0) as purchases
         FROM users u
         LEFT JOIN accounts a ON a.buyer_id = u.telegram_id
+        LEFT JOIN ({archived}) x ON x.buyer_id = u.telegram_id
         GROUP BY u.telegram_id
         ORDER BY u.joined_at DESC
     """).fetchall()
@@ -152,26 +247,39 @@ def reserve_account(buyer_id: int) -> dict | None:
     Reserve the next available account for buyer.
     Marks it as 'reserved' so nobody else can grab it.
     Does NOT deduct balance yet.
-    Returns account dict or None if nothing available.
+    Returns account dict or None if nothing available (or buyer already has one).
+
+    Pick and mark happen in one UPDATE … RETURNING, so two buyers — in
+    different threads or processes — can never be handed the same account.
     """
     con = _con()
+    # IMMEDIATE takes the write lock up front: a deferred transaction whose
+    # read snapshot went stale would fail with SQLITE_BUSY instead of waiting
+    con.execute("BEGIN IMMEDIATE")
     account = con.execute(
-        "SELECT * FROM accounts WHERE status = 'available' ORDER BY id ASC LIMIT 1"
+        """UPDATE accounts SET status = 'reserved'
+           WHERE id = (SELECT id FROM accounts WHERE status = 'available' ORDER BY id ASC LIMIT 1)
+           RETURNING *"""
     ).fetchone()
 
     if not account:
+        con.rollback()
         con.close()
         return None
 
     account = dict(account)
 
-    # Mark account as reserved
-    con.execute("UPDATE accounts SET status = 'reserved' WHERE id = ?", (account["id"],))
-    # Track the active purchase
-    con.execute(
-        "INSERT OR REPLACE INTO active_purchases (buyer_id, account_id, phone, reserved_at) VALUES (?, ?, ?, ?)",
-        (buyer_id, account["id"], account["phone"], datetime.now().strftime("%Y-%m-%d %H:%M"))
-    )
+    # Track the active purchase; a second one for the same buyer (double tap
+    # handled by two workers) fails here and releases the account again
+    try:
+        con.execute(
+            "INSERT INTO active_purchases (buyer_id, account_id, phone, reserved_at) VALUES (?, ?, ?, ?)",
+            (buyer_id, account["id"], account["phone"], datetime.now().strftime("%Y-%m-%d %H:%M"))
+        )
+    except sqlite3.IntegrityError:
+        con.rollback()
+        con.close()
+        return None
     con.commit()
     con.close()
     return account
@@ -184,8 +292,11 @@ def finalize_purchase(buyer_id: int) -> bool:
     Returns True on success.
     """
     con = _con()
-    row = con.execute("SELECT * FROM active_purchases WHERE buyer_id = ?", (buyer_id,)).fetchone()
+    con.execute("BEGIN IMMEDIATE")
+    # Claiming the row first makes a second, concurrent finalize a no-op
+    row = con.execute("DELETE FROM active_purchases WHERE buyer_id = ? RETURNING account_id", (buyer_id,)).fetchone()
     if not row:
+        con.rollback()
         con.close()
         return False
 
@@ -201,7 +312,6 @@ def finalize_purchase(buyer_id: int) -> bool:
         "INSERT INTO transactions (user_id, amount_ton, tx_hash, type, created_at) VALUES (?, ?, ?, 'purchase', ?)",
         (buyer_id, price, f"purchase_{account_id}_{buyer_id}", datetime.now().isoformat())
     )
-    con.execute("DELETE FROM active_purchases WHERE buyer_id = ?", (buyer_id,))
     con.commit()
     con.close()
     return True
@@ -213,14 +323,29 @@ def cancel_purchase(buyer_id: int):
     No balance is deducted.
     """
     con = _con()
-    row = con.execute("SELECT account_id FROM active_purchases WHERE buyer_id = ?", (buyer_id,)).fetchone()
+    con.execute("BEGIN IMMEDIATE")
+    row = con.execute("DELETE FROM active_purchases WHERE buyer_id = ? RETURNING account_id", (buyer_id,)).fetchone()
     if row:
-        con.execute("UPDATE accounts SET status = 'available' WHERE id = ?", (row["account_id"],))
-        con.execute("DELETE FROM active_purchases WHERE buyer_id = ?", (buyer_id,))
+        con.execute("UPDATE accounts SET status = 'available' WHERE id = ? AND status = 'reserved'",
+                    (row["account_id"],))
     con.commit()
     con.close()
 
 
+def release_stale_reservations(reserved_before: str) -> int:
+    """Cancel purchases reserved before a "%Y-%m-%d %H:%M" cutoff (their listener is gone)."""
+    con = _con()
+    con.execute("BEGIN IMMEDIATE")
+    rows = con.execute(
+        "DELETE FROM active_purchases WHERE reserved_at < ? RETURNING account_id", (reserved_before,)
+    ).fetchall()
+    con.executemany("UPDATE accounts SET status = 'available' WHERE id = ? AND status = 'reserved'",
+                    [(r["account_id"],) for r in rows])
+    con.commit()
+    con.close()
+    return len(rows)
+
+
 def get_reserved_account(buyer_id: int) -> dict | None:
     """Get the currently reserved account for a buyer."""
     con = _con()
@@ -236,17 +361,20 @@ def get_reserved_account(buyer_id: int) -> dict | None:
 
 # ─── ACCOUNT FUNCTIONS ───────────────────────────────
 
-def save_account(phone: str, password_2fa: str, session_string: str) -> bool:
-    try:
-        con = _con()
-        con.execute(
-            """INSERT INTO accounts (phone, password_2fa, session_string, status, added_at)
+_UPSERT_ACCOUNT = """INSERT INTO accounts (phone, password_2fa, session_string, status, added_at)
                VALUES (?, ?, ?, 'available', ?)
                ON CONFLICT(phone) DO UPDATE SET
                password_2fa=excluded.password_2fa,
                session_string=excluded.session_string,
                status='available',
-               added_at=excluded.added_at""",
+               added_at=excluded.added_at"""
+
+
+def save_account(phone: str, password_2fa: str, session_string: str) -> bool:
+    try:
+        con = _con()
+        con.execute(
+            _UPSERT_ACCOUNT,
             (phone, password_2fa, session_string, datetime.now().strftime("%Y-%m-%d %H:%M"))
         )
         con.commit()
@@ -257,6 +385,51 @@ def save_account(phone: str, password_2fa: str, session_string: str) -> bool:
         return False
 
 
+def save_accounts(rows: list) -> dict:
+    """
+    Bulk save_account for imports. rows are (phone, password_2fa, session_string).
+    As with save_account, a phone already in stock ('available') gets the new
+    session and password. Phones in a purchase ('reserved') or sold (archived
+    ones included) are left alone — re-importing a sold number must not put it
+    back on sale — and are returned in "skipped" with that status.
+    Returns {"imported": n, "updated": n, "skipped": [(phone, status), ...]}.
+    """
+    report = {"imported": 0, "updated": 0, "skipped": []}
+    if not rows:
+        return report
+    con = _con()
+    archived = _attach_archive(con)
+    # Checked and written in one write transaction: a phone can't get reserved in between
+    con.execute("BEGIN IMMEDIATE")
+    status = {}
+    phones = [r[0] for r in rows]
+    for i in range(0, len(phones), 500):
+        chunk = phones[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        if archived:
+            status.update(
+                (r["phone"], "sold")
+                for r in con.execute(f"SELECT phone FROM archive.sold_accounts WHERE phone IN ({marks})", chunk)
+            )
+        status.update(
+            (r["phone"], r["status"])
+            for r in con.execute(f"SELECT phone, status FROM accounts WHERE phone IN ({marks})", chunk)
+        )
+    now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    writes = []
+    for phone, pw, session in rows:
+        current = status.get(phone)
+        if current is None or current == "available":
+            writes.append((phone, pw, session, now))
+            report["updated" if current else "imported"] += 1
+        else:
+            report["skipped"].append((phone, current))
+    con.executemany(_UPSERT_ACCOUNT, writes)
+    con.commit()
+    con.close()
+    return report
+
+
 def get_available_count() -> int:
     con = _con()
     row = con.execute("SELECT COUNT(*) as cnt FROM accounts WHERE status = 'available'").fetchone()
@@ -266,7 +439,10 @@ def get_available_count() -> int:
 
 def get_sold_count() -> int:
     con = _con()
-    row = con.execute("SELECT COUNT(*) as cnt FROM accounts WHERE status = 'sold'").fetchone()
+    sql = "SELECT COUNT(*) as cnt FROM accounts WHERE status = 'sold'"
+    if _attach_archive(con):
+        sql = f"SELECT ({sql}) + (SELECT COUNT(*) FROM archive.sold_accounts) as cnt"
+    row = con.execute(sql).fetchone()
     con.close()
     return row["cnt"] if row else 0
 
@@ -297,6 +473,11 @@ def get_account_by_phone(phone: str):
 def record_transaction(telegram_id: int, amount: float, tx_hash: str) -> bool:
     try:
         con = _con()
+        # An archived deposit can still be on TonCenter's latest page; don't credit it twice
+        if _attach_archive(con) and con.execute(
+                "SELECT 1 FROM archive.transactions WHERE tx_hash = ?", (tx_hash,)).fetchone():
+            con.close()
+            return False
         con.execute(
             "INSERT INTO transactions (user_id, amount_ton, tx_hash, type, created_at) VALUES (?, ?, ?, 'deposit', ?)",
             (telegram_id, amount, tx_hash, datetime.now().isoformat())
@@ -310,7 +491,11 @@ def record_transaction(telegram_id: int, amount: float, tx_hash: str) -> bool:
 
 def get_total_revenue() -> float:
     con = _con()
-    row = con.execute("SELECT SUM(amount_ton) as total FROM transactions WHERE type = 'deposit'").fetchone()
+    sql = "SELECT SUM(amount_ton) as total FROM transactions WHERE type = 'deposit'"
+    if _attach_archive(con):
+        sql = (f"SELECT COALESCE(({sql}), 0) + COALESCE((SELECT SUM(amount_ton) FROM archive.transactions "
+               f"WHERE type = 'deposit'), 0) as total")
+    row = con.execute(sql).fetchone()
     con.close()
     return row["total"] if row["total"] else 0.0
 
@@ -395,3 +580,484 @@ def get_all_reviews() -> list:
     ).fetchall()
     con.close()
     return [dict(r) for r in rows]
+
+
+# ─── CONVERSATION STATE FUNCTIONS ─────────────────────
+
+def load_user_states(now: float) -> list:
+    """Unexpired (user_id, state, data_json, expires_at) rows; expired ones are deleted."""
+    con = _con()
+    con.execute("DELETE FROM user_states WHERE expires_at <= ?", (now,))
+    rows = con.execute("SELECT user_id, state, data, expires_at FROM user_states").fetchall()
+    con.commit()
+    con.close()
+    return [tuple(r) for r in rows]
+
+
+def load_user_state(user_id: int, now: float):
+    """(state, data_json, expires_at) for one user, or None if absent or expired."""
+    con = _con()
+    row = con.execute(
+        "SELECT state, data, expires_at FROM user_states WHERE user_id = ? AND expires_at > ?", (user_id, now)
+    ).fetchone()
+    con.close()
+    return tuple(row) if row else None
+
+
+def save_user_states(upserts: list, deletes: list):
+    """Write-behind flush: upserts are (user_id, state, data_json, expires_at), deletes are user_ids."""
+    try:
+        con = _con()
+        con.executemany(
+            "INSERT OR REPLACE INTO user_states (user_id, state, data, expires_at) VALUES (?, ?, ?, ?)",
+            upserts
+        )
+        con.executemany("DELETE FROM user_states WHERE user_id = ?", [(uid,) for uid in deletes])
+        con.commit()
+        con.close()
+    except Exception as e:
+        print(f"save_user_states error: {e}")
+
+
+# ─── BROADCAST FUNCTIONS ──────────────────────────────
+
+def count_broadcast_recipients() -> int:
+    con = _con()
+    row = con.execute("SELECT COUNT(*) as cnt FROM users WHERE blocked = 0").fetchone()
+    con.close()
+    return row["cnt"] if row else 0
+
+
+def get_broadcast_recipients(after_id: int, limit: int) -> list:
+    """Next page of reachable users after a cursor (keyset pagination on telegram_id)."""
+    con = _con()
+    rows = con.execute(
+        "SELECT telegram_id FROM users WHERE blocked = 0 AND telegram_id > ? ORDER BY telegram_id LIMIT ?",
+        (after_id, limit)
+    ).fetchall()
+    con.close()
+    return [r["telegram_id"] for r in rows]
+
+
+def mark_users_blocked(telegram_ids: list):
+    if not telegram_ids:
+        return
+    con = _con()
+    con.executemany("UPDATE users SET blocked = 1 WHERE telegram_id = ?", [(t,) for t in telegram_ids])
+    con.commit()
+    con.close()
+
+
+def create_broadcast(admin_chat_id: int, text: str, entities: str, total: int) -> int:
+    con = _con()
+    cur = con.execute(
+        """INSERT INTO broadcast_jobs (admin_chat_id, text, entities, total, created_at)
+           VALUES (?, ?, ?, ?, ?)""",
+        (admin_chat_id, text, entities, total, datetime.now().strftime("%Y-%m-%d %H:%M"))
+    )
+    con.commit()
+    job_id = cur.lastrowid
+    con.close()
+    return job_id
+
+
+def get_broadcast(job_id: int) -> dict | None:
+    con = _con()
+    row = con.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+    con.close()
+    return dict(row) if row else None
+
+
+def get_running_broadcasts() -> list:
+    con = _con()
+    rows = con.execute("SELECT id FROM broadcast_jobs WHERE status = 'running' ORDER BY id").fetchall()
+    con.close()
+    return [r["id"] for r in rows]
+
+
+def update_broadcast(job_id: int, **fields):
+    """Persist progress: cursor/sent/failed/blocked/progress_message_id/status/finished_at."""
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    con = _con()
+    con.execute(f"UPDATE broadcast_jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+    con.commit()
+    con.close()
+
+
+def claim_broadcast(job_id: int, holder: str, lease_until: float, now: float) -> bool:
+    """Take a running job for `holder` unless another holder's lease is still live."""
+    con = _con()
+    cur = con.execute(
+        """UPDATE broadcast_jobs SET holder = ?, lease_until = ?
+           WHERE id = ? AND status = 'running'
+             AND (holder IS NULL OR holder = ? OR lease_until < ?)""",
+        (holder, lease_until, job_id, holder, now)
+    )
+    con.commit()
+    claimed = cur.rowcount == 1
+    con.close()
+    return claimed
+
+
+def save_broadcast(job_id: int, holder: str, lease_until: float, **fields) -> bool:
+    """
+    update_broadcast() for the job's holder, renewing its lease. False (nothing
+    written) once the job is no longer running or another holder took it over.
+    """
+    cols = "".join(f", {k} = ?" for k in fields)
+    con = _con()
+    cur = con.execute(
+        f"""UPDATE broadcast_jobs SET lease_until = ?{cols}
+            WHERE id = ? AND holder = ? AND status = 'running'""",
+        (lease_until, *fields.values(), job_id, holder)
+    )
+    con.commit()
+    saved = cur.rowcount == 1
+    con.close()
+    return saved
+
+
+def release_broadcast(job_id: int, holder: str):
+    con = _con()
+    con.execute("UPDATE broadcast_jobs SET holder = NULL, lease_until = 0 WHERE id = ? AND holder = ?",
+                (job_id, holder))
+    con.commit()
+    con.close()
+
+
+def cancel_broadcast(job_id: int) -> bool:
+    """Mark a running job cancelled; its holder stops at its next save."""
+    con = _con()
+    cur = con.execute(
+        "UPDATE broadcast_jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'running'",
+        (datetime.now().strftime("%Y-%m-%d %H:%M"), job_id)
+    )
+    con.commit()
+    cancelled = cur.rowcount == 1
+    con.close()
+    return cancelled
+
+
+# ─── CLUSTER FUNCTIONS ────────────────────────────────
+
+def acquire_lease(name: str, holder: str, ttl: float, now: float) -> bool:
+    """Take or renew lease `name` for `ttl` seconds; True if holder has it afterwards."""
+    con = _con()
+    con.execute("BEGIN IMMEDIATE")
+    con.execute(
+        """INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+           ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+           WHERE leases.holder = excluded.holder OR leases.expires_at < ?""",
+        (name, holder, now + ttl, now)
+    )
+    row = con.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+    con.commit()
+    con.close()
+    return row is not None and row["holder"] == holder
+
+
+def release_lease(name: str, holder: str):
+    con = _con()
+    con.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+    con.commit()
+    con.close()
+
+
+def get_leases(now: float, prefix: str = "") -> dict:
+    """Unexpired leases as { name: holder }."""
+    con = _con()
+    rows = con.execute(
+        "SELECT name, holder FROM leases WHERE expires_at >= ? AND name LIKE ? ORDER BY name",
+        (now, prefix + "%")
+    ).fetchall()
+    con.close()
+    return {r["name"]: r["holder"] for r in rows}
+
+
+def enqueue_updates(rows: list) -> int:
+    """rows are (update_id, user_id, payload_json, enqueued_at); already-seen update ids are ignored."""
+    con = _con()
+    cur = con.executemany(
+        "INSERT OR IGNORE INTO update_queue (update_id, user_id, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+        rows
+    )
+    con.commit()
+    added = cur.rowcount
+    con.close()
+    return added
+
+
+def claim_updates(holder: str, index: int, workers: int, limit: int) -> list:
+    """
+    Claim up to `limit` queued updates of users in partition `index` of
+    `workers` (user_id mod workers, taken non-negative like Python's % —
+    SQLite's % keeps the sign, so negative ids would match no partition).
+    Only a user's oldest unfinished update
+    is claimable, so each user's updates run one at a time, in order,
+    even while partitions move between workers.
+    Returns (update_id, payload_json, enqueued_at) rows.
+    """
+    con = _con()
+    con.execute("BEGIN IMMEDIATE")
+    rows = con.execute(
+        """UPDATE update_queue SET status = 'claimed', claimed_by = ?
+           WHERE update_id IN (
+               SELECT q.update_id FROM update_queue q
+               WHERE q.status = 'queued' AND ((q.user_id % ?) + ?) % ? = ?
+                 AND NOT EXISTS (SELECT 1 FROM update_queue p
+                                 WHERE p.user_id = q.user_id AND p.status != 'done'
+                                   AND p.update_id < q.update_id)
+               ORDER BY q.update_id LIMIT ?)
+           RETURNING update_id, payload, enqueued_at""",
+        (holder, workers, workers, workers, index, limit)
+    ).fetchall()
+    con.commit()
+    con.close()
+    return sorted(tuple(r) for r in rows)
+
+
+def finish_updates(update_ids: list, now: float):
+    if not update_ids:
+        return
+    con = _con()
+    con.executemany("UPDATE update_queue SET status = 'done', finished_at = ? WHERE update_id = ?",
+                    [(now, u) for u in update_ids])
+    con.commit()
+    con.close()
+
+
+def requeue_updates(live_holders: list) -> int:
+    """Give updates claimed by workers that are gone back to the queue."""
+    con = _con()
+    marks = ", ".join("?" * len(live_holders)) or "NULL"
+    cur = con.execute(
+        f"UPDATE update_queue SET status = 'queued', claimed_by = NULL "
+        f"WHERE status = 'claimed' AND claimed_by NOT IN ({marks})",
+        live_holders
+    )
+    con.commit()
+    requeued = cur.rowcount
+    con.close()
+    return requeued
+
+
+def prune_updates(finished_before: float) -> int:
+    """Drop finished updates; they are kept a while so a re-polled update id is still recognised."""
+    con = _con()
+    cur = con.execute("DELETE FROM update_queue WHERE status = 'done' AND finished_at < ?", (finished_before,))
+    con.commit()
+    pruned = cur.rowcount
+    con.close()
+    return pruned
+
+
+def count_queued_updates() -> dict:
+    con = _con()
+    rows = con.execute("SELECT status, COUNT(*) AS cnt FROM update_queue GROUP BY status").fetchall()
+    con.close()
+    return {r["status"]: r["cnt"] for r in rows}
+
+
+# ─── EXPORT FUNCTIONS ─────────────────────────────────
+# Admin exports (exporter.py) read through their own read-only connection:
+# it can never take the write lock, and rows are fetched a batch at a time.
+# Sales and deposits list the archive first, then the hot table, each in id
+# order (no ORDER BY, so no sort over the whole result). Session strings and
+# 2FA passwords are never exported.
+
+EXPORT_BATCH = 500
+
+_EXPORTS = {
+    "users": [
+        "SELECT telegram_id, username, balance_ton, joined_at, blocked FROM main.users",
+    ],
+    "sales": [
+        "SELECT id, phone, buyer_id, added_at, sold_at FROM archive.sold_accounts",
+        "SELECT id, phone, buyer_id, added_at, sold_at FROM main.accounts WHERE status = 'sold'",
+    ],
+    "deposits": [
+        "SELECT id, user_id, amount_ton, tx_hash, created_at FROM archive.transactions WHERE type = 'deposit'",
+        "SELECT id, user_id, amount_ton, tx_hash, created_at FROM main.transactions WHERE type = 'deposit'",
+    ],
+}
+
+
+def _readonly_uri(path: str) -> str:
+    return pathlib.Path(path).absolute().as_uri() + "?mode=ro"
+
+
+def export_rows(kind: str):
+    """
+    Generator for export `kind` ("users", "sales", "deposits"): first the
+    column names, then one tuple per row.
+    """
+    con = sqlite3.connect(_readonly_uri(_db_path()), uri=True, timeout=BUSY_TIMEOUT, factory=_connection_factory)
+    try:
+        queries = _EXPORTS[kind]
+        if os.path.exists(archive_path()):
+            con.execute("ATTACH DATABASE ? AS archive", (_readonly_uri(archive_path()),))
+        else:
+            queries = [q for q in queries if "archive." not in q]
+        cur = con.execute(" UNION ALL ".join(queries))
+        yield tuple(d[0] for d in cur.description)
+        while rows := cur.fetchmany(EXPORT_BATCH):
+            yield from rows
+    finally:
+        con.close()
+
+
+# ─── ARCHIVE FUNCTIONS ────────────────────────────────
+# Sold accounts and transactions past archive.py's cutoff live in archive_path().
+# Rows are copied, committed, then deleted from the hot tables: a transaction
+# spanning two WAL databases is not atomic across both, and this way a crash
+# at worst leaves a copy the next run deletes.
+
+def init_archive():
+    con = sqlite3.connect(archive_path())
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS sold_accounts (
+            id INTEGER PRIMARY KEY,
+            phone TEXT,
+            password_2fa TEXT,
+            session_z BLOB,
+            added_at TEXT,
+            sold_at TEXT,
+            buyer_id INTEGER,
+            archived_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_sold_accounts_buyer ON sold_accounts (buyer_id, sold_at);
+        CREATE INDEX IF NOT EXISTS idx_sold_accounts_phone ON sold_accounts (phone);
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            amount_ton REAL,
+            tx_hash TEXT UNIQUE,
+            type TEXT,
+            created_at TEXT,
+            archived_at TEXT
+        );
+    """)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.commit()
+    con.close()
+
+
+_ARCHIVED_AT = "strftime('%Y-%m-%d %H:%M', 'now', 'localtime')"
+
+
+def _compress(text):
+    return zlib.compress(text.encode(), 9) if text else None
+
+
+def _move(con, ids: list, copy_sql: str, delete_sql: str) -> int:
+    if not ids:
+        return 0
+    marks = ",".join("?" * len(ids))
+    con.execute("BEGIN IMMEDIATE")
+    con.execute(copy_sql.format(marks=marks), ids)
+    con.commit()
+    con.execute("BEGIN IMMEDIATE")
+    moved = con.execute(delete_sql.format(marks=marks), ids).rowcount
+    con.commit()
+    return moved
+
+
+def archive_sold_accounts(sold_before: str, limit: int) -> int:
+    """Move up to `limit` accounts sold before a "%Y-%m-%d %H:%M" cutoff; session strings are zlib'd."""
+    con = _con()
+    con.execute("ATTACH DATABASE ? AS archive", (archive_path(),))
+    con.create_function("zcompress", 1, _compress, deterministic=True)
+    ids = [r["id"] for r in con.execute(
+        "SELECT id FROM accounts WHERE status = 'sold' AND sold_at < ? ORDER BY id LIMIT ?", (sold_before, limit))]
+    moved = _move(
+        con, ids,
+        f"INSERT OR IGNORE INTO archive.sold_accounts "
+        f"(id, phone, password_2fa, session_z, added_at, sold_at, buyer_id, archived_at) "
+        f"SELECT id, phone, password_2fa, zcompress(session_string), added_at, sold_at, buyer_id, {_ARCHIVED_AT} "
+        f"FROM main.accounts WHERE id IN ({{marks}})",
+        "DELETE FROM main.accounts WHERE id IN ({marks}) AND id IN (SELECT id FROM archive.sold_accounts)"
+    )
+    con.close()
+    return moved
+
+
+def archive_transactions(created_before: str, limit: int) -> int:
+    """Move up to `limit` transactions created before an ISO timestamp."""
+    con = _con()
+    con.execute("ATTACH DATABASE ? AS archive", (archive_path(),))
+    ids = [r["id"] for r in con.execute(
+        "SELECT id FROM transactions WHERE created_at < ? ORDER BY id LIMIT ?", (created_before, limit))]
+    moved = _move(
+        con, ids,
+        f"INSERT OR IGNORE INTO archive.transactions "
+        f"(id, user_id, amount_ton, tx_hash, type, created_at, archived_at) "
+        f"SELECT id, user_id, amount_ton, tx_hash, type, created_at, {_ARCHIVED_AT} "
+        f"FROM main.transactions WHERE id IN ({{marks}})",
+        "DELETE FROM main.transactions WHERE id IN ({marks}) AND id IN (SELECT id FROM archive.transactions)"
+    )
+    con.close()
+    return moved
+
+
+def get_archived_account(account_id: int):
+    """An archived sold account with its session string restored, or None."""
+    con = _con()
+    if not _attach_archive(con):
+        con.close()
+        return None
+    row = con.execute("SELECT * FROM archive.sold_accounts WHERE id = ?", (account_id,)).fetchone()
+    con.close()
+    if not row:
+        return None
+    account = dict(row)
+    session_z = account.pop("session_z")
+    account["session_string"] = zlib.decompress(session_z).decode() if session_z else ""
+    account["status"] = "sold"
+    return account
+
+
+def count_archived() -> dict:
+    con = _con()
+    if not _attach_archive(con):
+        con.close()
+        return {"accounts": 0, "transactions": 0}
+    row = con.execute("SELECT (SELECT COUNT(*) FROM archive.sold_accounts) AS accounts, "
+                      "(SELECT COUNT(*) FROM archive.transactions) AS transactions").fetchone()
+    con.close()
+    return dict(row)
+
+
+def incremental_vacuum_enabled() -> bool:
+    con = _con()
+    mode = con.execute("PRAGMA auto_vacuum").fetchone()[0]
+    con.close()
+    return mode == 2
+
+
+def enable_incremental_vacuum():
+    """
+    Switch a DB created before auto_vacuum=INCREMENTAL over. Needs one full
+    VACUUM, which blocks every writer and needs free disk about the DB's
+    size while it runs — so only `python archive.py vacuum` calls it.
+    """
+    con = _con()
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    con.execute("VACUUM")
+    con.close()
+
+
+def reclaim_space() -> int:
+    """
+    Hand the hot DB's free pages back to the filesystem and truncate the WAL;
+    returns pages freed. Without auto_vacuum=INCREMENTAL the free pages stay
+    in the file for reuse and 0 is returned.
+    """
+    con = _con()
+    freed = 0
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        freed = con.execute("PRAGMA freelist_count").fetchone()[0]
+        # execute() steps a statement once, and each step frees one page; executescript runs it to the end
+        con.executescript("PRAGMA incremental_vacuum")
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    con.close()
+    return freed
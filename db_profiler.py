@@ -0,0 +1,256 @@
+"""
+DB Profiler
+-----------
+Opt-in profiling of every database.py call (config.DB_PROFILE):
+
+- per function: calls, latency histogram (exported as db_call_seconds in
+  metrics), total / max time and rows returned. Only calls from outside
+  database.py are timed: a public function called by another one (e.g.
+  finalize_purchase → get_price_ton) is part of its caller's time, not
+  counted twice. A generator (export_rows) is timed until it is returned
+  and its rows are not counted
+- per SQL statement: executions, time (execute + fetch) and rows read
+- statements slower than DB_SLOW_MS go to the slow-query log with their
+  EXPLAIN QUERY PLAN, and are kept for the admin /dbstats command
+
+enable() swaps the public functions in database.py for timed wrappers and
+sets database._connection_factory to ProfiledConnection. Nothing is
+wrapped until then, so with profiling off the only cost is the
+factory= argument every _con() already passes.
+
+    db_profiler.enable(slow_ms=50)
+    ...
+    print(db_profiler.report())
+"""
+
+import functools
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+
+import database as db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOW_LOG_SIZE = 50
+
+_lock       = threading.Lock()
+_functions  = {}        # name → {"calls", "total", "max", "rows", "hist"}
+_statements = {}        # normalized SQL → {"calls", "total", "max", "rows"}
+slow_log    = deque(maxlen=SLOW_LOG_SIZE)
+_originals  = {}
+_slow_s     = 0.05
+_local      = threading.local()     # .depth: > 0 while a profiled call runs on this thread
+
+
+def _normalize(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _count_rows(result) -> int | None:
+    """Rows in a result; None for an iterator, whose rows are only read later."""
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if isinstance(result, Iterator):
+        return None
+    return 0 if result is None or isinstance(result, bool) else 1
+
+
+# ── Statement level ──────────────────────────────────
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Times execute() and every fetch after it, charged to the statement."""
+
+    _key, _params, _elapsed, _logged = "", (), 0.0, True
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._begin(sql, params, time.perf_counter() - start)
+
+    def executemany(self, sql, seq):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            self._begin(sql, None, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - start, 0 if row is None else 1)
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def _begin(self, sql: str, params, elapsed: float):
+        self._key, self._params, self._elapsed, self._logged = _normalize(sql), params, elapsed, False
+        with _lock:
+            s = _statements.get(self._key)
+            if s is None:
+                s = _statements[self._key] = {"calls": 0, "total": 0.0, "max": 0.0, "rows": 0}
+            s["calls"] += 1
+            s["total"] += elapsed
+            if elapsed > s["max"]:
+                s["max"] = elapsed
+        self._check_slow()
+
+    def _fetched(self, elapsed: float, rows: int):
+        if not self._key:
+            return
+        self._elapsed += elapsed
+        with _lock:
+            s = _statements.get(self._key)
+            if s is None:       # reset() since execute
+                return
+            s["total"] += elapsed
+            s["rows"]  += rows
+            if self._elapsed > s["max"]:
+                s["max"] = self._elapsed
+        self._check_slow()
+
+    def _check_slow(self):
+        if not self._logged and self._elapsed >= _slow_s:
+            self._logged = True
+            _log_slow(self.connection, self._key, self._params, self._elapsed)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+
+def _log_slow(con, sql: str, params, elapsed: float):
+    plan = ""
+    if params is not None and sql.split(" ", 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+        try:
+            rows = sqlite3.Connection.execute(con, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            plan = "; ".join(r[-1] for r in rows)
+        except sqlite3.Error as e:
+            plan = f"(no plan: {e})"
+    slow_log.append({"sql": sql, "ms": elapsed * 1000, "plan": plan, "at": time.time()})
+    logger.warning(f"Slow query {elapsed * 1000:.1f} ms: {sql} | plan: {plan}")
+
+
+# ── Function level ───────────────────────────────────
+
+def _wrap(name: str, fn):
+    hist = metrics.histogram("db_call_seconds", "database.py call latency",
+                             (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1), fn=name)
+
+    @functools.wraps(fn)
+    def profiled(*args, **kwargs):
+        if getattr(_local, "depth", 0):
+            return fn(*args, **kwargs)      # nested: already timed by the outer call
+        _local.depth = 1
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            _local.depth = 0
+        elapsed = time.perf_counter() - start
+        rows = _count_rows(result)
+        hist.observe(elapsed)
+        with _lock:
+            s = _functions.get(name)
+            if s is None:
+                s = _functions[name] = {"calls": 0, "total": 0.0, "max": 0.0, "rows": 0, "counted": 0,
+                                        "hist": hist}
+            s["calls"] += 1
+            s["total"] += elapsed
+            if rows is not None:
+                s["rows"]    += rows
+                s["counted"] += 1
+            if elapsed > s["max"]:
+                s["max"] = elapsed
+        return result
+
+    return profiled
+
+
+def enable(slow_ms: float = 50):
+    """Wrap every public database.py function and profile every statement."""
+    global _slow_s
+    _slow_s = slow_ms / 1000
+    if _originals:
+        return
+    for name, fn in list(vars(db).items()):
+        if name.startswith("_") or name == "init_db" or not callable(fn) or getattr(fn, "__module__", None) != db.__name__:
+            continue
+        _originals[name] = fn
+        setattr(db, name, _wrap(name, fn))
+    db._connection_factory = ProfiledConnection
+    logger.info(f"DB profiling on ({len(_originals)} functions, slow ≥ {slow_ms:g} ms)")
+
+
+def disable():
+    for name, fn in _originals.items():
+        setattr(db, name, fn)
+    _originals.clear()
+    db._connection_factory = sqlite3.Connection
+
+
+def enabled() -> bool:
+    return bool(_originals)
+
+
+def reset():
+    with _lock:
+        _functions.clear()
+        _statements.clear()
+    slow_log.clear()
+
+
+# ── Reporting ────────────────────────────────────────
+
+def top_functions(n: int = 10) -> list:
+    """(name, stats) by total time, with avg and p99 bucket bound filled in."""
+    with _lock:
+        items = [(k, dict(v)) for k, v in _functions.items()]
+    items.sort(key=lambda kv: kv[1]["total"], reverse=True)
+    for _, s in items[:n]:
+        s["avg"] = s["total"] / s["calls"]
+        s["p99"] = s.pop("hist").quantile(0.99)
+    return items[:n]
+
+
+def top_statements(n: int = 10) -> list:
+    with _lock:
+        items = [(k, dict(v)) for k, v in _statements.items()]
+    items.sort(key=lambda kv: kv[1]["total"], reverse=True)
+    return items[:n]
+
+
+def report(n: int = 10) -> str:
+    """Plain-text top offenders: functions, statements, recent slow queries."""
+    lines = ["Functions (by total time):"]
+    for name, s in top_functions(n):
+        rows = f"{s['rows'] / s['counted']:.1f}" if s["counted"] else "-"
+        lines.append(f"  {name}: {s['calls']}× avg {s['avg'] * 1000:.2f} ms, p99≤{s['p99'] * 1000:g} ms, "
+                     f"max {s['max'] * 1000:.1f} ms, rows/call {rows}")
+    lines.append("Statements (by total time):")
+    for sql, s in top_statements(n):
+        lines.append(f"  {s['calls']}× {s['total'] * 1000:.0f} ms total, max {s['max'] * 1000:.1f} ms, "
+                     f"rows {s['rows']}: {sql[:120]}")
+    if slow_log:
+        lines.append(f"Slow queries (last {min(len(slow_log), 5)}):")
+        for q in list(slow_log)[-5:]:
+            lines.append(f"  {q['ms']:.1f} ms: {q['sql'][:120]}\n    plan: {q['plan']}")
+    return "\n".join(lines)
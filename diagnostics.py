@@ -0,0 +1,176 @@
+"""
+Diagnostics
+-----------
+Runtime health of the event loop everything async shares (telethon_loop:
+TON monitor, OTP listeners, admin logins).
+
+- LoopMonitor ticks on the loop every `interval` seconds and records how
+  late each tick ran (loop_lag_seconds). A watchdog thread notices when
+  the loop has not ticked for `threshold` seconds — some callback is
+  blocking it — and captures that thread's stack while it is still stuck
+- live asyncio tasks and Telethon clients (session_manager.live_clients)
+- queue depth of every registered executor
+- optional tracemalloc: top allocation sites, and growth since the last
+  snapshot
+
+    monitor = diagnostics.LoopMonitor(telethon_loop).start()
+    diagnostics.register_executor("otp-delivery", session_manager._delivery_executor)
+    print(diagnostics.report(monitor))
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import deque
+
+import metrics
+import session_manager
+
+logger = logging.getLogger(__name__)
+
+STALL_LOG_SIZE = 20
+
+executors = {}      # name → ThreadPoolExecutor
+
+
+def register_executor(name: str, executor):
+    executors[name] = executor
+    metrics.gauge("executor_queue_depth", "Work items waiting for an executor thread",
+                  fn=lambda: executor._work_queue.qsize(), executor=name)
+
+
+def executor_depths() -> dict:
+    return {name: ex._work_queue.qsize() for name, ex in executors.items()}
+
+
+def telethon_clients() -> tuple:
+    """(live, connected) Telethon clients."""
+    clients = list(session_manager.live_clients)
+    connected = sum(1 for c in clients if getattr(c, "is_connected", lambda: True)())
+    return len(clients), connected
+
+
+class LoopMonitor:
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.25, threshold: float = 0.1):
+        self.loop       = loop
+        self.interval   = interval
+        self.threshold  = threshold
+        self.lag        = metrics.histogram("loop_lag_seconds", "How late the event loop ran a scheduled tick",
+                                            (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+        self.stalls     = deque(maxlen=STALL_LOG_SIZE)
+        self.stall_count = 0
+        self.max_lag    = 0.0
+        self.tasks      = 0
+        self.thread_id  = None
+        self.last_tick  = time.monotonic()
+        self._stopped   = False
+        metrics.gauge("loop_tasks", "Live asyncio tasks on the event loop", fn=lambda: self.tasks)
+        metrics.counter("loop_stalls_total", "Times the event loop was blocked past the threshold")
+
+    def start(self):
+        asyncio.run_coroutine_threadsafe(self._tick(), self.loop)
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+
+    async def _tick(self):
+        self.thread_id = threading.get_ident()
+        while not self._stopped:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.lag.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self.last_tick = now
+            # all_tasks() is only safe to walk from the loop's own thread
+            self.tasks = len(asyncio.all_tasks())
+
+    def _watchdog(self):
+        captured_for = None
+        while not self._stopped:
+            time.sleep(self.threshold / 2)
+            last = self.last_tick
+            blocked = time.monotonic() - last - self.interval
+            if blocked < self.threshold or captured_for == last or self.thread_id is None:
+                continue
+            # One capture per stall: the same last_tick means the same blocked callback
+            captured_for = last
+            frame = sys._current_frames().get(self.thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no frame)"
+            self.stall_count += 1
+            metrics.counter("loop_stalls_total").inc()
+            self.stalls.append({"at": time.time(), "blocked": blocked, "stack": stack})
+            logger.warning(f"Event loop blocked for {blocked * 1000:.0f} ms+, stack:\n{stack}")
+
+    def stats(self) -> dict:
+        return {
+            "lag_p50": self.lag.quantile(0.5),
+            "lag_p99": self.lag.quantile(0.99),
+            "max_lag": self.max_lag,
+            "stalls": self.stall_count,
+            "tasks": self.tasks,
+            "since_tick": time.monotonic() - self.last_tick,
+        }
+
+
+# ── Memory ───────────────────────────────────────────
+
+_last_snapshot = None
+
+
+def start_tracemalloc(frames: int = 1):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def top_allocations(n: int = 8) -> list:
+    """Top allocation sites as text lines, each with growth since the previous call."""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    if _last_snapshot is None:
+        stats = snapshot.statistics("lineno")[:n]
+        lines = [f"{s.size / 1024:.0f} KiB ({s.count}) {s.traceback[0]}" for s in stats]
+    else:
+        stats = snapshot.compare_to(_last_snapshot, "lineno")[:n]
+        lines = [f"{s.size / 1024:.0f} KiB ({s.size_diff / 1024:+.0f}) {s.traceback[0]}" for s in stats]
+    _last_snapshot = snapshot
+    return lines
+
+
+# ── Report ───────────────────────────────────────────
+
+def report(monitor: LoopMonitor = None) -> str:
+    lines = []
+    if monitor is not None:
+        s = monitor.stats()
+        lines.append(f"Loop lag p50≤{s['lag_p50'] * 1000:g} ms p99≤{s['lag_p99'] * 1000:g} ms "
+                     f"max {s['max_lag'] * 1000:.0f} ms")
+        lines.append(f"Stalls: {s['stalls']} | Last tick {s['since_tick']:.1f}s ago | Tasks: {s['tasks']}")
+        if monitor.stalls:
+            last = monitor.stalls[-1]
+            where = last["stack"].strip().splitlines()[-2:]
+            lines.append(f"Last stall {last['blocked'] * 1000:.0f} ms+ at: " + " ".join(l.strip() for l in where))
+    live, connected = telethon_clients()
+    lines.append(f"Telethon clients: {live} live, {connected} connected")
+    lines.append(f"Threads: {threading.active_count()}")
+    depths = executor_depths()
+    if depths:
+        lines.append("Executor queues: " + ", ".join(f"{k}={v}" for k, v in depths.items()))
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(f"Traced memory: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)")
+        lines.extend("  " + l for l in top_allocations())
+    return "\n".join(lines)
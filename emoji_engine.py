@@ -0,0 +1,165 @@
+"""
+Premium Emoji Engine
+--------------------
+Bots CAN send premium custom emojis using MessageEntity with
+type="custom_emoji" — no HTML tags needed. Messages are written with
+[E:x] emoji markers and **bold** markers and sent as plain text + entity list.
+Telegram measures entity offsets in UTF-16 code units.
+
+Templates are parsed once into a cached list of ops (static text, emoji,
+bold start/end, {field}) with static UTF-16 lengths precomputed, so a render
+only formats and measures the dynamic {field} values:
+
+    plain, entities = render("[E:🪙] Price: **{price} TON**", price=price)
+
+build(text) keeps the old behaviour for already-formatted strings
+(no {field} parsing). It parses on every call and never touches the
+template cache: such text is built at runtime (user lists, purchase
+histories) and almost never repeats, so caching it would only evict the
+static templates render() relies on.
+
+Entities are plain dicts rather than MessageEntity objects — telebot sends
+a list of dicts as-is, which skips an object + to_dict() per entity.
+"""
+
+import re
+import string
+from functools import lru_cache
+
+EMOJI_IDS = {
+    "👋": "6104922173015597346",   # wave
+    "👤": "6107017202228009498",   # profile
+    "⚠️": "6106898459267177284",   # warning
+    "🔒": "6106902616795519273",   # secure
+    "🤖": "6107323579425104140",   # bot
+    "🎁": "6107325885822540958",   # gift
+    "✅": "6106981506754814207",   # verified tick
+    "🏪": "6107212468621154692",   # shop
+    "💎": "6107289979895945232",   # fragment logo
+    "🪙": "6106898347598027963",   # toncoin
+    "💲": "6107061783988542265",   # dollar
+    "📈": "6104943961384688402",   # graph
+    "🏠": "6008258140108231117",   # main menu
+    "⏱": "5900104897885376843",    # timer/clock
+    "☑️": "5951665890079544884",    # verified check
+}
+
+EMOJI_RE = re.compile(r'\[E:(.+?)\]')
+BOLD_RE  = re.compile(r'\*\*(.+?)\*\*', re.DOTALL)
+
+# Op codes of a compiled template
+TEXT, FIELD, EMOJI, BOLD_START, BOLD_END = range(5)
+
+_formatter = string.Formatter()
+
+
+def utf16_len(s: str) -> int:
+    return len(s) if s.isascii() else len(s.encode('utf-16-le')) // 2
+
+
+class Template:
+    """A message parsed once into ops; render() only measures the fields."""
+
+    __slots__ = ("ops", "static")
+
+    def __init__(self, text: str, fields: bool):
+        ops = []
+        # parts alternates: plain_text, emoji_char, plain_text, emoji_char ...
+        for idx, segment in enumerate(EMOJI_RE.split(text)):
+            if idx % 2:
+                ops.append((EMOJI, segment, utf16_len(segment), EMOJI_IDS.get(segment)))
+                continue
+            last = 0
+            for m in BOLD_RE.finditer(segment):
+                self._literal(ops, segment[last:m.start()], fields)
+                ops.append((BOLD_START,))
+                self._literal(ops, m.group(1), fields)
+                ops.append((BOLD_END,))
+                last = m.end()
+            self._literal(ops, segment[last:], fields)
+
+        self.ops    = tuple(ops)
+        # Templates without fields render to the same result every time
+        self.static = self._render((), {}) if not any(op[0] == FIELD for op in ops) else None
+
+    @staticmethod
+    def _literal(ops: list, text: str, fields: bool):
+        if not fields:
+            if text:
+                ops.append((TEXT, text, utf16_len(text)))
+            return
+        for literal, name, spec, conversion in _formatter.parse(text):
+            if literal:
+                ops.append((TEXT, literal, utf16_len(literal)))
+            if name is not None:
+                ops.append((FIELD, name, spec or "", conversion))
+
+    def render(self, args: tuple, kwargs: dict) -> tuple:
+        if self.static is not None:
+            return self.static
+        return self._render(args, kwargs)
+
+    def _render(self, args: tuple, kwargs: dict) -> tuple:
+        parts    = []
+        entities = []
+        pos      = 0
+        bold_at  = 0
+        auto     = 0
+        for op in self.ops:
+            kind = op[0]
+            if kind == TEXT:
+                parts.append(op[1])
+                pos += op[2]
+            elif kind == FIELD:
+                name = op[1]
+                if name == "":
+                    value = args[auto]
+                    auto += 1
+                elif name in kwargs:
+                    value = kwargs[name]
+                else:
+                    value = _formatter.get_field(name, args, kwargs)[0]
+                if op[3]:
+                    value = _formatter.convert_field(value, op[3])
+                value = format(value, op[2])
+                parts.append(value)
+                pos += utf16_len(value)
+            elif kind == EMOJI:
+                parts.append(op[1])
+                if op[3]:
+                    entities.append(
+                        {"type": "custom_emoji", "offset": pos, "length": op[2], "custom_emoji_id": op[3]}
+                    )
+                pos += op[2]
+            elif kind == BOLD_START:
+                bold_at = pos
+            else:
+                entities.append({"type": "bold", "offset": bold_at, "length": pos - bold_at})
+        return "".join(parts), entities
+
+
+@lru_cache(maxsize=1024)
+def compile_template(text: str, fields: bool = True) -> Template:
+    return Template(text, fields)
+
+
+def render(template: str, *args, **kwargs) -> tuple:
+    """
+    Render a cached template with {field} values.
+    Returns (plain_text, entities_list) ready to pass to send_message.
+    """
+    return compile_template(template, True).render(args, kwargs)
+
+
+def build(text: str) -> tuple:
+    """
+    Parse a string containing emoji placeholders marked with [E:char].
+    Returns (plain_text, entities_list) ready to pass to send_message.
+
+    Usage in message strings:
+        f"[E:👋] Welcome!\n[E:🪙] Price: {price} TON"
+
+    Each [E:X] is replaced with the emoji char X in the final string,
+    and a custom_emoji entity is attached at that position.
+    """
+    return Template(text, False).static
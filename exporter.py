@@ -0,0 +1,83 @@
+"""
+Exporter
+--------
+Admin exports of users, sales and deposits (/export), sent back as a
+gzipped CSV or JSONL Telegram document.
+
+Rows come from database.export_rows — a generator over a read-only
+connection — and go one at a time through csv.writer / json.dumps into a
+GzipFile over a SpooledTemporaryFile. Memory stays at one fetch batch plus
+SPOOL_SIZE however big the table is; past that the spool is a temp file on
+disk. bot.py runs exports on the admin-op executor, off the polling and
+handler threads.
+
+    with exporter.export("sales", "jsonl") as (file, rows):
+        bot.send_document(chat_id, file, visible_file_name="sales.jsonl.gz")
+"""
+
+import csv
+import gzip
+import io
+import json
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+import database as db
+import shops
+
+KINDS   = ("users", "sales", "deposits")
+FORMATS = ("csv", "jsonl")
+
+SPOOL_SIZE    = 4 * 1024 * 1024     # compressed bytes kept in memory before spilling to disk
+MAX_DOCUMENT  = 50 * 1024 * 1024    # Bot API upload limit
+
+
+def write(kind: str, fmt: str, out) -> int:
+    """Stream export `kind` as `fmt` into the text stream `out`; returns the row count."""
+    rows    = db.export_rows(kind)
+    columns = next(rows)
+    count   = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+            out.write("\n")
+            count += 1
+    return count
+
+
+@contextmanager
+def export(kind: str, fmt: str = "csv", spool_size: int = SPOOL_SIZE):
+    """Yields (gzip file rewound to the start, row count); the file is gone after the block."""
+    if kind not in KINDS or fmt not in FORMATS:
+        raise ValueError(f"Unknown export {kind!r} / {fmt!r}")
+    with tempfile.SpooledTemporaryFile(max_size=spool_size) as spool:
+        with gzip.GzipFile(filename=f"{kind}.{fmt}", mode="wb", fileobj=spool) as gz, \
+                io.TextIOWrapper(gz, encoding="utf-8", newline="") as text:
+            count = write(kind, fmt, text)
+        spool.seek(0)
+        yield spool, count
+
+
+def file_name(kind: str, fmt: str) -> str:
+    return f"{shops.get().name}-{kind}-{datetime.now():%Y%m%d-%H%M}.{fmt}.gz"
+
+
+def send(bot, chat_id: int, kind: str, fmt: str = "csv") -> int:
+    """Export and send as a document to chat_id; returns the row count."""
+    with export(kind, fmt) as (file, count):
+        size = file.seek(0, io.SEEK_END)
+        if size > MAX_DOCUMENT:
+            bot.send_message(chat_id, f"❌ The {kind} export is {size // (1024 * 1024)} MB, "
+                                      f"over Telegram's 50 MB upload limit.")
+            return count
+        file.seek(0)
+        bot.send_document(chat_id, file, visible_file_name=file_name(kind, fmt),
+                          caption=f"📤 {kind}: {count} rows ({fmt}, gzip)")
+    return count
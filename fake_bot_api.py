@@ -0,0 +1,169 @@
+"""
+Fake Bot API
+------------
+Local stand-in for api.telegram.org so the bot can be load-tested without
+touching real Telegram. Point telebot at it with
+
+    server = FakeBotAPI(error_rate=0.02).start()
+    telebot.apihelper.API_URL = server.api_url
+
+Implements getUpdates (long polling), sendMessage, editMessageText and
+answerCallbackQuery; any other method answers {"ok": true, "result": true}.
+
+- push_update() queues an update for the next getUpdates (update_id is
+  filled in) and returns its id
+- a fraction `error_rate` of send/edit calls are answered with 429 and
+  parameters.retry_after = `retry_after`, like Telegram's flood control
+- `latency` seconds are added to every non-getUpdates call
+- on_call(method, params, status) is invoked for every call, from the
+  server's request threads — load drivers use it to match bot replies to
+  the updates that caused them
+- counters: calls per method, 429s injected
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+# Methods that may be answered with an injected 429
+THROTTLED = {"sendMessage", "editMessageText", "sendDocument"}
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, error_rate: float = 0.0,
+                 retry_after: int = 1, latency: float = 0.0, seed: int = None):
+        self.error_rate  = error_rate
+        self.retry_after = retry_after
+        self.latency     = latency
+        self.on_call     = None
+        self.calls       = {}
+        self.throttled   = 0
+        self._random     = random.Random(seed)
+        self._updates    = []
+        self._next_id    = 1
+        self._message_id = 0
+        self._cond       = threading.Condition()
+        self._lock       = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def api_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fake-bot-api", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self._cond:
+            self._cond.notify_all()
+
+    # ── Updates ──────────────────────────────────────────
+
+    def push_update(self, update: dict) -> int:
+        with self._cond:
+            update_id = update["update_id"] = self._next_id
+            self._next_id += 1
+            self._updates.append(update)
+            self._cond.notify_all()
+        return update_id
+
+    def _get_updates(self, params: dict) -> list:
+        offset  = int(params.get("offset", 0) or 0)
+        limit   = int(params.get("limit", 100) or 100)
+        timeout = float(params.get("timeout", 0) or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # Confirmed updates (below offset) are gone for good, like on Telegram
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._updates[:limit]
+
+    # ── Methods ──────────────────────────────────────────
+
+    def _message(self, params: dict) -> dict:
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        return {
+            "message_id": int(params.get("message_id") or message_id),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    def handle(self, method: str, params: dict) -> tuple:
+        """(HTTP status, response JSON) for one Bot API call."""
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+        if self.latency:
+            time.sleep(self.latency)
+        if method in THROTTLED and self.error_rate and self._random.random() < self.error_rate:
+            with self._lock:
+                self.throttled += 1
+            return 429, {
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            return 200, {"ok": True, "result": self._message(params)}
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+        return 200, {"ok": True, "result": True}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "throttled": self.throttled}
+
+    # ── HTTP ─────────────────────────────────────────────
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                url    = urlsplit(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length)
+                    if self.headers.get("Content-Type", "").startswith("application/json"):
+                        params.update(json.loads(body))
+                    elif self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                        params.update(parse_qsl(body.decode()))
+                status, payload = api.handle(method, params)
+                if api.on_call is not None:
+                    api.on_call(method, params, status)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
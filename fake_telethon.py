@@ -0,0 +1,220 @@
+"""
+Fake Telethon
+-------------
+In-process stand-in for telethon.TelegramClient so session_manager can be
+load-tested without real phone numbers or Telegram's servers.
+
+- FakeTelegram is the simulated backend (latency, OTP delivery, errors)
+- FakeTelegramClient implements the subset of TelegramClient we use:
+  connect / disconnect / send_code_request / sign_in / get_me / on / session.save
+
+Usage:
+    server = FakeTelegram(connect_latency=0.05, otp_delay=1.0)
+    session_manager.client_factory = server.client_factory
+"""
+
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+from telethon.errors import (
+    SessionPasswordNeededError,
+    PhoneCodeInvalidError,
+    PasswordHashInvalidError,
+    FloodWaitError,
+)
+
+SERVICE_USER_ID     = 777000
+FAKE_SESSION_PREFIX = "fakesession"
+
+
+def fake_session_string(phone: str) -> str:
+    """Session string a fake login produces; get_me() resolves it back to the phone."""
+    return FAKE_SESSION_PREFIX + phone.lstrip("+")
+
+
+class FakeSession:
+    """Mimics StringSession.save() for fake clients."""
+
+    def __init__(self, session_string: str = ""):
+        self.session_string = session_string
+
+    def save(self) -> str:
+        return self.session_string
+
+
+class FakeTelegram:
+    """
+    Simulated Telegram backend shared by every FakeTelegramClient.
+
+    connect_latency / rpc_latency — seconds, randomised by ±jitter
+    otp_delay        — seconds after a session-bound client connects until
+                       777000 sends it a login code (None = never, push manually)
+    flood_wait_rate  — probability that connect / send_code_request raises FloodWaitError
+    passwords        — { phone: 2fa_password } for accounts that need 2FA
+    """
+
+    def __init__(self, connect_latency=0.05, rpc_latency=0.02, otp_delay=1.0,
+                 flood_wait_rate=0.0, flood_wait_seconds=30, passwords=None,
+                 jitter=0.5, seed=None):
+        self.connect_latency    = connect_latency
+        self.rpc_latency        = rpc_latency
+        self.otp_delay          = otp_delay
+        self.flood_wait_rate    = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.passwords          = dict(passwords or {})
+        self.jitter             = jitter
+        self.rng                = random.Random(seed)
+
+        # { session_string: set(FakeTelegramClient) }
+        self.clients = {}
+        # { phone: issued login code }
+        self.codes = {}
+        # { session_string: perf_counter() when the OTP was pushed }
+        self.pushed_at = {}
+
+        self.stats = {
+            "connects": 0,
+            "disconnects": 0,
+            "code_requests": 0,
+            "sign_ins": 0,
+            "flood_waits": 0,
+            "otps_pushed": 0,
+        }
+
+    def client_factory(self, session_string: str = ""):
+        """Drop-in replacement for session_manager.client_factory."""
+        return FakeTelegramClient(self, session_string)
+
+    # ── Simulation helpers ───────────────────────────────
+
+    async def latency(self, base: float):
+        if base <= 0:
+            return
+        spread = base * self.jitter
+        await asyncio.sleep(max(0.0, base + self.rng.uniform(-spread, spread)))
+
+    def maybe_flood(self):
+        if self.flood_wait_rate and self.rng.random() < self.flood_wait_rate:
+            self.stats["flood_waits"] += 1
+            raise FloodWaitError(None, capture=self.flood_wait_seconds)
+
+    def new_code(self) -> str:
+        return f"{self.rng.randint(10000, 99999)}"
+
+    def live_client_count(self) -> int:
+        return sum(len(c) for c in self.clients.values())
+
+    def push_login_code(self, session_string: str, code: str = None) -> str:
+        """Deliver a 777000 login-code message to every client on this session."""
+        code = code or self.new_code()
+        text = (
+            f"Login code: {code}. Do not give this code to anyone, "
+            f"even if they say they are from Telegram!"
+        )
+        self.pushed_at[session_string] = time.perf_counter()
+        self.stats["otps_pushed"] += 1
+        for client in list(self.clients.get(session_string, ())):
+            client._dispatch(SERVICE_USER_ID, text)
+        return code
+
+
+class FakeTelegramClient:
+    """Subset of telethon.TelegramClient used by session_manager."""
+
+    def __init__(self, server: FakeTelegram, session_string: str = ""):
+        self.server    = server
+        self.session   = FakeSession(session_string)
+        self.handlers  = []
+        self.connected = False
+        self._otp_task = None
+        self._phone    = None
+
+    # ── Connection ───────────────────────────────────────
+
+    async def connect(self):
+        await self.server.latency(self.server.connect_latency)
+        self.server.maybe_flood()
+        self.connected = True
+        self.server.stats["connects"] += 1
+        key = self.session.session_string
+        self.server.clients.setdefault(key, set()).add(self)
+        if key and self.server.otp_delay is not None:
+            self._otp_task = asyncio.ensure_future(self._auto_push(key))
+
+    async def disconnect(self):
+        if not self.connected:
+            return
+        self.connected = False
+        self.server.stats["disconnects"] += 1
+        if self._otp_task:
+            self._otp_task.cancel()
+        key = self.session.session_string
+        peers = self.server.clients.get(key)
+        if peers:
+            peers.discard(self)
+            if not peers:
+                self.server.clients.pop(key, None)
+
+    async def _auto_push(self, session_string: str):
+        await self.server.latency(self.server.otp_delay)
+        if self.connected:
+            self.server.push_login_code(session_string)
+
+    # ── Login ────────────────────────────────────────────
+
+    async def send_code_request(self, phone: str):
+        await self.server.latency(self.server.rpc_latency)
+        self.server.maybe_flood()
+        self.server.stats["code_requests"] += 1
+        code = self.server.new_code()
+        self.server.codes[phone] = code
+        self._phone = phone
+        return SimpleNamespace(phone_code_hash=f"hash_{phone}_{code}")
+
+    async def sign_in(self, phone: str = None, code: str = None, *, password: str = None,
+                      phone_code_hash: str = None):
+        await self.server.latency(self.server.rpc_latency)
+        self.server.stats["sign_ins"] += 1
+
+        if password is not None:
+            if self.server.passwords.get(self._phone) != password:
+                raise PasswordHashInvalidError(None)
+            return self._logged_in()
+
+        if self.server.codes.get(phone) != str(code):
+            raise PhoneCodeInvalidError(None)
+        self._phone = phone
+        if phone in self.server.passwords:
+            raise SessionPasswordNeededError(None)
+        return self._logged_in()
+
+    async def get_me(self):
+        await self.server.latency(self.server.rpc_latency)
+        key = self.session.session_string
+        if not key.startswith(FAKE_SESSION_PREFIX):
+            return None
+        return SimpleNamespace(phone=key[len(FAKE_SESSION_PREFIX):])
+
+    def _logged_in(self):
+        self.session.session_string = fake_session_string(self._phone)
+        return SimpleNamespace(phone=(self._phone or "").lstrip("+"))
+
+    # ── Events ───────────────────────────────────────────
+
+    def on(self, event_builder):
+        from_users = getattr(event_builder, "from_users", None)
+
+        def decorator(handler):
+            self.handlers.append((from_users, handler))
+            return handler
+        return decorator
+
+    def _dispatch(self, sender_id: int, text: str):
+        event = SimpleNamespace(
+            sender_id=sender_id,
+            message=SimpleNamespace(message=text, sender_id=sender_id),
+        )
+        for from_users, handler in self.handlers:
+            if from_users is None or from_users == sender_id:
+                asyncio.ensure_future(handler(event))
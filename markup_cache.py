@@ -0,0 +1,40 @@
+"""
+Markup Cache
+------------
+Keyboards that never change are built and JSON-serialized once.
+
+telebot serializes a reply_markup object with to_json() on every send but
+passes a str through untouched, so a @frozen builder returns the ready
+JSON string:
+
+    @frozen
+    def admin_menu():
+        m = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        ...
+        return m
+
+    bot.send_message(chat_id, text, reply_markup=admin_menu())   # cached str
+
+Arguments are part of the cache key, so a builder with a small fixed set
+of variants (e.g. main_menu(is_admin)) gets one entry per variant. Only
+use it for builders whose output depends on nothing but their arguments.
+"""
+
+import functools
+
+
+def frozen(builder):
+    """Memoize a keyboard builder as serialized JSON, one entry per argument tuple."""
+    cache = {}
+
+    @functools.wraps(builder)
+    def cached(*args):
+        try:
+            return cache[args]
+        except KeyError:
+            data = cache[args] = builder(*args).to_json()
+            return data
+
+    cached.cache = cache
+    cached.build = builder    # the uncached builder, for callers that need an object
+    return cached
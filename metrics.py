@@ -0,0 +1,249 @@
+"""
+Metrics
+-------
+Counters, gauges and fixed-bucket histograms, cheap enough for hot paths
+(one lock + a few integer adds per update), exported in Prometheus text
+format.
+
+    purchases = metrics.counter("shop_purchases_total", "Purchases by outcome", outcome="delivered")
+    purchases.inc()
+
+    stage = metrics.histogram("shop_purchase_seconds", "confirm_buy → stage", FUNNEL_BUCKETS, stage="reserved")
+    stage.observe(time.perf_counter() - started)
+
+    metrics.gauge("bot_states", "Conversation states held", fn=lambda: len(states))
+
+Metrics created through counter()/gauge()/histogram() are registered
+under (name, labels) and returned again on the next call with the same
+key. A standalone Histogram (e.g. one per UpdateWorkers) can be exported
+later with register().
+
+serve(host, port) exposes GET /metrics for a Prometheus scraper on a local
+port; summary() is the short text the admin /metrics command shows.
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Seconds — shared defaults for anything user-facing
+LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Purchase funnel: a buyer can take minutes to trigger the OTP
+FUNNEL_BUCKETS  = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = {}          # (name, labels) → metric
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str = "", help: str = "", labels: dict = None):
+        self.name   = name
+        self.help   = help
+        self.labels = dict(labels or {})
+        self._lock  = threading.Lock()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str = "", help: str = "", labels: dict = None):
+        super().__init__(name, help, labels)
+        self.value = 0
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self.value += n
+
+
+class Gauge(_Metric):
+    """A value that goes up and down; with fn=, read from a callback at export time."""
+    kind = "gauge"
+
+    def __init__(self, name: str = "", help: str = "", labels: dict = None, fn=None):
+        super().__init__(name, help, labels)
+        self.fn     = fn
+        self._value = 0
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self._value += n
+
+    def dec(self, n: float = 1):
+        self.inc(-n)
+
+    @property
+    def value(self) -> float:
+        if self.fn is None:
+            return self._value
+        try:
+            return self.fn()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} callback failed: {e}")
+            return float("nan")
+
+
+class Histogram(_Metric):
+    """Thread-safe fixed-bucket histogram of durations (bucket bounds in seconds)."""
+    kind = "histogram"
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS, name: str = "", help: str = "", labels: dict = None):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts  = [0] * (len(self.buckets) + 1)   # last slot = +Inf
+        self.total   = 0.0
+        self.count   = 0
+
+    def observe(self, seconds: float):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += seconds
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (inf past the last bucket)."""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+        rank, seen = q * count, 0
+        for bound, n in zip([*self.buckets, float("inf")], counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total, count = list(self.counts), self.total, self.count
+        return {
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts)),
+            "count": count,
+            "avg": total / count if count else 0.0,
+        }
+
+
+# ── Registry ─────────────────────────────────────────
+
+def register(metric: _Metric, name: str = None, help: str = None, **labels) -> _Metric:
+    """Export an existing metric (optionally naming it now); replaces one with the same key."""
+    if name is not None:
+        metric.name = name
+    if help is not None:
+        metric.help = help
+    if labels:
+        metric.labels = labels
+    with _registry_lock:
+        _registry[(metric.name, tuple(sorted(metric.labels.items())))] = metric
+    return metric
+
+
+def _get_or_create(cls, name: str, labels: dict, make):
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        metric = _registry.get(key)
+        if metric is None:
+            metric = _registry[key] = make()
+    if not isinstance(metric, cls):
+        raise TypeError(f"metric {name} is a {metric.kind}, not a {cls.kind}")
+    return metric
+
+
+def counter(name: str, help: str = "", **labels) -> Counter:
+    return _get_or_create(Counter, name, labels, lambda: Counter(name, help, labels))
+
+
+def gauge(name: str, help: str = "", fn=None, **labels) -> Gauge:
+    return _get_or_create(Gauge, name, labels, lambda: Gauge(name, help, labels, fn))
+
+
+def histogram(name: str, help: str = "", buckets: tuple = LATENCY_BUCKETS, **labels) -> Histogram:
+    return _get_or_create(Histogram, name, labels, lambda: Histogram(buckets, name, help, labels))
+
+
+# ── Export ───────────────────────────────────────────
+
+def _label_str(labels: dict, **extra) -> str:
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items.items()) + "}"
+
+
+def _fmt(value: float) -> str:
+    return "+Inf" if value == float("inf") else f"{value:g}"
+
+
+def render() -> str:
+    """Everything registered, in Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: (m.name, sorted(m.labels.items())))
+    lines, last_name = [], None
+    for m in metrics:
+        if m.name != last_name:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            last_name = m.name
+        if isinstance(m, Histogram):
+            with m._lock:
+                counts, total, count = list(m.counts), m.total, m.count
+            cumulative = 0
+            for bound, n in zip([*m.buckets, float("inf")], counts):
+                cumulative += n
+                lines.append(f"{m.name}_bucket{_label_str(m.labels, le=_fmt(bound))} {cumulative}")
+            lines.append(f"{m.name}_sum{_label_str(m.labels)} {total:g}")
+            lines.append(f"{m.name}_count{_label_str(m.labels)} {count}")
+        else:
+            lines.append(f"{m.name}{_label_str(m.labels)} {_fmt(m.value)}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> str:
+    """One line per metric: value, or count / avg / p50 / p99 for histograms."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: (m.name, sorted(m.labels.items())))
+    lines = []
+    for m in metrics:
+        label = m.name + _label_str(m.labels)
+        if isinstance(m, Histogram):
+            s = m.snapshot()
+            if not s["count"]:
+                continue
+            lines.append(f"{label}: n={s['count']} avg={s['avg']:.3f}s "
+                         f"p50≤{_fmt(m.quantile(0.5))}s p99≤{_fmt(m.quantile(0.99))}s")
+        else:
+            lines.append(f"{label}: {_fmt(m.value)}")
+    return "\n".join(lines)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host: str, port: int) -> ThreadingHTTPServer:
+    """Serve GET /metrics on a daemon thread; returns the server (port=0 picks a free one)."""
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics on http://{host}:{httpd.server_address[1]}/metrics")
+    return httpd
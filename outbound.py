@@ -0,0 +1,280 @@
+"""
+Outbound Dispatcher
+-------------------
+Every Bot API message send goes through one dispatcher.
+
+install(bot) swaps bot.send_message / edit_message_text / send_document for
+versions that queue the call and block until it has been sent. Callers
+anywhere (handlers, ton_monitor, session_manager executors, broadcast)
+keep calling bot.send_message(...) and still get the Message back.
+
+- calls are hashed by chat_id onto LANES sender threads, so messages to one
+  chat stay in order. A chat that has to wait (its bucket is empty, or a
+  429 paused it) is parked: its calls are set aside until it may send
+  again and the lane carries on with other chats
+- each lane drains a bounded priority queue: OTP > RECEIPT > NORMAL >
+  BROADCAST. The caller picks the class with `with outbound.priority(OTP):`.
+  A full lane blocks the caller (back-pressure) instead of growing memory
+- a global token bucket caps the whole bot at GLOBAL_RATE msg/s, and
+  BROADCAST sends leave BROADCAST_RESERVE tokens for everything else. A
+  call that finds it empty is parked like a throttled chat instead of
+  holding its lane, so an OTP or receipt queued behind it goes first
+- a per-chat bucket keeps each chat under Telegram's per-chat limits
+- 429 → the chat's bucket pauses for retry_after and the chat is parked
+  until then, then the call is retried; network errors are retried the
+  same way after a backoff; anything else is raised to the caller
+- counters: sent, throttled, retried, failed (updated under a lock — every
+  lane thread bumps them), plus queue depth per lane
+
+Several bots (shops.py) can be installed on one dispatcher: they share the
+lanes, and each gets its own global bucket since Telegram's limit is per bot.
+"""
+
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from telebot.apihelper import ApiTelegramException
+
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Priority classes — lower is sent first
+OTP, RECEIPT, NORMAL, BROADCAST = range(4)
+
+LANES             = 8
+LANE_QUEUE_SIZE   = 1000
+GLOBAL_RATE       = 30      # Telegram: ~30 messages/s per bot
+BROADCAST_RESERVE = 5       # tokens broadcast may never take
+PRIVATE_RATE      = 1.0     # per private chat: ~1 msg/s, short bursts allowed
+PRIVATE_BURST     = 4
+GROUP_RATE        = 20 / 60 # per group: 20 messages/min
+GROUP_BURST       = 3
+MAX_ATTEMPTS      = 4
+CHAT_BUCKETS      = 10000   # per lane, LRU
+
+# Methods routed through the dispatcher → index of chat_id in *args
+ROUTED = {"send_message": 0, "send_document": 0, "edit_message_text": 1}
+
+_priority = contextvars.ContextVar("outbound_priority", default=NORMAL)
+
+
+@contextmanager
+def priority(level: int):
+    """Send everything inside the block with this priority class."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def retry_after(e: ApiTelegramException) -> float:
+    return float((e.result_json.get("parameters") or {}).get("retry_after", 1))
+
+
+def _rewind(args: tuple, kwargs: dict):
+    """A retried send_document re-reads its file from the start (the failed attempt read it to the end)."""
+    for value in (*args, *kwargs.values()):
+        if hasattr(value, "seek") and hasattr(value, "read"):
+            value.seek(0)
+
+
+def is_entity_error(e: Exception) -> bool:
+    """400s caused by the entities themselves (bad offsets, unknown custom emoji)."""
+    return (
+        isinstance(e, ApiTelegramException)
+        and e.error_code == 400
+        and ("entit" in e.description.lower() or "emoji" in e.description.lower())
+    )
+
+
+class _Lane:
+    def __init__(self, index: int, queue_size: int):
+        self.index   = index
+        self.heap    = []
+        self.size    = queue_size
+        self.cond    = threading.Condition()
+        self.buckets = OrderedDict()
+        self.parked  = {}       # chat_id → its calls waiting for the chat, in the order they came
+        self.wakeups = []       # (monotonic time, chat_id) heap: when parked chats may send again
+
+    def depth(self) -> int:
+        return len(self.heap) + sum(len(items) for items in self.parked.values())
+
+    def park(self, chat_id, until: float, item: list):
+        """Set item aside until `until`, with any calls of that chat already parked (call under cond)."""
+        if chat_id not in self.parked:
+            self.parked[chat_id] = []
+            heapq.heappush(self.wakeups, (until, chat_id))
+        self.parked[chat_id].append(item)
+
+    def unpark(self, now: float) -> float:
+        """Put back the calls of chats whose wait is over; seconds to the next wake-up, or None (under cond)."""
+        while self.wakeups and self.wakeups[0][0] <= now:
+            _, chat_id = heapq.heappop(self.wakeups)
+            for item in self.parked.pop(chat_id, ()):
+                heapq.heappush(self.heap, item)
+        return self.wakeups[0][0] - now if self.wakeups else None
+
+    def bucket(self, chat_id: int) -> TokenBucket:
+        b = self.buckets.get(chat_id)
+        if b is None:
+            b = TokenBucket(PRIVATE_RATE, PRIVATE_BURST) if chat_id > 0 else TokenBucket(GROUP_RATE, GROUP_BURST)
+            self.buckets[chat_id] = b
+            if len(self.buckets) > CHAT_BUCKETS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(chat_id)
+        return b
+
+
+class Dispatcher:
+    def __init__(self, lanes: int = LANES, queue_size: int = LANE_QUEUE_SIZE, global_rate: float = GLOBAL_RATE):
+        self.lanes      = [_Lane(i, queue_size) for i in range(lanes)]
+        self.global_bucket = TokenBucket(global_rate)
+        self.originals  = {}        # id(bot) → { method: the bot's own send method }
+        self.bots       = {}        # id(bot) → its global TokenBucket
+        self.counters   = {"sent": 0, "throttled": 0, "retried": 0, "failed": 0}
+        self._counters_lock = threading.Lock()
+        self._seq       = itertools.count()
+        self._local     = threading.local()
+        self._started   = False
+
+    # ── Setup ────────────────────────────────────────────
+
+    def install(self, bot):
+        """Route bot's send methods through the dispatcher and start the lanes."""
+        key = id(bot)
+        self.bots[key] = self.global_bucket if not self.bots else TokenBucket(self.global_bucket.rate)
+        self.originals[key] = {name: getattr(bot, name) for name in ROUTED}
+        for name in ROUTED:
+            setattr(bot, name, functools.partial(self._routed, key, name))
+        if not self._started:
+            for lane in self.lanes:
+                threading.Thread(target=self._run, args=(lane,), name=f"outbound-{lane.index}", daemon=True).start()
+            self._started = True
+        return self
+
+    # ── Submitting ───────────────────────────────────────
+
+    def _routed(self, key: int, method: str, *args, **kwargs):
+        # Lane threads themselves call straight through
+        if getattr(self._local, "in_lane", False):
+            return self.originals[key][method](*args, **kwargs)
+        return self.submit(key, method, *args, **kwargs).result()
+
+    def submit(self, key: int, method: str, *args, **kwargs) -> Future:
+        """Queue a Bot API call for installed bot `key`; the Future resolves to its result (or raises its error)."""
+        pos     = ROUTED[method]
+        chat_id = args[pos] if len(args) > pos else kwargs.get("chat_id")
+        lane    = self.lanes[hash(chat_id) % len(self.lanes)]
+        future  = Future()
+        # [priority, seq, ..., attempts so far]; a list so a retry can bump the attempt
+        item    = [_priority.get(), next(self._seq), future, key, method, chat_id, args, kwargs, 0]
+        with lane.cond:
+            # Back-pressure: wait for room, but never make OTP delivery wait on a full lane
+            while lane.depth() >= lane.size and item[0] != OTP:
+                lane.cond.wait()
+            heapq.heappush(lane.heap, item)
+            lane.cond.notify_all()
+        return future
+
+    # ── Sending ──────────────────────────────────────────
+
+    def _count(self, name: str):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    def _run(self, lane: _Lane):
+        self._local.in_lane = True
+        while True:
+            with lane.cond:
+                while True:
+                    timeout = lane.unpark(time.monotonic())
+                    if lane.heap:
+                        item = heapq.heappop(lane.heap)
+                        # A parked chat's later calls queue up behind the ones parked first
+                        if item[5] in lane.parked:
+                            lane.park(item[5], 0, item)
+                            continue
+                        break
+                    lane.cond.wait(timeout)
+                lane.cond.notify_all()
+            future = item[2]
+            if not future.running() and not future.set_running_or_notify_cancel():
+                continue
+            try:
+                wait = self._call(lane, item)
+            except Exception as e:
+                self._count("failed")
+                future.set_exception(e)
+                continue
+            if wait is not None:
+                with lane.cond:
+                    lane.park(item[5], time.monotonic() + wait, item)
+                    lane.cond.notify_all()
+
+    def _call(self, lane: _Lane, item: list):
+        """
+        One attempt at the call. Sets the future's result and returns None, or
+        returns the seconds the chat must wait before the attempt is repeated.
+        """
+        level, _, future, key, method, chat_id, args, kwargs, attempt = item
+        # Chat buckets are shared by all bots: a user of two shops is held to one chat's rate
+        chat_bucket = lane.bucket(chat_id) if isinstance(chat_id, int) else None
+        if chat_bucket is not None:
+            wait = chat_bucket.try_acquire()
+            if wait:
+                return wait
+        wait = self.bots[key].try_acquire(reserve=BROADCAST_RESERVE if level == BROADCAST else 0)
+        if wait:
+            if chat_bucket is not None:
+                chat_bucket.refund()
+            return wait
+        if attempt:
+            _rewind(args, kwargs)
+        item[8] += 1
+        try:
+            result = self.originals[key][method](*args, **kwargs)
+        except ApiTelegramException as e:
+            if e.error_code != 429 or item[8] == MAX_ATTEMPTS:
+                raise
+            wait = retry_after(e)
+            self._count("throttled")
+            logger.warning(f"429 for chat {chat_id}, retrying in {wait:g}s")
+            if chat_bucket is not None:
+                chat_bucket.pause(wait)
+        except (ConnectionError, TimeoutError, OSError) as e:
+            if item[8] == MAX_ATTEMPTS:
+                raise
+            logger.warning(f"{method} to {chat_id} failed ({e}), retrying")
+            wait = 0.5 * 2 ** attempt
+        else:
+            self._count("sent")
+            future.set_result(result)
+            return None
+        self._count("retried")
+        return wait
+
+    # ── Metrics ──────────────────────────────────────────
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            counters = dict(self.counters)
+        queued = []
+        for lane in self.lanes:
+            with lane.cond:
+                queued.append(lane.depth())
+        return {**counters, "queued": queued}
+
+
+dispatcher = Dispatcher()
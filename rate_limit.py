@@ -0,0 +1,66 @@
+"""
+Rate Limiting
+-------------
+Thread-safe token bucket for pacing Bot API calls.
+
+    bucket = TokenBucket(rate=25, capacity=25)   # ~25 msg/s, bursts of 25
+    bucket.acquire()                              # blocks until a token is free
+    bucket.pause(retry_after)                     # on 429: nobody sends until then
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate         = float(rate)
+        self.capacity     = float(capacity if capacity is not None else rate)
+        self.tokens       = self.capacity
+        self.updated      = time.monotonic()
+        self.paused_until = 0.0
+        self._lock        = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def try_acquire(self, n: float = 1, reserve: float = 0) -> float:
+        """
+        Take n tokens if available and return 0, else return seconds to wait.
+        reserve: tokens that must remain afterwards (lets low-priority callers
+        leave headroom for everyone else).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self._refill(now)
+            if self.tokens - n >= reserve:
+                self.tokens -= n
+                return 0.0
+            return (n + reserve - self.tokens) / self.rate
+
+    def refund(self, n: float = 1):
+        """Give back n tokens taken by try_acquire() for a call that did not go out."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + n)
+
+    def acquire(self, n: float = 1, timeout: float = None, reserve: float = 0) -> bool:
+        """Block until n tokens are taken; False if that would take longer than timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(n, reserve)
+            if wait == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds` (Telegram's retry_after) and drain the bucket."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens  = 0.0
+            self.updated = self.paused_until
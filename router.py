@@ -0,0 +1,149 @@
+"""
+Update Router
+-------------
+Constant-time dispatch for bot updates, replacing telebot's linear chain of
+`func=lambda m: ...` filters and the long if/elif state chain:
+- /commands       → dict
+- menu texts      → exact-match dict (label with or without its leading emoji)
+- callback data   → prefix trie, longest registered prefix wins
+- per-user states → state → handler table
+
+Dispatch cost depends on the length of the incoming text / callback data,
+never on how many routes are registered.
+
+Usage:
+    router = Router(get_state, is_admin)
+
+    @router.text("💰 Add Balance")
+    def add_balance(message): ...
+
+    @router.callback(prefix="topup_")
+    def topup_cb(call): ...
+
+    @router.state("set_price", admin=True)
+    def on_set_price(message, uid, text): ...
+
+    router.attach(bot)
+"""
+
+import re
+
+_PREFIX = object()   # trie node key: handler for data starting here
+_EXACT  = object()   # trie node key: handler for data ending exactly here
+
+_LEADING_SYMBOLS = re.compile(r"^[^\w/]+")
+
+
+def normalize_label(text: str) -> str:
+    """'💰 Add Balance' → 'Add Balance', so typed labels route like button taps."""
+    return _LEADING_SYMBOLS.sub("", text).strip()
+
+
+class PrefixTrie:
+    """Character trie mapping string prefixes (and exact strings) to values."""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key: str, value, exact: bool = False):
+        node = self.root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[_EXACT if exact else _PREFIX] = value
+
+    def match(self, data: str):
+        """Exact match if registered, else the value of the longest matching prefix."""
+        node = self.root
+        best = node.get(_PREFIX)
+        for ch in data:
+            node = node.get(ch)
+            if node is None:
+                return best
+            best = node.get(_PREFIX, best)
+        return node.get(_EXACT, best)
+
+
+class Router:
+    def __init__(self, get_state, is_admin):
+        self.get_state = get_state
+        self.is_admin  = is_admin
+        self.commands  = {}
+        self.texts     = {}
+        self.callbacks = PrefixTrie()
+        # { state: (handler, admin_only) }
+        self.states    = {}
+
+    # ── Registration ─────────────────────────────────────
+
+    def command(self, *names):
+        def decorator(fn):
+            for name in names:
+                self.commands["/" + name] = fn
+            return fn
+        return decorator
+
+    def text(self, *labels):
+        def decorator(fn):
+            for label in labels:
+                self.texts[label] = fn
+                self.texts.setdefault(normalize_label(label), fn)
+            return fn
+        return decorator
+
+    def callback(self, data: str = None, prefix: str = None):
+        def decorator(fn):
+            if data is not None:
+                self.callbacks.insert(data, fn, exact=True)
+            if prefix is not None:
+                self.callbacks.insert(prefix, fn)
+            return fn
+        return decorator
+
+    def state(self, *states, admin: bool = False):
+        def decorator(fn):
+            for state in states:
+                self.states[state] = (fn, admin)
+            return fn
+        return decorator
+
+    # ── Dispatch ─────────────────────────────────────────
+
+    def resolve_message(self, message):
+        """Return (handler, args) for a text message, or (None, None)."""
+        text = message.text or ""
+        if text.startswith("/"):
+            fn = self.commands.get(text.split(maxsplit=1)[0].split("@", 1)[0])
+            if fn:
+                return fn, (message,)
+
+        fn = self.texts.get(text) or self.texts.get(normalize_label(text))
+        if fn:
+            return fn, (message,)
+
+        uid   = message.from_user.id
+        entry = self.states.get(self.get_state(uid))
+        if entry is None:
+            return None, None
+        fn, admin_only = entry
+        if admin_only and not self.is_admin(uid):
+            return None, None
+        return fn, (message, uid, text.strip())
+
+    def dispatch_message(self, message) -> bool:
+        fn, args = self.resolve_message(message)
+        if fn is None:
+            return False
+        fn(*args)
+        return True
+
+    def dispatch_callback(self, call) -> bool:
+        fn = self.callbacks.match(call.data or "")
+        if fn is None:
+            return False
+        fn(call)
+        return True
+
+    def attach(self, bot):
+        """Register the router as the bot's only text + callback handler."""
+        bot.register_message_handler(self.dispatch_message, content_types=["text"])
+        bot.register_callback_query_handler(self.dispatch_callback, func=lambda c: True)
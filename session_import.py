@@ -0,0 +1,224 @@
+"""
+Session Import
+--------------
+Bulk import of existing Telethon sessions into account stock:
+- Telethon .session SQLite files
+- text lists of exported StringSessions, one per line, either
+  "<session>" or "<phone>:<session>[:<2fa password>]" (":" "|" "," or tab)
+- .zip archives containing any mix of the above
+
+Input is parsed lazily, sessions are validated concurrently with a live
+get_me() call, and each chunk of valid accounts is stored with one
+executemany upsert (db.save_accounts) as soon as it is checked. Sold or
+reserved phones are not overwritten; they are reported as skipped.
+
+CLI:
+    python session_import.py accounts.zip more.txt [--no-validate]
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import zipfile
+from typing import NamedTuple
+from telethon.crypto import AuthKey
+from telethon.sessions import StringSession
+import database as db
+import session_manager
+import shops
+
+logger = logging.getLogger(__name__)
+
+VALIDATE_CONCURRENCY = 50
+VALIDATE_TIMEOUT     = 20
+CHUNK_SIZE           = 500
+
+_SPLIT_RE = re.compile(r"[:|,\t]")
+_PHONE_RE = re.compile(r"\+?\d{7,15}")
+
+
+class Candidate(NamedTuple):
+    phone: str            # may be "" until validation resolves it
+    session_string: str
+    password_2fa: str
+    source: str
+
+
+# ─────────────────── PARSING ──────────────────────────
+
+def session_file_to_string(path: str) -> str | None:
+    """Convert a Telethon .session SQLite file to a StringSession string."""
+    try:
+        con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        row = con.execute("SELECT dc_id, server_address, port, auth_key FROM sessions").fetchone()
+        con.close()
+    except sqlite3.Error:
+        return None
+    if not row or not row[3]:
+        return None
+    session = StringSession()
+    session.set_dc(row[0], row[1], row[2])
+    session.auth_key = AuthKey(row[3])
+    return session.save()
+
+
+def parse_line(line: str, source: str) -> Candidate | None:
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    parts = _SPLIT_RE.split(line)
+    if len(parts) == 1:
+        return Candidate("", parts[0], "", source)
+    phone = parts[0].strip()
+    if not _PHONE_RE.fullmatch(phone):
+        return Candidate("", "", "", source)
+    if not phone.startswith("+"):
+        phone = "+" + phone
+    password = parts[2].strip() if len(parts) > 2 else ""
+    return Candidate(phone, parts[1].strip(), password, source)
+
+
+def _iter_text(stream, source: str):
+    for raw in stream:
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8", "ignore")
+        candidate = parse_line(raw, source)
+        if candidate:
+            yield candidate
+
+
+def _iter_session_file(path: str, source: str):
+    phone = os.path.splitext(os.path.basename(source))[0]
+    phone = ("+" + phone.lstrip("+")) if _PHONE_RE.fullmatch(phone) else ""
+    yield Candidate(phone, session_file_to_string(path) or "", "", source)
+
+
+def _iter_zip(path: str):
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            name = info.filename
+            if name.endswith(".session"):
+                with tempfile.NamedTemporaryFile(suffix=".session", delete=False) as tmp:
+                    with zf.open(info) as member:
+                        while chunk := member.read(65536):
+                            tmp.write(chunk)
+                try:
+                    yield from _iter_session_file(tmp.name, name)
+                finally:
+                    os.unlink(tmp.name)
+            elif name.endswith((".txt", ".csv")):
+                with zf.open(info) as member:
+                    yield from _iter_text(member, name)
+
+
+def iter_candidates(path: str, name: str = None):
+    """Yield Candidates from one uploaded file without loading it into memory."""
+    name = name or os.path.basename(path)
+    if zipfile.is_zipfile(path):
+        yield from _iter_zip(path)
+    elif name.endswith(".session"):
+        yield from _iter_session_file(path, name)
+    else:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            yield from _iter_text(f, name)
+
+
+# ─────────────────── VALIDATION ───────────────────────
+
+async def validate(candidate: Candidate) -> Candidate | None:
+    """Log in with the session and resolve its phone. None if the session is dead."""
+    if not candidate.session_string:
+        return None
+    client = session_manager.client_factory(candidate.session_string)
+    try:
+        await asyncio.wait_for(client.connect(), VALIDATE_TIMEOUT)
+        me = await asyncio.wait_for(client.get_me(), VALIDATE_TIMEOUT)
+        if me is None or not getattr(me, "phone", None):
+            return None
+        return candidate._replace(phone="+" + me.phone.lstrip("+"))
+    except Exception as e:
+        logger.info(f"Session from {candidate.source} invalid: {e}")
+        return None
+    finally:
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
+
+
+def _chunks(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def import_files(paths: list, check: bool = True) -> dict:
+    """
+    Import sessions from (path, display_name) pairs, saving each chunk of
+    CHUNK_SIZE as soon as it is validated. Returns {"imported", "updated",
+    "duplicate", "invalid": n, "skipped": [(phone, status), ...]} — see
+    db.save_accounts for updated / skipped.
+    """
+    loop   = asyncio.get_running_loop()
+    sem    = asyncio.Semaphore(VALIDATE_CONCURRENCY)
+    seen   = set()      # phones met so far; a later line with the same phone is a duplicate
+    report = {"imported": 0, "updated": 0, "duplicate": 0, "invalid": 0, "skipped": []}
+
+    async def check_one(candidate):
+        async with sem:
+            return await validate(candidate)
+
+    def candidates():
+        for path, name in paths:
+            yield from iter_candidates(path, name)
+
+    for chunk in _chunks(candidates(), CHUNK_SIZE):
+        if check:
+            results = await asyncio.gather(*[check_one(c) for c in chunk])
+        else:
+            results = [c if c.phone and c.session_string else None for c in chunk]
+        rows = []
+        for candidate in results:
+            if candidate is None:
+                report["invalid"] += 1
+            elif candidate.phone in seen:
+                report["duplicate"] += 1
+            else:
+                seen.add(candidate.phone)
+                rows.append((candidate.phone, candidate.password_2fa, candidate.session_string))
+        saved = await loop.run_in_executor(None, shops.bind(db.save_accounts), rows)
+        report["imported"] += saved["imported"]
+        report["updated"]  += saved["updated"]
+        report["skipped"]  += saved["skipped"]
+    return report
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Bulk import Telethon sessions into account stock.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="skip the live get_me() check (lines must carry a phone)")
+    args = parser.parse_args()
+
+    db.init_db()
+    report = asyncio.run(import_files([(p, os.path.basename(p)) for p in args.files],
+                                      check=not args.no_validate))
+    print(f"Imported: {report['imported']}  Updated: {report['updated']}  Duplicate: {report['duplicate']}  "
+          f"Invalid: {report['invalid']}  Skipped: {len(report['skipped'])}")
+    for phone, status in report["skipped"]:
+        print(f"  skipped {phone}: {status}")
+
+
+if __name__ == "__main__":
+    main()
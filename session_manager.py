@@ -6,11 +6,16 @@ Handles all Telethon userbot operations:
 - Buyer flow: listen for new login OTP on purchased account, forward to buyer,
               then finalize payment ONLY after OTP is delivered.
               If buyer cancels before OTP arrives → account released, no charge.
+              A bare, unlabelled code is held for UNSURE_OTP_GRACE seconds
+              first, so the buyer can still cancel and a labelled one wins.
 """
 
 import asyncio
 import logging
-import re
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
 from telethon.errors import (
@@ -19,14 +24,21 @@ from telethon.errors import (
     PasswordHashInvalidError,
     FloodWaitError,
 )
+from telebot import types
 import database as db
+import async_db as adb
+import metrics
+import otp_extractor
+import outbound
+import shops
+from markup_cache import frozen
 from config import API_ID, API_HASH
 
 logger = logging.getLogger(__name__)
 
 # ── Review rating inline keyboard (used after purchase) ──
+@frozen
 def _review_rating_kb():
-    from telebot import types
     m = types.InlineKeyboardMarkup(row_width=5)
     m.add(
         types.InlineKeyboardButton("⭐ 1", callback_data="review_1"),
@@ -46,12 +58,29 @@ buyer_cancel_events = {}
 pending_logins = {}
 
 
+def _make_client(session_string: str = ""):
+    return TelegramClient(StringSession(session_string), API_ID, API_HASH)
+
+# Builds every Telethon client this module uses.
+# Load tests swap in fake_telethon.FakeTelegram().client_factory.
+client_factory = _make_client
+
+# Every client built through _new_client, for diagnostics (live / connected counts)
+live_clients = weakref.WeakSet()
+
+
+def _new_client(session_string: str = ""):
+    client = client_factory(session_string)
+    live_clients.add(client)
+    return client
+
+
 # ─────────────────── ADMIN: ADD ACCOUNT ───────────────
 
 async def send_otp(admin_id: int, phone: str) -> tuple:
     """Send OTP to phone number. Returns (success, message)."""
     try:
-        client = TelegramClient(StringSession(), API_ID, API_HASH)
+        client = _new_client()
         await client.connect()
         result = await client.send_code_request(phone)
         pending_logins[admin_id] = {
@@ -80,7 +109,7 @@ async def verify_otp(admin_id: int, code: str) -> tuple:
         await client.sign_in(phone, code, phone_code_hash=phone_code_hash)
         session_string = client.session.save()
         await client.disconnect()
-        db.save_account(phone, "", session_string)
+        await adb.save_account(phone, "", session_string)
         pending_logins.pop(admin_id, None)
         return False, True, f"✅ Account <code>{phone}</code> saved!\n\n📱 No 2FA — account is ready to sell."
     except SessionPasswordNeededError:
@@ -104,7 +133,7 @@ async def verify_2fa(admin_id: int, password: str) -> tuple:
         await client.sign_in(password=password)
         session_string = client.session.save()
         await client.disconnect()
-        db.save_account(phone, password, session_string)
+        await adb.save_account(phone, password, session_string)
         pending_logins.pop(admin_id, None)
         return True, f"✅ Account <code>{phone}</code> saved with 2FA!\n\nAccount is ready to sell."
     except PasswordHashInvalidError:
@@ -123,78 +152,354 @@ async def cancel_pending(admin_id: int):
             pass
 
 
+# ─────────────────── ADMIN: BATCH ADD ─────────────────
+# Admin pastes many phones at once. Code requests go out concurrently
+# (capped + paused on FloodWait), then each OTP / 2FA reply is verified
+# independently and the account is saved as soon as it signs in.
+
+BATCH_CONCURRENCY   = 4     # simultaneous code requests per batch
+BATCH_MAX_FLOOD     = 120   # longer FloodWaits fail the phone instead of pausing
+
+# { admin_id: { phone: { "client": ..., "phone_code_hash": ..., "stage": "otp" | "2fa" } } }
+batch_logins = {}
+# admin_id → code requests of the running send_otp_batch that have not finished yet
+batch_requesting = {}
+
+
+class FloodWaitLimiter:
+    """Concurrency cap for code requests. A FloodWait pauses every caller until it expires."""
+
+    def __init__(self, concurrency: int):
+        self._sem       = asyncio.Semaphore(concurrency)
+        self._resume_at = 0.0
+
+    async def __aenter__(self):
+        await self._sem.acquire()
+        loop = asyncio.get_running_loop()
+        while loop.time() < self._resume_at:
+            await asyncio.sleep(self._resume_at - loop.time())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._sem.release()
+
+    def flood(self, seconds: int):
+        loop = asyncio.get_running_loop()
+        self._resume_at = max(self._resume_at, loop.time() + seconds)
+
+
+async def _request_batch_code(admin_id: int, phone: str, limiter: FloodWaitLimiter) -> tuple:
+    client = None
+    for attempt in range(2):
+        async with limiter:
+            try:
+                if client is None:
+                    fresh = _new_client()
+                    await fresh.connect()
+                    client = fresh
+                result = await client.send_code_request(phone)
+                if admin_id not in batch_requesting:
+                    error = "batch cancelled"
+                    break
+                batch_logins.setdefault(admin_id, {})[phone] = {
+                    "client": client,
+                    "phone_code_hash": result.phone_code_hash,
+                    "stage": "otp",
+                }
+                return True, f"📱 <code>{phone}</code> — OTP sent.\nReply to this message with the code."
+            except FloodWaitError as e:
+                if attempt or e.seconds > BATCH_MAX_FLOOD:
+                    error = f"flood wait {e.seconds}s"
+                    break
+                limiter.flood(e.seconds)
+            except Exception as e:
+                error = str(e)
+                break
+    if client is not None:
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
+    return False, f"❌ <code>{phone}</code> — could not send OTP: {error}"
+
+
+async def send_otp_batch(admin_id: int, phones: list, on_result) -> tuple:
+    """
+    Send code requests for every phone concurrently.
+    on_result(phone, ok, message) is called from a worker thread as each
+    request finishes, so it may make blocking Bot API calls.
+    Returns (sent, failed).
+    """
+    loop    = asyncio.get_running_loop()
+    limiter = FloodWaitLimiter(BATCH_CONCURRENCY)
+    batch_requesting[admin_id] = len(phones)
+
+    async def one(phone):
+        try:
+            ok, msg = await _request_batch_code(admin_id, phone, limiter)
+        finally:
+            # A phone whose code went out is pending in batch_logins from here on
+            if admin_id in batch_requesting:
+                batch_requesting[admin_id] -= 1
+        try:
+            await loop.run_in_executor(None, shops.bind(on_result), phone, ok, msg)
+        except Exception as e:
+            logger.warning(f"Batch result callback failed for {phone}: {e}")
+        return ok
+
+    try:
+        results = await asyncio.gather(*[one(p) for p in phones])
+    finally:
+        batch_requesting.pop(admin_id, None)
+    sent = sum(1 for ok in results if ok)
+    return sent, len(results) - sent
+
+
+def batch_stage(admin_id: int, phone: str):
+    """'otp', '2fa' or None if the phone is not pending in this admin's batch."""
+    data = batch_logins.get(admin_id, {}).get(phone)
+    return data["stage"] if data else None
+
+
+def batch_remaining(admin_id: int) -> int:
+    """Phones still to finish: logins waiting for a code or password, plus code requests not sent yet."""
+    return len(batch_logins.get(admin_id, {})) + batch_requesting.get(admin_id, 0)
+
+
+async def _save_batch_login(admin_id: int, phone: str, password: str) -> None:
+    data = batch_logins[admin_id].pop(phone)
+    session_string = data["client"].session.save()
+    await data["client"].disconnect()
+    await adb.save_account(phone, password, session_string)
+    if not batch_logins[admin_id]:
+        batch_logins.pop(admin_id, None)
+
+
+async def verify_batch_otp(admin_id: int, phone: str, code: str) -> tuple:
+    """Verify OTP for one phone in a batch. Returns (needs_2fa, success, message)."""
+    data = batch_logins.get(admin_id, {}).get(phone)
+    if not data:
+        return False, False, f"❌ <code>{phone}</code> is not waiting for a code."
+
+    try:
+        await data["client"].sign_in(phone, code, phone_code_hash=data["phone_code_hash"])
+        await _save_batch_login(admin_id, phone, "")
+        return False, True, f"✅ <code>{phone}</code> saved — no 2FA."
+    except SessionPasswordNeededError:
+        data["stage"] = "2fa"
+        return True, True, f"🔐 <code>{phone}</code> has 2FA.\nReply to this message with the password."
+    except PhoneCodeInvalidError:
+        return False, False, f"❌ Invalid OTP for <code>{phone}</code>. Reply again with the right code."
+    except Exception as e:
+        return False, False, f"❌ <code>{phone}</code>: {e}"
+
+
+async def verify_batch_2fa(admin_id: int, phone: str, password: str) -> tuple:
+    """Submit 2FA for one phone in a batch. Returns (success, message)."""
+    data = batch_logins.get(admin_id, {}).get(phone)
+    if not data or data["stage"] != "2fa":
+        return False, f"❌ <code>{phone}</code> is not waiting for a 2FA password."
+
+    try:
+        await data["client"].sign_in(password=password)
+        await _save_batch_login(admin_id, phone, password)
+        return True, f"✅ <code>{phone}</code> saved with 2FA."
+    except PasswordHashInvalidError:
+        return False, f"❌ Wrong 2FA password for <code>{phone}</code>. Try again."
+    except Exception as e:
+        return False, f"❌ <code>{phone}</code>: {e}"
+
+
+async def cancel_batch(admin_id: int):
+    """Disconnect every pending login of an admin's batch; code requests still running are dropped."""
+    batch_requesting.pop(admin_id, None)
+    for data in batch_logins.pop(admin_id, {}).values():
+        try:
+            await data["client"].disconnect()
+        except Exception:
+            pass
+
+
+# ─────────────────── BUYER: OTP DELIVERY ──────────────
+# OTP messages get their own pool so they never queue behind other executor
+# work on the loop. Finalize / balance / review follow on a second pool.
+
+DELIVERY_WORKERS = 8
+FOLLOWUP_WORKERS = 4
+# A bare, unlabelled code (confidence < 1.0) is held this long in case the
+# labelled login message follows; the buyer can still cancel meanwhile.
+UNSURE_OTP_GRACE = 15
+
+_delivery_executor = ThreadPoolExecutor(DELIVERY_WORKERS, thread_name_prefix="otp-delivery")
+_followup_executor = ThreadPoolExecutor(FOLLOWUP_WORKERS, thread_name_prefix="otp-followup")
+
+
+# OTP arrival (777000 message) → OTP message accepted by the Bot API
+delivery_latency = metrics.histogram(
+    "otp_delivery_seconds", "OTP arrival to OTP message accepted by the Bot API",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# Purchase funnel, each stage timed from the buyer pressing confirm (bot.confirm_buy)
+FUNNEL = {
+    stage: metrics.histogram(
+        "shop_purchase_funnel_seconds", "Seconds from confirm_buy to each purchase stage",
+        metrics.FUNNEL_BUCKETS, stage=stage,
+    )
+    for stage in ("reserved", "connected", "otp_arrived", "delivered", "finalized")
+}
+PURCHASES = {
+    outcome: metrics.counter("shop_purchases_total", "confirm_buy attempts by outcome", outcome=outcome)
+    for outcome in ("delivered", "cancelled", "timeout", "error",
+                    "already_active", "insufficient_balance", "no_stock")
+}
+metrics.gauge("otp_listeners_active", "Buyers waiting for an OTP", fn=lambda: len(buyer_cancel_events))
+
+
+def _funnel(stage: str, started_at: float):
+    if started_at is not None:
+        FUNNEL[stage].observe(time.perf_counter() - started_at)
+
+
+def _otp_message(phone: str, code: str, password_2fa: str) -> str:
+    # One clean message with phone, OTP and password all copyable
+    msg = (
+        f"<tg-emoji emoji-id=\"6106981506754814207\">✅</tg-emoji> <b>Login Details Ready!</b>\n\n"
+        f"📱 <b>Phone Number:</b>\n<code>{phone}</code>\n\n"
+        f"🔑 <b>OTP Code:</b>\n<code>{code}</code>\n\n"
+    )
+    if password_2fa:
+        msg += f"<tg-emoji emoji-id=\"6106902616795519273\">🔒</tg-emoji> <b>2FA Password:</b>\n<code>{password_2fa}</code>\n\n"
+    msg += (
+        f"<tg-emoji emoji-id=\"6107323579425104140\">🤖</tg-emoji> <i>Enter the phone, then OTP, then 2FA to complete login.</i>"
+    )
+    return msg
+
+
+def _send_otp(bot, buyer_id: int, msg: str):
+    with outbound.priority(outbound.OTP):
+        bot.send_message(buyer_id, msg, parse_mode="HTML")
+
+
+def _notify(bot, buyer_id: int, msg: str):
+    """Best-effort buyer notice, run on the follow-up executor (never on the event loop)."""
+    try:
+        with outbound.priority(outbound.RECEIPT):
+            bot.send_message(buyer_id, msg, parse_mode="HTML")
+    except Exception as e:
+        logger.warning(f"Could not notify buyer {buyer_id}: {e}")
+
+
+def _after_delivery(bot, buyer_id: int, started_at: float = None):
+    """Deduct payment, then send the balance and review messages."""
+    try:
+        with outbound.priority(outbound.RECEIPT):
+            finalized = db.finalize_purchase(buyer_id)
+            if finalized:
+                _funnel("finalized", started_at)
+                new_balance = db.get_balance(buyer_id)
+                bot.send_message(
+                    buyer_id,
+                    f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Payment Deducted</b>\n\n"
+                    f"Remaining Balance: <b>{new_balance:.3f} TON</b>",
+                    parse_mode="HTML"
+                )
+
+            # Ask for review
+            bot.send_message(
+                buyer_id,
+                f"<tg-emoji emoji-id=\"6107325885822540958\">🎁</tg-emoji> <b>Leave a Review & Get Rewarded!</b>\n\n"
+                f"Enjoyed your purchase? Drop a quick review and receive\n"
+                f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>0.5 TON free balance</b> as a thank you!\n\n"
+                f"<tg-emoji emoji-id=\"6107212468621154692\">🏪</tg-emoji> Tap a star rating below to get started.",
+                parse_mode="HTML",
+                reply_markup=_review_rating_kb()
+            )
+    except Exception as e:
+        logger.warning(f"Post-delivery steps failed for buyer {buyer_id}: {e}")
+
+
+def delivery_stats() -> dict:
+    """OTP delivery latency histogram + executor backlog."""
+    return {
+        "latency": delivery_latency.snapshot(),
+        "delivery_queue": _delivery_executor._work_queue.qsize(),
+        "followup_queue": _followup_executor._work_queue.qsize(),
+    }
+
+
 # ─────────────────── BUYER: OTP LISTENER ──────────────
 
-async def start_otp_listener(bot, buyer_id: int, phone: str, session_string: str, password_2fa: str):
+async def start_otp_listener(bot, buyer_id: int, phone: str, session_string: str, password_2fa: str,
+                             started_at: float = None):
     """
     Spin up a Telethon client on the purchased account's session.
     Waits for the login OTP to arrive (from Telegram service account 777000).
     
     Payment is ONLY deducted after OTP is successfully delivered.
     If buyer cancels or times out → account released, zero charge.
+
+    started_at: perf_counter() when the buyer confirmed, for the FUNNEL histograms.
     """
     # Register a cancel event for this buyer
     cancel_event = asyncio.Event()
     buyer_cancel_events[buyer_id] = cancel_event
 
     try:
-        client = TelegramClient(StringSession(session_string), API_ID, API_HASH)
+        client = _new_client(session_string)
         await client.connect()
+        _funnel("connected", started_at)
 
         otp_delivered = asyncio.Event()
+        delivering    = False
+
+        async def deliver(match, arrived):
+            nonlocal delivering
+            if delivering or cancel_event.is_set():
+                return
+            # Past this point the buyer can no longer cancel — the code is going out
+            delivering = True
+            _funnel("otp_arrived", started_at)
+            buyer_cancel_events.pop(buyer_id, None)
+
+            loop = asyncio.get_running_loop()
+            msg  = _otp_message(phone, match.code, password_2fa)
+            try:
+                await loop.run_in_executor(_delivery_executor, shops.bind(_send_otp), bot, buyer_id, msg)
+            except Exception as e:
+                logger.warning(f"Could not deliver OTP to buyer {buyer_id}: {e}")
+                delivering = False
+                buyer_cancel_events[buyer_id] = cancel_event
+                return
+
+            delivery_latency.observe(time.perf_counter() - arrived)
+            _funnel("delivered", started_at)
+            otp_delivered.set()
+            # Finalize, balance and review messages don't hold up the listener
+            loop.run_in_executor(_followup_executor, shops.bind(_after_delivery), bot, buyer_id, started_at)
+
+        async def deliver_unsure(match, arrived):
+            # Only goes out if no labelled code (or cancel) turned up in the grace period
+            try:
+                await asyncio.wait_for(cancel_event.wait(), UNSURE_OTP_GRACE)
+            except asyncio.TimeoutError:
+                await deliver(match, arrived)
+
+        held = None
 
         @client.on(events.NewMessage(from_users=777000))
         async def otp_handler(event):
-            text = event.message.message or ""
-            match = re.search(r'(\d{5,6})', text)
-            if not match:
+            nonlocal held
+            arrived = time.perf_counter()
+            match = otp_extractor.extract_otp(event.message.message or "")
+            if not match or delivering:
                 return
-            code = match.group(1)
-            loop = asyncio.get_event_loop()
-
-            def send_all():
-                try:
-                    # Build one clean message with phone, OTP and password all copyable
-                    msg = (
-                        f"<tg-emoji emoji-id=\"6106981506754814207\">✅</tg-emoji> <b>Login Details Ready!</b>\n\n"
-                        f"📱 <b>Phone Number:</b>\n<code>{phone}</code>\n\n"
-                        f"🔑 <b>OTP Code:</b>\n<code>{code}</code>\n\n"
-                    )
-                    if password_2fa:
-                        msg += f"<tg-emoji emoji-id=\"6106902616795519273\">🔒</tg-emoji> <b>2FA Password:</b>\n<code>{password_2fa}</code>\n\n"
-                    msg += (
-                        f"<tg-emoji emoji-id=\"6107323579425104140\">🤖</tg-emoji> <i>Enter the phone, then OTP, then 2FA to complete login.</i>"
-                    )
-                    bot.send_message(buyer_id, msg, parse_mode="HTML")
-
-                    # Deduct payment and finalize
-                    finalized = db.finalize_purchase(buyer_id)
-                    if finalized:
-                        new_balance = db.get_balance(buyer_id)
-                        bot.send_message(
-                            buyer_id,
-                            f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>Payment Deducted</b>\n\n"
-                            f"Remaining Balance: <b>{new_balance:.3f} TON</b>",
-                            parse_mode="HTML"
-                        )
-
-                    # Ask for review
-                    bot.send_message(
-                        buyer_id,
-                        f"<tg-emoji emoji-id=\"6107325885822540958\">🎁</tg-emoji> <b>Leave a Review & Get Rewarded!</b>\n\n"
-                        f"Enjoyed your purchase? Drop a quick review and receive\n"
-                        f"<tg-emoji emoji-id=\"6106898347598027963\">🪙</tg-emoji> <b>0.5 TON free balance</b> as a thank you!\n\n"
-                        f"<tg-emoji emoji-id=\"6107212468621154692\">🏪</tg-emoji> Tap a star rating below to get started.",
-                        parse_mode="HTML",
-                        reply_markup=_review_rating_kb()
-                    )
-
-                except Exception as e:
-                    logger.warning(f"Could not deliver OTP to buyer {buyer_id}: {e}")
-
-            # Run all bot sends in a thread so they don't block the Telethon event loop
-            await loop.run_in_executor(None, send_all)
-            otp_delivered.set()
+            if match.confidence >= 1.0:
+                if held:
+                    held.cancel()
+                await deliver(match, arrived)
+            elif held is None or held.done():
+                held = asyncio.ensure_future(deliver_unsure(match, arrived))
 
         # Wait for OTP, cancellation, or 5-minute timeout
         otp_task = asyncio.ensure_future(otp_delivered.wait())
@@ -209,50 +514,46 @@ async def start_otp_listener(bot, buyer_id: int, phone: str, session_string: str
         # Cancel remaining tasks cleanly
         for t in pending:
             t.cancel()
+        if held and not otp_delivered.is_set():
+            held.cancel()
 
-        if cancel_event.is_set():
+        if otp_delivered.is_set():
+            PURCHASES["delivered"].inc()
+
+        elif cancel_event.is_set():
             # Buyer cancelled — release account, no charge
-            db.cancel_purchase(buyer_id)
-            try:
-                bot.send_message(
-                    buyer_id,
-                    "❌ <b>Purchase Cancelled</b>\n\n"
-                    "Your account has been released and you have <b>not been charged</b>.\n"
-                    "Your balance remains intact.",
-                    parse_mode="HTML"
-                )
-            except Exception:
-                pass
+            PURCHASES["cancelled"].inc()
+            await adb.cancel_purchase(buyer_id)
+            _followup_executor.submit(
+                shops.bind(_notify), bot, buyer_id,
+                "❌ <b>Purchase Cancelled</b>\n\n"
+                "Your account has been released and you have <b>not been charged</b>.\n"
+                "Your balance remains intact."
+            )
 
         elif not otp_delivered.is_set():
             # Timeout — OTP never arrived, release account, no charge
-            db.cancel_purchase(buyer_id)
-            try:
-                bot.send_message(
-                    buyer_id,
-                    "⏰ <b>OTP Listener Timed Out</b>\n\n"
-                    "No login code was detected within 5 minutes.\n"
-                    "You have <b>not been charged</b>. Your balance is intact.\n\n"
-                    "Please try purchasing again or contact support.",
-                    parse_mode="HTML"
-                )
-            except Exception:
-                pass
+            PURCHASES["timeout"].inc()
+            await adb.cancel_purchase(buyer_id)
+            _followup_executor.submit(
+                shops.bind(_notify), bot, buyer_id,
+                "⏰ <b>OTP Listener Timed Out</b>\n\n"
+                "No login code was detected within 5 minutes.\n"
+                "You have <b>not been charged</b>. Your balance is intact.\n\n"
+                "Please try purchasing again or contact support."
+            )
 
         await client.disconnect()
 
     except Exception as e:
         logger.error(f"OTP listener error for {phone}: {e}")
+        PURCHASES["error"].inc()
         # On any error — release account and don't charge
-        db.cancel_purchase(buyer_id)
-        try:
-            bot.send_message(
-                buyer_id,
-                f"❌ <b>Error during OTP listening.</b>\nYou have not been charged.\n\n<code>{e}</code>",
-                parse_mode="HTML"
-            )
-        except Exception:
-            pass
+        await adb.cancel_purchase(buyer_id)
+        _followup_executor.submit(
+            shops.bind(_notify), bot, buyer_id,
+            f"❌ <b>Error during OTP listening.</b>\nYou have not been charged.\n\n<code>{e}</code>"
+        )
     finally:
         buyer_cancel_events.pop(buyer_id, None)
 
@@ -0,0 +1,114 @@
+"""
+Shops
+-----
+One process hosting several storefronts (config.SHOPS) instead of a full
+copy of the bot per shop. Each shop has its own bot token, TON wallet,
+DB file (users, balances, stock, settings such as the price) and
+conversation states; the event loop, update workers, outbound dispatcher,
+executors, HTTP sessions and metrics are shared.
+
+The shop being served is a ContextVar:
+- every shop's bot hands updates to the shared UpdateWorkers with
+  process=shop.process, which runs the handlers with that shop current
+- database._con() opens the current shop's DB file, and `bot` / `states`
+  in bot.py are proxies for the current shop's TeleBot / StateStore
+- asyncio tasks inherit the shop from whoever scheduled them; thread pools
+  do not, so work handed to an executor goes through shops.bind(fn)
+
+All shops' bots share one set of registered handlers. With SHOPS empty
+there is one shop, made from BOT_TOKEN / BOT_WALLET / database.DB_PATH.
+
+    for shop in shops.all():
+        shop.run(db.init_db)
+"""
+
+import contextvars
+import functools
+
+import telebot
+
+import database as db
+from config import BOT_TOKEN, BOT_WALLET, TON_API_KEY, SHOPS
+
+current = contextvars.ContextVar("shop")
+
+
+class Shop:
+    def __init__(self, name: str, token: str, wallet: str, db_path: str = None,
+                 ton_api_key: str = TON_API_KEY, template: telebot.TeleBot = None):
+        self.name        = name
+        self.wallet      = wallet
+        self.db_path     = db_path           # None → database.DB_PATH
+        self.ton_api_key = ton_api_key
+        self.states      = None              # StateStore, set by bot.py
+        self.bot         = telebot.TeleBot(token, parse_mode=None, threaded=False)
+        if template is not None:
+            # Share the handler lists: handlers registered later on the template apply here too
+            for attr, value in vars(template).items():
+                if attr.endswith("_handlers") and isinstance(value, list):
+                    setattr(self.bot, attr, value)
+        self._process = self.bot.process_new_updates
+
+    def run(self, fn, *args, **kwargs):
+        """Call fn with this shop current."""
+        token = current.set(self)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            current.reset(token)
+
+    def process(self, updates: list):
+        """The bot's own process_new_updates, with this shop current."""
+        self.run(self._process, updates)
+
+    def __repr__(self):
+        return f"<Shop {self.name}>"
+
+
+registry = {}   # name → Shop, in config order; the first is the default
+
+
+def add(name: str, token: str, wallet: str, db_path: str = None, ton_api_key: str = TON_API_KEY) -> Shop:
+    if name in registry:
+        raise ValueError(f"Duplicate shop name {name!r}")
+    template = next(iter(registry.values())).bot if registry else None
+    shop = registry[name] = Shop(name, token, wallet, db_path, ton_api_key, template)
+    return shop
+
+
+def all() -> list:
+    return list(registry.values())
+
+
+def get() -> Shop:
+    """The shop being served (the first shop outside any shop context)."""
+    shop = current.get(None)
+    return shop if shop is not None else _default
+
+
+def bind(fn):
+    """fn bound to the caller's context — for handing work to a thread pool."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+class Proxy:
+    """Stands in for one attribute of the current shop (bot.py's `bot`, `states`)."""
+
+    def __init__(self, attr: str):
+        object.__setattr__(self, "_attr", attr)
+
+    def __getattr__(self, name):
+        return getattr(getattr(get(), self._attr), name)
+
+    def __setattr__(self, name, value):
+        setattr(getattr(get(), self._attr), name, value)
+
+    def __len__(self):
+        return len(getattr(get(), self._attr))
+
+
+for _cfg in SHOPS or [{"name": "main", "token": BOT_TOKEN, "wallet": BOT_WALLET}]:
+    add(_cfg["name"], _cfg["token"], _cfg["wallet"], _cfg.get("db_path"), _cfg.get("ton_api_key", TON_API_KEY))
+_default = next(iter(registry.values()))
+
+db._db_path = lambda: get().db_path or db.DB_PATH
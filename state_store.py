@@ -0,0 +1,241 @@
+"""
+Conversation State Store
+------------------------
+Replaces the bot's unbounded user_states / state_data dicts.
+
+- one OrderedDict { user_id: [state, data, expires_at] } behind a lock —
+  get / set / clear are O(1) and safe from any update worker
+- every entry expires after its state's TTL; expired entries are dropped
+  when read, and each set() also drops the expired ones with the earliest
+  deadlines (a heap of (expires_at, user_id)), so abandoned flows (a buyer
+  who opened "Add Balance → Tonkeeper" and left) are reclaimed without a
+  full scan, whatever their TTL and however recently they were used
+- above max_entries the least recently used user is evicted
+- optional write-behind persistence: changes are coalesced per user and
+  flushed to the user_states table by a background thread, and loaded back
+  on startup so flows survive a restart. States tied to live in-memory
+  objects (a Telethon client mid-login, an OTP listener) are marked
+  volatile and never persisted.
+- shared mode (cluster workers): writes go to the DB at once and a miss
+  reads the DB, so whichever worker handles a user's next update sees the
+  state the previous one left. drop_cache() forgets everything cached
+  when users move to another worker.
+"""
+
+import contextvars
+import heapq
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# Expired entries dropped on every set()
+SWEEP_PER_SET = 2
+
+
+class StateStore:
+    def __init__(self, max_entries: int = 50000, default_ttl: float = 1800,
+                 ttls: dict = None, volatile: tuple = ()):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls        = ttls or {}
+        self.volatile    = frozenset(volatile)
+        self._entries    = OrderedDict()
+        # (expires_at, uid) per set(); stale once the user's entry changed or left — skipped when popped
+        self._deadlines  = []
+        self._lock       = threading.Lock()
+        # Held across swap-and-write, so flushes reach the DB in the order they took their rows
+        self._flush_lock = threading.Lock()
+        # { user_id: row tuple to upsert, or None to delete } — pending write-behind
+        self._dirty      = {}
+        self._flusher    = None
+        self._stop       = threading.Event()
+        self.shared      = False
+        self.counters    = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "flushes": 0, "rows_written": 0,
+                            "loads": 0}
+
+    # ── Operations ───────────────────────────────────────
+
+    def get(self, uid: int):
+        entry = self._live(uid)
+        return entry[0] if entry else None
+
+    def get_data(self, uid: int):
+        entry = self._live(uid)
+        return entry[1] if entry else None
+
+    def set(self, uid: int, state: str, data=None, ttl: float = None):
+        """Same contract as the old set_state(): data=None keeps the user's current data."""
+        expires_at = time.time() + (ttl or self.ttls.get(state, self.default_ttl))
+        with self._lock:
+            entry = self._entries.get(uid)
+            if data is None and entry is not None:
+                data = entry[1]
+            self._entries[uid] = [state, data, expires_at]
+            self._entries.move_to_end(uid)
+            self._push_deadline(uid, expires_at)
+            self._mark(uid, state, data, expires_at)
+            self._sweep_locked()
+        if self.shared:
+            self.flush()
+
+    def clear(self, uid: int):
+        with self._lock:
+            if self._entries.pop(uid, None) is not None or self.shared:
+                self._mark(uid, None)
+        if self.shared:
+            self.flush()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _live(self, uid: int):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                self.counters["misses"] += 1
+                if not self.shared:
+                    return None
+            elif entry[2] <= now:
+                del self._entries[uid]
+                self._mark(uid, None)
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+            else:
+                self._entries.move_to_end(uid)
+                self.counters["hits"] += 1
+                return entry
+        return self._load(uid, now)
+
+    def _load(self, uid: int, now: float):
+        row = db.load_user_state(uid, now)
+        if row is None:
+            return None
+        state, data, expires_at = row
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                entry = self._entries[uid] = [state, json.loads(data) if data else None, expires_at]
+                self._push_deadline(uid, expires_at)
+            self._entries.move_to_end(uid)
+            self.counters["loads"] += 1
+            return entry
+
+    def _push_deadline(self, uid: int, expires_at: float):
+        heapq.heappush(self._deadlines, (expires_at, uid))
+        # Every set() adds one; rebuild from the live entries once stale ones dominate
+        if len(self._deadlines) > 2 * len(self._entries) + 1024:
+            self._deadlines = [(e[2], u) for u, e in self._entries.items()]
+            heapq.heapify(self._deadlines)
+
+    def _sweep_locked(self):
+        now = time.time()
+        swept = 0
+        while swept < SWEEP_PER_SET and self._deadlines and self._deadlines[0][0] <= now:
+            expires_at, uid = heapq.heappop(self._deadlines)
+            entry = self._entries.get(uid)
+            if entry is None or entry[2] != expires_at:
+                continue    # stale: cleared, evicted or set again since
+            del self._entries[uid]
+            self._mark(uid, None)
+            self.counters["expired"] += 1
+            swept += 1
+        while len(self._entries) > self.max_entries:
+            uid, _ = self._entries.popitem(last=False)
+            # Shared: evicting only drops the cached copy, the DB row stays
+            if not self.shared:
+                self._mark(uid, None)
+            self.counters["evicted"] += 1
+
+    # ── Write-behind persistence ─────────────────────────
+
+    def _mark(self, uid: int, state, data=None, expires_at: float = 0.0):
+        if self._flusher is None:
+            return
+        if state is None or state in self.volatile:
+            self._dirty[uid] = None
+            return
+        try:
+            self._dirty[uid] = (uid, state, json.dumps(data), expires_at)
+        except (TypeError, ValueError):
+            # Not JSON-serialisable → keep it in memory only
+            self._dirty[uid] = None
+
+    def start_persistence(self, flush_interval: float = 1.0, shared: bool = False):
+        """Load saved states (unexpired) from the DB and start the flush thread.
+        shared=True writes through and reads on a miss instead of preloading."""
+        now    = time.time()
+        loaded = 0
+        self.shared = shared
+        with self._lock:
+            for uid, state, data, expires_at in ([] if shared else db.load_user_states(now)):
+                if uid not in self._entries:
+                    self._entries[uid] = [state, json.loads(data) if data else None, expires_at]
+                    heapq.heappush(self._deadlines, (expires_at, uid))
+                    loaded += 1
+        # Runs in the caller's context, so it flushes to the same shop's DB
+        ctx = contextvars.copy_context()
+        self._flusher = threading.Thread(target=ctx.run, args=(self._run_flusher, flush_interval),
+                                         name="state-flusher", daemon=True)
+        self._flusher.start()
+        logger.info(f"State store: restored {loaded} conversation(s)")
+        return self
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return
+            upserts = [row for row in dirty.values() if row is not None]
+            deletes = [uid for uid, row in dirty.items() if row is None]
+            db.save_user_states(upserts, deletes)
+            with self._lock:
+                self.counters["flushes"] += 1
+                self.counters["rows_written"] += len(dirty)
+
+    def drop_cache(self):
+        """Shared mode: forget cached states (volatile ones live only here and are kept)."""
+        self.flush()
+        with self._lock:
+            for uid in [u for u, e in self._entries.items() if e[0] not in self.volatile]:
+                del self._entries[uid]
+
+    def _run_flusher(self, interval: float):
+        while not self._stop.wait(interval):
+            self.flush()
+        self.flush()
+
+    def stop(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(10)
+
+    # ── Metrics ──────────────────────────────────────────
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes held: the dict and deadline heap plus each entry list and its (shallow) data."""
+        with self._lock:
+            entries = list(self._entries.values())
+            size = sys.getsizeof(self._entries) + sys.getsizeof(self._deadlines)
+            size += len(self._deadlines) * 88    # (float, int) tuple ≈ 64 + 24
+        for entry in entries:
+            size += sys.getsizeof(entry) + sys.getsizeof(entry[1]) + 28   # 28 ≈ int key
+        return size
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "pending_writes": len(self._dirty),
+            "memory_bytes": self.memory_bytes(),
+            **self.counters,
+        }
@@ -0,0 +1,28 @@
+"""
+Shared fixtures for the test suite.
+
+Puts the repo root on sys.path (like benchmarks/common.py), so tests can
+`import database`, `import router`, ... when pytest runs from the root.
+temp_db gives a test its own fresh database file.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import database as db  # noqa: E402
+import shops           # noqa: E402,F401 — routes database._db_path through the current shop, as in the bot
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """A fresh bot_data.db in tmp_path, used by database.py for the test."""
+    path = str(tmp_path / "bot_data.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.init_db()
+    return path
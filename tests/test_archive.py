@@ -0,0 +1,60 @@
+import sqlite3
+
+import archive
+import database as db
+
+
+def sell(n: int, sold_at: str, start: int = 0):
+    """n sold accounts with sold_at backdated, and one purchase transaction each."""
+    con = sqlite3.connect(db._db_path())
+    last_account, last_tx = con.execute(
+        "SELECT (SELECT COALESCE(MAX(id), 0) FROM accounts), (SELECT COALESCE(MAX(id), 0) FROM transactions)").fetchone()
+    for i in range(start, start + n):
+        db.save_account(f"+1415555{i:04d}", "", f"session-{i}" * 20)
+        db.add_user(i, f"u{i}")
+        db.add_balance(i, 1.0)
+        db.reserve_account(i)
+        db.finalize_purchase(i)
+    con.execute("UPDATE accounts SET sold_at = ? WHERE id > ?", (sold_at, last_account))
+    con.execute("UPDATE transactions SET created_at = ? WHERE id > ?", (sold_at.replace(" ", "T"), last_tx))
+    con.commit()
+    con.close()
+
+
+def backdate_transactions():
+    con = sqlite3.connect(db._db_path())
+    con.execute("UPDATE transactions SET created_at = '2020-01-01T00:00:00'")
+    con.commit()
+    con.close()
+
+
+def test_archive_round_trip(temp_db):
+    db.add_user(1, "u1")
+    db.record_transaction(1, 2.5, "deposit-1")
+    backdate_transactions()
+    sell(30, "2020-01-01 00:00")
+    sell(5, "2999-01-01 00:00", start=30)
+    sold    = db.get_sold_count()
+    revenue = db.get_total_revenue()
+    history = db.get_user_purchases(3)
+
+    result = archive.archive_once(days=30, batch=7)
+    assert (result["accounts"], result["transactions"]) == (30, 31)
+    assert db.count_archived() == {"accounts": 30, "transactions": 31}
+    # Reads that include history see the same totals
+    assert db.get_sold_count() == sold
+    assert db.get_total_revenue() == revenue == 2.5
+    assert db.get_user_purchases(3) == history
+    assert db.get_user_purchase_count(3) == 1
+    # Session strings come back intact from the compressed copy
+    archived = db.get_archived_account(4)
+    assert archived["session_string"] == "session-3" * 20
+    assert archive.archive_once(days=30)["accounts"] == 0
+
+
+def test_archived_deposit_is_not_credited_twice(temp_db):
+    db.add_user(1, "u")
+    assert db.record_transaction(1, 1.0, "tx-1")
+    backdate_transactions()
+    archive.archive_once(days=30)
+    assert not db.record_transaction(1, 1.0, "tx-1")
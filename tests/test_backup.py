@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+
+import backup
+import database as db
+
+
+def fill(n: int):
+    for i in range(n):
+        db.add_user(i, f"user{i}")
+
+
+def test_backup_verify_restore_round_trip(temp_db, tmp_path):
+    fill(500)
+    dest = str(tmp_path / "backups")
+    result = backup.backup_file(temp_db, dest, pages=4, pause=0)
+    assert os.path.basename(result["file"]).startswith("bot_data-")
+    assert not [f for f in os.listdir(dest) if f.endswith(".partial")]
+
+    check = backup.verify(result["file"])
+    assert check["ok"]
+    assert check["tables"]["users"] == 500
+
+    restored = str(tmp_path / "restored.db")
+    backup.restore(result["file"], restored)
+    con = sqlite3.connect(restored)
+    assert con.execute("SELECT COUNT(*), MAX(username) FROM users").fetchone() == (500, "user99")
+    con.close()
+
+
+def test_backup_is_one_snapshot_under_writes(temp_db, tmp_path):
+    fill(600)
+    stop = threading.Event()
+
+    def writer():
+        i = 10_000
+        while not stop.is_set():
+            db.add_user(i, "late")
+            i += 1
+
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        result = backup.backup_file(temp_db, str(tmp_path), pages=1, pause=0.001)
+    finally:
+        stop.set()
+        t.join()
+    assert backup.verify(result["file"])["ok"]
+
+
+def test_rotate_keeps_newest(temp_db, tmp_path):
+    for stamp in ("20240101-000000", "20240102-000000", "20240103-000000"):
+        (tmp_path / f"bot_data-{stamp}.db.gz").write_bytes(b"")
+    removed = backup.rotate(temp_db, str(tmp_path), keep=2)
+    assert [os.path.basename(p) for p in removed] == ["bot_data-20240101-000000.db.gz"]
+    assert len(backup.list_backups(temp_db, str(tmp_path))) == 2
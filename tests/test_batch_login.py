@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import database as db
+import session_manager
+from fake_telethon import FakeTelegram
+
+ADMIN = 1
+FAST, SLOW = "+14155550001", "+14155550002"
+
+
+@pytest.fixture
+def server(temp_db, monkeypatch):
+    """Fake Telegram where SLOW's code request hangs until server.gate is set."""
+    server = FakeTelegram(connect_latency=0, rpc_latency=0, otp_delay=None)
+    server.gate = None
+
+    def client_factory(session_string=""):
+        client = server.client_factory(session_string)
+        send_code_request = client.send_code_request
+
+        async def gated(phone):
+            if phone == SLOW:
+                await server.gate.wait()
+            return await send_code_request(phone)
+
+        client.send_code_request = gated
+        return client
+
+    monkeypatch.setattr(session_manager, "client_factory", client_factory)
+    yield server
+    session_manager.batch_logins.pop(ADMIN, None)
+    session_manager.batch_requesting.pop(ADMIN, None)
+
+
+async def until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition never became true")
+
+
+def run_batch(phones, results):
+    return asyncio.ensure_future(session_manager.send_otp_batch(
+        ADMIN, phones, lambda phone, ok, msg: results.append((phone, ok, msg))))
+
+
+def test_finished_batch_with_requests_in_flight(server):
+    async def scenario():
+        server.gate = asyncio.Event()
+        results = []
+        batch = run_batch([FAST, SLOW], results)
+        await until(lambda: session_manager.batch_stage(ADMIN, FAST) == "otp")
+
+        # FAST signs in while SLOW's code request is still out
+        _, ok, _ = await session_manager.verify_batch_otp(ADMIN, FAST, server.codes[FAST])
+        assert ok
+        assert session_manager.batch_remaining(ADMIN) == 1
+
+        server.gate.set()
+        assert await batch == (2, 0)
+        assert session_manager.batch_stage(ADMIN, SLOW) == "otp"
+        assert session_manager.batch_remaining(ADMIN) == 1
+        await session_manager.cancel_batch(ADMIN)
+
+    asyncio.run(scenario())
+    assert db.get_available_count() == 1    # FAST was saved, SLOW's login was dropped
+    assert not any(c.connected for c in session_manager.live_clients)
+
+
+def test_cancel_mid_batch(server):
+    async def scenario():
+        server.gate = asyncio.Event()
+        results = []
+        batch = run_batch([FAST, SLOW], results)
+        await until(lambda: session_manager.batch_stage(ADMIN, FAST) == "otp")
+
+        await session_manager.cancel_batch(ADMIN)
+        server.gate.set()
+        assert await batch == (1, 1)
+        return results
+
+    results = asyncio.run(scenario())
+    assert [(phone, ok, "batch cancelled" in msg) for phone, ok, msg in results if phone == SLOW] == [(SLOW, False, True)]
+    assert session_manager.batch_remaining(ADMIN) == 0
+    assert session_manager.batch_stage(ADMIN, SLOW) is None
+    assert not any(c.connected for c in session_manager.live_clients)
+
+
+@pytest.mark.parametrize("failure", ["error", "flood"])
+def test_failed_connect_leaves_no_client(server, monkeypatch, failure):
+    if failure == "flood":
+        server.flood_wait_rate, server.flood_wait_seconds = 1.0, 0
+    else:
+        async def refuse(self):
+            raise ConnectionError("network is unreachable")
+        monkeypatch.setattr(type(server.client_factory()), "connect", refuse)
+
+    results = []
+    assert asyncio.run(session_manager.send_otp_batch(
+        ADMIN, [FAST], lambda phone, ok, msg: results.append((phone, ok, msg)))) == (0, 1)
+    assert results[0][:2] == (FAST, False)
+    assert session_manager.batch_remaining(ADMIN) == 0
+    assert server.live_client_count() == 0
+    assert not any(c.connected for c in session_manager.live_clients)
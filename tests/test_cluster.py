@@ -0,0 +1,159 @@
+import time
+
+import pytest
+
+import broadcast
+import cluster
+import database as db
+from rate_limit import TokenBucket
+
+
+def test_lease_held_until_expiry(temp_db):
+    assert db.acquire_lease("ingest", "a", 10, now=100)
+    assert not db.acquire_lease("ingest", "b", 10, now=105)
+    assert db.acquire_lease("ingest", "a", 10, now=105)     # renewal
+    assert db.acquire_lease("ingest", "b", 10, now=116)     # a's lease ran out
+    assert db.get_leases(116) == {"ingest": "b"}
+    db.release_lease("ingest", "a")                          # not a's any more
+    assert db.get_leases(116) == {"ingest": "b"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(cluster.time, "time", lambda: now[0])
+    return now
+
+
+def node(worker_id, log):
+    n = cluster.Cluster(worker_id, ttl=15)
+    n.singleton("sweeper", lambda: log.append((worker_id, "start")), lambda: log.append((worker_id, "stop")))
+    return n
+
+
+def test_singleton_handover_on_stop(temp_db, clock):
+    log = []
+    a, b = node("a", log), node("b", log)
+    a._beat()
+    b._beat()
+    a._beat()                            # a sees b join
+    assert log == [("a", "start")]
+    assert (a.partition(), b.partition()) == ((0, 2), (1, 2))
+    a.stop()
+    b._beat()
+    assert log == [("a", "start"), ("a", "stop"), ("b", "start")]
+    assert b.partition() == (0, 1)
+
+
+def test_singleton_moves_when_holder_dies(temp_db, clock):
+    log = []
+    a, b = node("a", log), node("b", log)
+    a._beat()
+    b._beat()
+    clock[0] += 16                      # a stops renewing
+    b._beat()
+    assert log == [("a", "start"), ("b", "start")]
+    a._beat()                            # a wakes up late: its lease lapsed
+    assert log[-1] == ("a", "stop")
+
+
+def test_claim_updates_partitions_negative_ids(temp_db):
+    rows = [(i, uid, "{}", 0.0) for i, uid in enumerate((-1001234567890, -7, 3, 4), 1)]
+    db.enqueue_updates(rows)
+    claimed = {p: [r[0] for r in db.claim_updates(f"w{p}", p, 2, 10)] for p in (0, 1)}
+    assert sorted(claimed[0] + claimed[1]) == [1, 2, 3, 4]
+    assert claimed[0] == [i for i, uid, *_ in rows if uid % 2 == 0]
+
+
+def test_broadcast_claim_is_exclusive(temp_db):
+    job = db.create_broadcast(1, "hi", "", 0)
+    assert db.claim_broadcast(job, "a", lease_until=160, now=100)
+    assert not db.claim_broadcast(job, "b", lease_until=170, now=110)
+    assert db.save_broadcast(job, "a", 200, sent=5)
+    assert db.claim_broadcast(job, "b", lease_until=300, now=201)
+    # a lost the claim: its saves no longer write
+    assert not db.save_broadcast(job, "a", 400, sent=6)
+    assert db.get_broadcast(job)["sent"] == 5
+
+
+def test_broadcast_handover_releases_claim(temp_db, monkeypatch):
+    monkeypatch.setattr(broadcast, "holder", "a")
+    monkeypatch.setattr(broadcast, "bucket", TokenBucket(10000))
+    for uid in range(1, 51):
+        db.add_user(uid, f"u{uid}")
+    sent = []
+
+    class Bot:
+        def send_message(self, chat_id, text, **kwargs):
+            time.sleep(0.002)
+            sent.append(chat_id)
+
+    job = db.create_broadcast(1, "hi", "", 50)
+    b = broadcast._launch(Bot(), job)
+    broadcast.handover()
+    deadline = time.time() + 10
+    while job in broadcast.running and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    row = db.get_broadcast(job)
+    assert b.handover and row["status"] == "running" and row["holder"] is None
+    # Everything up to the saved cursor was sent exactly once; nothing past it
+    assert sorted(sent) == list(range(1, row["cursor"] + 1))
+    assert row["sent"] == len(sent)
+
+
+class Killed(BaseException):
+    """Stands in for the process dying: nothing in broadcast catches it."""
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_broadcast_resumes_after_a_crash(temp_db, monkeypatch):
+    monkeypatch.setattr(broadcast, "bucket", TokenBucket(10000))
+    monkeypatch.setattr(broadcast, "LEASE_TTL", 0.5)
+    for uid in range(1, 51):
+        db.add_user(uid, f"u{uid}")
+    first, second = [], []
+
+    class Bot:
+        def __init__(self, sent, kill_at=None):
+            self.sent, self.kill_at = sent, kill_at
+
+        def send_message(self, chat_id, text, **kwargs):
+            if chat_id == 999:
+                return              # the admin's summary
+            if self.kill_at and chat_id >= self.kill_at:
+                raise Killed()
+            time.sleep(0.002)
+            self.sent.append(chat_id)
+
+        def edit_message_text(self, *args, **kwargs):
+            pass
+
+    def wait_for(condition):
+        deadline = time.time() + 10
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        assert condition()
+
+    job = db.create_broadcast(999, "hi", "", 50)
+    monkeypatch.setattr(broadcast, "holder", "a")
+    broadcast._launch(Bot(first, kill_at=30), job)
+    wait_for(lambda: job not in broadcast.running)
+    row = db.get_broadcast(job)
+    # Died without releasing: still 'running' and claimed by a until the lease runs out
+    assert (row["status"], row["holder"]) == ("running", "a")
+    cursor = row["cursor"]
+    assert cursor < 30 and set(range(1, cursor + 1)) <= set(first)
+
+    monkeypatch.setattr(broadcast, "holder", "b")
+    broadcast.resume_pending(Bot(second))
+    assert job not in broadcast.running            # a's claim still holds
+    time.sleep(0.6)
+    resumer = broadcast.Resumer(Bot(second)).start()
+    try:
+        wait_for(lambda: db.get_broadcast(job)["status"] == "done")
+    finally:
+        resumer.stop()
+    # b went on from the saved cursor: nothing up to it was sent twice
+    assert sorted(second) == list(range(cursor + 1, 51))
+    assert db.get_broadcast(job)["sent"] == 50
@@ -0,0 +1,39 @@
+import pytest
+
+import database as db
+import db_profiler
+
+
+@pytest.fixture
+def profiled(temp_db):
+    db_profiler.reset()
+    db_profiler.enable(slow_ms=10_000)
+    yield
+    db_profiler.disable()
+    db_profiler.reset()
+
+
+def stats(name: str) -> dict:
+    return dict(db_profiler._functions.get(name, {"calls": 0}))
+
+
+def test_nested_calls_are_timed_once(profiled):
+    db.save_account("+14155550001", "", "s")
+    db.add_user(10, "buyer")
+    db.add_balance(10, 100.0)
+    db.reserve_account(10)
+    db.finalize_purchase(10)                 # calls get_price_ton inside
+    assert stats("finalize_purchase")["calls"] == 1
+    assert stats("get_price_ton")["calls"] == 0
+    db.get_price_ton()
+    assert stats("get_price_ton")["calls"] == 1
+
+
+def test_generator_rows_are_not_counted(profiled):
+    db.add_user(10, "a")
+    db.add_user(11, "b")
+    rows = list(db.export_rows("users"))
+    assert len(rows) == 3
+    s = stats("export_rows")
+    assert (s["calls"], s["rows"], s["counted"]) == (1, 0, 0)
+    assert "export_rows: 1× " in db_profiler.report() and "rows/call -" in db_profiler.report()
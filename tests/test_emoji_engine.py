@@ -0,0 +1,22 @@
+import emoji_engine
+from emoji_engine import EMOJI_IDS, build, render
+
+
+def test_offsets_count_utf16_units():
+    # 🪙 and 👋 are outside the BMP (two UTF-16 units each), and so is the 😀 in the field
+    plain, entities = render("[E:👋] **Hi {name}!** [E:🪙] {amount} TON", name="😀bob", amount=5)
+    assert plain == "👋 Hi 😀bob! 🪙 5 TON"
+    assert entities == [
+        {"type": "custom_emoji", "offset": 0, "length": 2, "custom_emoji_id": EMOJI_IDS["👋"]},
+        {"type": "bold", "offset": 3, "length": 9},
+        {"type": "custom_emoji", "offset": 13, "length": 2, "custom_emoji_id": EMOJI_IDS["🪙"]},
+    ]
+    assert build("[E:👋] **Hi 😀bob!** [E:🪙] 5 TON") == (plain, entities)
+
+
+def test_build_does_not_fill_the_template_cache():
+    emoji_engine.compile_template.cache_clear()
+    render("[E:🪙] Price: **{price} TON**", price=1)
+    for i in range(50):
+        build(f"[E:👤] user {i}")
+    assert emoji_engine.compile_template.cache_info().currsize == 1
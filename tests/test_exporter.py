@@ -0,0 +1,63 @@
+import csv
+import gzip
+import io
+import json
+import sqlite3
+
+import pytest
+
+import database as db
+import exporter
+import shops
+
+
+def seed():
+    con = sqlite3.connect(db._db_path())
+    con.executemany("INSERT INTO users (telegram_id, username) VALUES (?, ?)",
+                    [(i, f"user{i}") for i in range(1, 1201)])    # more than one EXPORT_BATCH
+    con.commit()
+    con.close()
+    db.record_transaction(1, 2.5, "tx-a")
+    db.record_transaction(2, 1.0, "tx-b")
+
+
+def read(file) -> str:
+    return gzip.decompress(file.read()).decode("utf-8")
+
+
+def test_csv_round_trip(temp_db):
+    seed()
+    with exporter.export("users", "csv") as (file, count):
+        rows = list(csv.reader(io.StringIO(read(file))))
+    assert count == 1200
+    assert rows[0] == ["telegram_id", "username", "balance_ton", "joined_at", "blocked"]
+    assert len(rows) == 1201
+    assert {r[1] for r in rows[1:]} == {f"user{i}" for i in range(1, 1201)}
+
+
+def test_jsonl_round_trip(temp_db):
+    seed()
+    with exporter.export("deposits", "jsonl", spool_size=16) as (file, count):
+        rows = [json.loads(line) for line in read(file).splitlines()]
+    assert count == 2
+    assert [(r["user_id"], r["amount_ton"], r["tx_hash"]) for r in rows] == [(1, 2.5, "tx-a"), (2, 1.0, "tx-b")]
+
+
+def test_unknown_export(temp_db):
+    with pytest.raises(ValueError):
+        with exporter.export("passwords"):
+            pass
+
+
+def test_send(temp_db):
+    seed()
+    sent = {}
+
+    class Bot:
+        def send_document(self, chat_id, file, visible_file_name=None, caption=None):
+            sent.update(chat_id=chat_id, name=visible_file_name, body=read(file), caption=caption)
+
+    assert exporter.send(Bot(), 42, "users", "csv") == 1200
+    assert sent["chat_id"] == 42
+    assert sent["name"].startswith(f"{shops.get().name}-users-") and sent["name"].endswith(".csv.gz")
+    assert sent["body"].count("\n") == 1201
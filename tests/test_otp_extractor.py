@@ -0,0 +1,26 @@
+import json
+import os
+
+import pytest
+
+from conftest import ROOT
+from otp_extractor import extract_otp
+
+with open(os.path.join(ROOT, "benchmarks", "data", "otp_corpus.json"), encoding="utf-8") as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=lambda c: c["text"][:40])
+def test_corpus(case):
+    match = extract_otp(case["text"])
+    assert (match.code if match else None) == case["code"]
+
+
+def test_labelled_code_is_confident():
+    match = extract_otp("Login code: 48213. Do not give this code to anyone!")
+    assert match.code == "48213" and match.confidence == 1.0
+
+
+def test_ambiguous_bare_digits_rejected():
+    assert extract_otp("Order 12345 shipped, tracking 67890") is None
+    assert extract_otp("") is None
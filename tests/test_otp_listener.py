@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+import pytest
+
+import database as db
+import session_manager
+from fake_telethon import FakeTelegram, SERVICE_USER_ID, fake_session_string
+
+BUYER = 10
+PHONE = "+14155550000"
+SESSION = fake_session_string(PHONE)
+
+
+class FakeBot:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.otps = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self.lock:
+            if "OTP Code" in text:
+                self.otps.append(text)
+
+
+@pytest.fixture
+def server(temp_db, monkeypatch):
+    server = FakeTelegram(connect_latency=0, rpc_latency=0, otp_delay=None)
+    monkeypatch.setattr(session_manager, "client_factory", server.client_factory)
+    monkeypatch.setattr(session_manager, "UNSURE_OTP_GRACE", 0.3)
+    db.save_account(PHONE, "", SESSION)
+    db.add_user(BUYER, "buyer")
+    db.add_balance(BUYER, 10.0)
+    assert db.reserve_account(BUYER)
+    return server
+
+
+def push(server, text):
+    for client in list(server.clients.get(SESSION, ())):
+        client._dispatch(SERVICE_USER_ID, text)
+
+
+async def listen(bot, events):
+    """Run the listener while `events(step)` pushes messages / cancels at each tick."""
+    task = asyncio.ensure_future(session_manager.start_otp_listener(bot, BUYER, PHONE, SESSION, ""))
+    for step in range(40):
+        await asyncio.sleep(0.05)
+        if task.done():
+            break
+        events(step)
+    await asyncio.wait_for(task, 5)
+
+
+def wait_followups():
+    session_manager._followup_executor.submit(lambda: None).result(5)
+
+
+def test_labelled_code_is_delivered_at_once(server):
+    bot = FakeBot()
+    asyncio.run(listen(bot, lambda step: step == 0 and push(server, "Login code: 48213. Don't share it.")))
+    wait_followups()
+    assert len(bot.otps) == 1 and "48213" in bot.otps[0]
+
+
+def test_bare_code_waits_for_a_labelled_one(server):
+    bot = FakeBot()
+
+    def events(step):
+        if step == 0:
+            push(server, "Ticket 55120 was closed.")
+        elif step == 2:
+            push(server, "Login code: 48213")
+
+    asyncio.run(listen(bot, events))
+    wait_followups()
+    assert len(bot.otps) == 1 and "48213" in bot.otps[0]
+
+
+def test_bare_code_goes_out_after_the_grace_period(server):
+    bot = FakeBot()
+    asyncio.run(listen(bot, lambda step: step == 0 and push(server, "Use 82736 to sign in.")))
+    wait_followups()
+    assert len(bot.otps) == 1 and "82736" in bot.otps[0]
+
+
+def test_buyer_can_cancel_while_a_bare_code_is_held(server):
+    bot = FakeBot()
+
+    def events(step):
+        if step == 0:
+            push(server, "Use 82736 to sign in.")
+        elif step == 2:
+            assert session_manager.cancel_buyer_listener(BUYER)
+
+    asyncio.run(listen(bot, events))
+    wait_followups()
+    assert bot.otps == []
+    assert db.get_available_count() == 1
+    assert db.get_balance(BUYER) == 10.0
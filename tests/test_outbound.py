@@ -0,0 +1,68 @@
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+import outbound
+
+
+class Response:
+    status_code = 429
+    text = reason = ""
+
+    def json(self):
+        return {}
+
+
+class Bot:
+    def __init__(self):
+        self.throttled = False
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        if chat_id == 7 and not self.throttled:
+            self.throttled = True
+            raise ApiTelegramException("send_message", Response(), {
+                "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 0.5}})
+        self.sent.append((chat_id, text))
+        return text
+
+    def edit_message_text(self, *args, **kwargs):
+        pass
+
+    def send_document(self, *args, **kwargs):
+        pass
+
+
+def test_throttled_chat_does_not_hold_up_its_lane():
+    d = outbound.Dispatcher(lanes=1)
+    bot = Bot()
+    d.install(bot)
+    started = time.monotonic()
+    throttled = [d.submit(id(bot), "send_message", 7, f"m{i}") for i in range(2)]
+    others = [d.submit(id(bot), "send_message", 100 + i, "hi") for i in range(10)]
+    for f in others:
+        f.result(5)
+    assert time.monotonic() - started < 0.4
+    assert [f.result(5) for f in throttled] == ["m0", "m1"]
+    # The parked chat's calls still went out in order
+    assert [t for c, t in bot.sent if c == 7] == ["m0", "m1"]
+    stats = d.stats()
+    assert (stats["throttled"], stats["retried"], stats["sent"]) == (1, 1, 12)
+    assert stats["queued"] == [0]
+
+
+def test_broadcast_waiting_for_the_global_bucket_lets_otp_overtake():
+    d = outbound.Dispatcher(lanes=1, global_rate=10)
+    bot = Bot()
+    d.install(bot)
+    d.global_bucket.try_acquire(10)
+    # Broadcast needs 1 + BROADCAST_RESERVE tokens back (0.6s), OTP only one (0.1s)
+    with outbound.priority(outbound.BROADCAST):
+        broadcast = d.submit(id(bot), "send_message", 200, "news")
+    time.sleep(0.05)
+    with outbound.priority(outbound.OTP):
+        otp = d.submit(id(bot), "send_message", 300, "code")
+    assert otp.result(0.4) == "code"
+    assert not broadcast.done()
+    assert broadcast.result(5) == "news"
+    assert [c for c, t in bot.sent] == [300, 200]
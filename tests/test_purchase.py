@@ -0,0 +1,60 @@
+import threading
+
+import database as db
+
+
+def stock(n: int):
+    for i in range(n):
+        db.save_account(f"+1415555{i:04d}", "", f"session-{i}")
+
+
+def test_reserve_finalize(temp_db):
+    stock(1)
+    db.add_user(10, "buyer")
+    db.add_balance(10, 1.0)
+    account = db.reserve_account(10)
+    assert account["status"] == "reserved"
+    assert db.reserve_account(11) is None          # the only account is taken
+    assert db.finalize_purchase(10)
+    assert not db.finalize_purchase(10)            # a second finalize is a no-op
+    assert db.get_balance(10) == 1.0 - db.get_price_ton()
+    assert db.get_sold_count() == 1
+    assert db.get_available_count() == 0
+
+
+def test_cancel_releases_account(temp_db):
+    stock(1)
+    db.add_user(10, "buyer")
+    assert db.reserve_account(10)
+    db.cancel_purchase(10)
+    assert db.get_available_count() == 1
+    assert not db.finalize_purchase(10)
+
+
+def test_one_purchase_per_buyer(temp_db):
+    stock(2)
+    assert db.reserve_account(10)
+    assert db.reserve_account(10) is None
+    assert db.get_available_count() == 1
+
+
+def test_concurrent_reserves_never_share_an_account(temp_db):
+    stock(20)
+    got   = []
+    start = threading.Barrier(8)
+
+    def buyer(base):
+        start.wait()
+        for uid in range(base, base + 5):
+            account = db.reserve_account(uid)
+            if account:
+                got.append(account["id"])
+
+    threads = [threading.Thread(target=buyer, args=(100 + 10 * t,)) for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(got) == 20
+    assert len(set(got)) == 20
+    assert db.get_available_count() == 0
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from router import PrefixTrie, Router, normalize_label
+
+
+def message(text, uid=1):
+    return SimpleNamespace(text=text, from_user=SimpleNamespace(id=uid))
+
+
+def test_trie_longest_prefix_wins():
+    trie = PrefixTrie()
+    trie.insert("buy_", "buy")
+    trie.insert("buy_confirm_", "confirm")
+    assert trie.match("buy_confirm_42") == "confirm"
+    assert trie.match("buy_7") == "buy"
+    assert trie.match("sell_7") is None
+
+
+def test_trie_exact_beats_prefix():
+    trie = PrefixTrie()
+    trie.insert("menu", "prefix")
+    trie.insert("menu", "exact", exact=True)
+    assert trie.match("menu") == "exact"
+    assert trie.match("menu_more") == "prefix"
+    assert trie.match("men") is None
+
+
+def test_trie_empty_prefix_catches_all():
+    trie = PrefixTrie()
+    trie.insert("", "any")
+    trie.insert("a", "a")
+    assert trie.match("") == "any"
+    assert trie.match("xyz") == "any"
+    assert trie.match("ab") == "a"
+
+
+def test_normalize_label():
+    assert normalize_label("💰 Add Balance") == "Add Balance"
+    assert normalize_label("/start") == "/start"
+
+
+def test_resolve_commands_texts_and_states():
+    states = {5: "set_price", 6: "set_price"}
+    r = Router(states.get, is_admin=lambda uid: uid == 5)
+    start, add, price = object(), object(), object()
+    r.command("start")(start)
+    r.text("💰 Add Balance")(add)
+    r.state("set_price", admin=True)(price)
+
+    assert r.resolve_message(message("/start@shop_bot payload"))[0] is start
+    assert r.resolve_message(message("💰 Add Balance"))[0] is add
+    assert r.resolve_message(message("Add Balance"))[0] is add
+    fn, args = r.resolve_message(message(" 0.5 ", uid=5))
+    assert fn is price and args[1:] == (5, "0.5")
+    # Admin-only state: a non-admin in it gets nothing
+    assert r.resolve_message(message("0.5", uid=6)) == (None, None)
+    assert r.resolve_message(message("hello", uid=7)) == (None, None)
+
+
+def test_dispatch_callback():
+    r = Router(lambda uid: None, lambda uid: False)
+    seen = []
+    r.callback(prefix="topup_")(lambda call: seen.append(("topup", call.data)))
+    r.callback(data="topup_custom")(lambda call: seen.append(("custom", call.data)))
+    assert r.dispatch_callback(SimpleNamespace(data="topup_5"))
+    assert r.dispatch_callback(SimpleNamespace(data="topup_custom"))
+    assert not r.dispatch_callback(SimpleNamespace(data="other"))
+    assert seen == [("topup", "topup_5"), ("custom", "topup_custom")]
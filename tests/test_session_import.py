@@ -0,0 +1,73 @@
+import asyncio
+import os
+
+import pytest
+from telethon.crypto import AuthKey
+from telethon.sessions import SQLiteSession, StringSession
+
+import database as db
+from session_import import Candidate, import_files, iter_candidates, parse_line, session_file_to_string
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("1AbCdEf==\n", Candidate("", "1AbCdEf==", "", "src")),
+    ("+14155550001:1AbC:hunter2", Candidate("+14155550001", "1AbC", "hunter2", "src")),
+    ("14155550001|1AbC", Candidate("+14155550001", "1AbC", "", "src")),
+    ("14155550001\t1AbC,pw", Candidate("+14155550001", "1AbC", "pw", "src")),
+    ("call-me:1AbC", Candidate("", "", "", "src")),        # bad phone → invalid, not dropped
+    ("# exported 2025-01-01", None),
+    ("   ", None),
+])
+def test_parse_line(line, expected):
+    assert parse_line(line, "src") == expected
+
+
+def make_session_file(path: str) -> StringSession:
+    session = SQLiteSession(path[:-len(".session")])
+    session.set_dc(2, "149.154.167.51", 443)
+    session.auth_key = AuthKey(os.urandom(256))
+    session.save()
+    session.close()
+    expected = StringSession()
+    expected.set_dc(2, "149.154.167.51", 443)
+    expected.auth_key = session.auth_key
+    return expected
+
+
+def test_session_file_round_trip(tmp_path):
+    path = str(tmp_path / "14155550001.session")
+    expected = make_session_file(path)
+    string = session_file_to_string(path)
+    assert string == expected.save()
+    restored = StringSession(string)
+    assert (restored.dc_id, restored.port, restored.auth_key.key) == (2, 443, expected.auth_key.key)
+    # The file name gives the phone
+    assert list(iter_candidates(path)) == [Candidate("+14155550001", string, "", "14155550001.session")]
+
+
+def test_unreadable_session_file(tmp_path):
+    path = tmp_path / "empty.session"
+    path.write_bytes(b"not sqlite at all")
+    assert session_file_to_string(str(path)) is None
+
+
+def test_import_without_validation_counts(temp_db, tmp_path):
+    db.save_account("+14155550004", "", "old")
+    db.save_account("+14155550005", "", "old")
+    reserved = db.reserve_account(10)["phone"]          # in a purchase → skipped
+    listing = tmp_path / "accounts.txt"
+    listing.write_text("\n".join([
+        "# phone:session:2fa",
+        "+14155550001:sessA:pw",
+        "14155550002|sessB",
+        "+14155550001:sessA-again",     # duplicate of the first line
+        "bare-session",                 # no phone and not validated → invalid
+        "call-me:sessC",                # bad phone → invalid
+        "+14155550004:sessD",
+        "+14155550005:sessE",
+    ]) + "\n")
+
+    report = asyncio.run(import_files([(str(listing), "accounts.txt")], check=False))
+    assert (report["imported"], report["updated"], report["duplicate"], report["invalid"]) == (2, 1, 1, 2)
+    assert report["skipped"] == [(reserved, "reserved")]
+    assert db.get_available_count() == 3
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+import state_store
+from state_store import StateStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(state_store.time, "time", lambda: now[0])
+    return now
+
+
+def test_set_get_keeps_data(clock):
+    s = StateStore()
+    s.set(1, "topup_custom", {"amount": 5})
+    s.set(1, "topup_confirm")          # data=None keeps the current data
+    assert s.get(1) == "topup_confirm"
+    assert s.get_data(1) == {"amount": 5}
+    s.clear(1)
+    assert s.get(1) is None and len(s) == 0
+
+
+def test_expires_on_read(clock):
+    s = StateStore(default_ttl=60)
+    s.set(1, "a")
+    clock[0] += 59
+    assert s.get(1) == "a"
+    clock[0] += 2
+    assert s.get(1) is None
+    assert s.counters["expired"] == 1
+
+
+def test_sweep_reaches_expired_entry_behind_long_ttl_head(clock):
+    s = StateStore(ttls={"short": 30, "long": 3600})
+    s.set(1, "long")                   # LRU head, far from expiry
+    s.set(2, "short")
+    clock[0] += 31
+    s.set(3, "long")                   # the sweep runs on set()
+    assert 2 not in s._entries
+    assert s.counters["expired"] == 1
+    assert s.get(1) == "long"
+
+
+def test_sweep_skips_entries_set_again(clock):
+    s = StateStore(ttls={"short": 30})
+    s.set(1, "short")
+    clock[0] += 20
+    s.set(1, "short")                  # new deadline; the old heap item is stale
+    clock[0] += 20
+    s.set(2, "short")
+    assert s.get(1) == "short"
+
+
+def test_lru_eviction(clock):
+    s = StateStore(max_entries=3)
+    for uid in (1, 2, 3):
+        s.set(uid, "a")
+    s.get(1)                           # 2 is now least recently used
+    s.set(4, "a")
+    assert len(s) == 3
+    assert s.get(2) is None and s.get(1) == "a"
+    assert s.counters["evicted"] == 1
+
+
+def test_deadline_heap_stays_bounded(clock):
+    s = StateStore()
+    for _ in range(10000):
+        s.set(1, "a")
+    assert len(s._deadlines) <= 2 * len(s) + 1024
+
+
+def test_concurrent_flushes_write_in_order(monkeypatch):
+    saved   = {}
+    started = threading.Event()
+
+    def save_user_states(upserts, deletes):
+        if any(row[1] == "x" for row in upserts):
+            started.set()
+            time.sleep(0.2)             # the older flush is slow to write
+        for row in upserts:
+            saved[row[0]] = row[1]
+
+    monkeypatch.setattr(state_store.db, "save_user_states", save_user_states)
+    s = StateStore()
+    s._flusher = object()               # mark changes dirty without starting the thread
+    s.set(1, "x")
+    older = threading.Thread(target=s.flush)
+    older.start()
+    started.wait(1)
+    s.set(1, "y")
+    s.flush()
+    older.join()
+    assert saved[1] == "y"
@@ -0,0 +1,64 @@
+import random
+import threading
+from types import SimpleNamespace
+
+from telebot import types
+
+from update_workers import UpdateWorkers, update_user_id
+
+
+def update(update_id: int, uid: int) -> types.Update:
+    return types.Update.de_json({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "hi",
+        "chat": {"id": uid, "type": "private"},
+        "from": {"id": uid, "is_bot": False, "first_name": "u"},
+    }})
+
+
+def workers(process, n: int) -> UpdateWorkers:
+    bot = SimpleNamespace(threaded=False, last_update_id=0, process_new_updates=process)
+    return UpdateWorkers(bot, workers=n).start()
+
+
+def test_same_user_runs_in_order_on_one_worker():
+    seen = []
+    lock = threading.Lock()
+
+    def process(updates):
+        threading.Event().wait(random.random() / 1000)
+        with lock:
+            seen.extend((threading.current_thread().name, update_user_id(u), u.update_id) for u in updates)
+
+    w = workers(process, 4)
+    batch = [update(i, uid) for i, uid in enumerate([1, 2, 3, 5, 6] * 20, start=1)]
+    w.submit(batch)
+    w.stop(5)
+
+    assert len(seen) == len(batch)
+    assert w.bot.last_update_id == len(batch)
+    for uid in (1, 2, 3, 5, 6):
+        mine = [(thread, update_id) for thread, u, update_id in seen if u == uid]
+        assert len({thread for thread, _ in mine}) == 1
+        assert [update_id for _, update_id in mine] == sorted(update_id for _, update_id in mine)
+    # 1 and 5 share a queue with 4 workers, so they share a thread too
+    assert {t for t, u, _ in seen if u == 1} == {t for t, u, _ in seen if u == 5}
+
+
+def test_a_blocked_user_does_not_stall_others():
+    release = threading.Event()
+    done = threading.Event()
+
+    def process(updates):
+        uid = update_user_id(updates[0])
+        if uid == 1:
+            release.wait(5)
+        else:
+            done.set()
+
+    w = workers(process, 2)
+    w.submit([update(1, 1), update(2, 2)])
+    assert done.wait(2)
+    assert not release.is_set()
+    release.set()
+    w.stop(5)
+    assert w.stats()["handled"] == 2
@@ -0,0 +1,86 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import webhook_server
+from webhook_server import SECRET_HEADER, WebhookServer
+
+PATH   = "/telegram/webhook"
+SECRET = "s3cret"
+
+
+class Bot:
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.got     = threading.Event()
+
+    def process_new_updates(self, updates):
+        self.batches.append([u.update_id for u in updates])
+        self.got.set()
+        self.release.wait(5)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(bot, **kwargs):
+        server = WebhookServer(bot, "127.0.0.1", 0, PATH, SECRET, **kwargs).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def post(server, update_id=1, secret=SECRET, body=None) -> int:
+    con = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    headers = {SECRET_HEADER: secret} if secret else {}
+    con.request("POST", PATH, body if body is not None else json.dumps({"update_id": update_id}), headers)
+    status = con.getresponse().status
+    con.close()
+    return status
+
+
+def test_wrong_secret_is_forbidden(serve):
+    bot = Bot()
+    server = serve(bot)
+    assert post(server, secret="nope") == 403
+    assert post(server, secret=None) == 403
+    assert server.stats()["rejected"] == 2
+    assert bot.batches == []
+
+
+def test_oversized_body_is_refused(serve, monkeypatch):
+    monkeypatch.setattr(webhook_server, "MAX_BODY", 64)
+    server = serve(Bot())
+    assert post(server, body=json.dumps({"update_id": 1, "pad": "x" * 100})) == 413
+    assert server.stats()["received"] == 0
+
+
+def test_full_queue_answers_503(serve):
+    bot = Bot()
+    bot.release.clear()
+    server = serve(bot, queue_size=1, batch_wait=0)
+    assert post(server, 1) == 200
+    assert bot.got.wait(5)          # the batcher holds update 1, the queue is empty again
+    assert post(server, 2) == 200   # fills the queue
+    assert post(server, 3) == 503
+    bot.release.set()
+    assert server.stats()["dropped"] == 1
+
+
+def test_updates_are_batched(serve):
+    bot = Bot()
+    server = serve(bot, batch_wait=0.3)
+    for i in range(1, 4):
+        assert post(server, i) == 200
+    server.stop()
+    assert bot.batches == [[1, 2, 3]]
+    stats = server.stats()
+    assert (stats["received"], stats["batches"], stats["queued"]) == (3, 1, 0)
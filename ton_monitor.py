@@ -4,26 +4,42 @@ TON Payment Monitor
 Polls TonCenter API every 30 seconds.
 Runs in async loop inside a background thread (no aiohttp/aiogram needed).
 Uses httpx for HTTP requests.
+
+With several shops (shops.py) each runs its own monitor task for its own
+wallet and DB; they share one httpx connection pool.
 """
 
 import asyncio
 import logging
+import time
 import httpx
-import database as db
-from config import BOT_WALLET, TON_API_KEY
+import async_db as adb
+import metrics
+import outbound
+import shops
 
 logger = logging.getLogger(__name__)
 
 TONCENTER_API = "https://toncenter.com/api/v2"
 POLL_INTERVAL = 30
 
+_client = None   # shared by every shop's monitor; created on the loop that uses it
+
+
+def http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient()
+    return _client
+
 
 async def get_transactions(client: httpx.AsyncClient) -> list:
     url = f"{TONCENTER_API}/getTransactions"
+    shop = shops.get()
     params = {
-        "address": BOT_WALLET,
+        "address": shop.wallet,
         "limit": 50,
-        "api_key": TON_API_KEY,
+        "api_key": shop.ton_api_key,
     }
     try:
         resp = await client.get(url, params=params, timeout=15)
@@ -55,7 +71,26 @@ def get_amount_ton(tx: dict) -> float:
         return 0.0
 
 
-async def process_transaction(bot, tx: dict):
+# Deposit pipeline: tx on chain → seen by the poller → balance credited → buyer notified
+DETECT_LAG = metrics.histogram(
+    "ton_deposit_detect_lag_seconds", "Blockchain time of a deposit to the monitor seeing it",
+    (5, 10, 20, 30, 45, 60, 90, 120, 300, 600),
+)
+DEPOSIT_STAGE = {
+    stage: metrics.histogram(
+        "ton_deposit_seconds", "Seconds from detecting a deposit to each processing stage",
+        (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), stage=stage,
+    )
+    for stage in ("credited", "notified")
+}
+DEPOSITS    = metrics.counter("ton_deposits_total", "Deposits credited")
+DEPOSITED   = metrics.counter("ton_deposited_ton_total", "TON credited to user balances")
+POLL_ERRORS = metrics.counter("ton_monitor_errors_total", "TonCenter polling loop errors")
+
+
+async def process_transaction(bot, tx: dict, detected_at: float = None):
+    """detected_at: perf_counter() when the poller first saw tx (for DEPOSIT_STAGE)."""
+    detected_at = time.perf_counter() if detected_at is None else detected_at
     tx_hash = tx.get("transaction_id", {}).get("hash", "")
     if not tx_hash:
         return
@@ -71,37 +106,49 @@ async def process_transaction(bot, tx: dict):
         return
 
     # Returns False if already processed (duplicate tx_hash)
-    is_new = db.record_transaction(telegram_id, amount_ton, tx_hash)
+    is_new = await adb.record_transaction(telegram_id, amount_ton, tx_hash)
     if not is_new:
         return
 
-    db.add_balance(telegram_id, amount_ton)
-    new_balance = db.get_balance(telegram_id)
-    price = db.get_price_ton()
+    await adb.add_balance(telegram_id, amount_ton)
+    DEPOSIT_STAGE["credited"].observe(time.perf_counter() - detected_at)
+    DEPOSITS.inc()
+    DEPOSITED.inc(amount_ton)
+    new_balance = await adb.get_balance(telegram_id)
+    price = await adb.get_price_ton()
     accounts_can_buy = int(new_balance // price)
 
     logger.info(f"Credited {amount_ton:.3f} TON to {telegram_id}. Balance: {new_balance:.3f}")
 
+    text = (
+        f"✅ <b>Balance Added!</b>\n\n"
+        f"💰 Received: <b>{amount_ton:.3f} TON</b>\n"
+        f"💳 New Balance: <b>{new_balance:.3f} TON</b>\n"
+        f"🛒 You can buy: <b>{accounts_can_buy} account(s)</b>\n\n"
+        f"Use 🛒 <b>Buy Account</b> to purchase!"
+    )
+    # The send blocks until the outbound dispatcher has delivered it — keep it off the loop
+    await asyncio.get_running_loop().run_in_executor(None, shops.bind(_notify_credit), bot, telegram_id, text)
+    DEPOSIT_STAGE["notified"].observe(time.perf_counter() - detected_at)
+
+
+def _notify_credit(bot, telegram_id: int, text: str):
     try:
-        bot.send_message(
-            telegram_id,
-            f"✅ <b>Balance Added!</b>\n\n"
-            f"💰 Received: <b>{amount_ton:.3f} TON</b>\n"
-            f"💳 New Balance: <b>{new_balance:.3f} TON</b>\n"
-            f"🛒 You can buy: <b>{accounts_can_buy} account(s)</b>\n\n"
-            f"Use 🛒 <b>Buy Account</b> to purchase!",
-            parse_mode="HTML"
-        )
+        with outbound.priority(outbound.RECEIPT):
+            bot.send_message(telegram_id, text, parse_mode="HTML")
     except Exception as e:
         logger.warning(f"Could not notify user {telegram_id}: {e}")
 
 
-async def start_monitoring(bot):
-    logger.info(f"TON monitor started for: {BOT_WALLET}")
+async def start_monitoring(bot, skip_existing: bool = True):
+    """skip_existing=False processes the latest page too (record_transaction drops
+    hashes already credited) — for a cluster worker taking over from another."""
+    logger.info(f"TON monitor started for: {shops.get().wallet}")
     processed_hashes = set()
+    client = http_client()
 
-    async with httpx.AsyncClient() as client:
-        # Collect existing hashes on startup to skip old transactions
+    # Collect existing hashes on startup to skip old transactions
+    if skip_existing:
         existing = await get_transactions(client)
         for tx in existing:
             h = tx.get("transaction_id", {}).get("hash", "")
@@ -109,19 +156,22 @@ async def start_monitoring(bot):
                 processed_hashes.add(h)
         logger.info(f"Skipped {len(processed_hashes)} old transactions. Watching for new ones...")
 
-        while True:
-            try:
-                txs = await get_transactions(client)
-                for tx in txs:
-                    tx_hash = tx.get("transaction_id", {}).get("hash", "")
-                    if tx_hash and tx_hash not in processed_hashes:
-                        processed_hashes.add(tx_hash)
-                        await process_transaction(bot, tx)
-
-                if len(processed_hashes) > 1000:
-                    processed_hashes = set(list(processed_hashes)[-500:])
-
-            except Exception as e:
-                logger.error(f"Monitor loop error: {e}")
-
-            await asyncio.sleep(POLL_INTERVAL)
+    while True:
+        try:
+            txs = await get_transactions(client)
+            for tx in txs:
+                tx_hash = tx.get("transaction_id", {}).get("hash", "")
+                if tx_hash and tx_hash not in processed_hashes:
+                    processed_hashes.add(tx_hash)
+                    if tx.get("utime"):
+                        DETECT_LAG.observe(max(0.0, time.time() - tx["utime"]))
+                    await process_transaction(bot, tx, time.perf_counter())
+
+            if len(processed_hashes) > 1000:
+                processed_hashes = set(list(processed_hashes)[-500:])
+
+        except Exception as e:
+            POLL_ERRORS.inc()
+            logger.error(f"Monitor loop error: {e}")
+
+        await asyncio.sleep(POLL_INTERVAL)
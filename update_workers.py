@@ -0,0 +1,137 @@
+"""
+Update Workers
+--------------
+Runs bot handlers on N worker threads, each draining its own FIFO queue.
+Every update is hashed by user id onto one queue, so:
+- updates from different users run in parallel — an admin blocked on
+  run_async(send_otp) no longer stalls buyers
+- updates from the same user run strictly in order on one thread, so a
+  user's conversation state is never touched by two handlers at once
+
+The bot must be created with threaded=False (handlers run inline on the
+worker that picked the update). install() takes over process_new_updates,
+which is what infinity_polling() calls with every batch from getUpdates.
+
+Metrics: per-queue depth, time an update waited in its queue, and time
+spent in handlers — see stats().
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Seconds; shared by queue-wait and handler-time histograms
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_STOP = object()
+
+
+def update_user_id(update) -> int:
+    """The user an update belongs to (update_id for the rare update without one)."""
+    for field in ("message", "callback_query", "edited_message", "inline_query",
+                  "chosen_inline_result", "pre_checkout_query", "shipping_query",
+                  "my_chat_member", "chat_member", "chat_join_request"):
+        obj = getattr(update, field, None)
+        if obj is not None:
+            user = getattr(obj, "from_user", None)
+            if user is not None:
+                return user.id
+            chat = getattr(obj, "chat", None)
+            if chat is not None:
+                return chat.id
+    return update.update_id
+
+
+class UpdateWorkers:
+    def __init__(self, bot, workers: int = 8, queue_size: int = 1000):
+        if bot.threaded:
+            raise ValueError("UpdateWorkers needs a TeleBot created with threaded=False")
+        self.bot       = bot
+        self.queues    = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads   = []
+        self.handled   = [0] * workers
+        self.failed    = [0] * workers
+        self.max_depth = [0] * workers
+        self.queue_wait   = Histogram(BUCKETS)
+        self.handler_time = Histogram(BUCKETS)
+        self._process  = bot.process_new_updates
+        # Called with each update once its handler returned (cluster.Consumer acks it)
+        self.on_done   = None
+
+    # ── Lifecycle ────────────────────────────────────────
+
+    def start(self):
+        for i in range(len(self.queues)):
+            t = threading.Thread(target=self._run, args=(i,), name=f"update-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        return self
+
+    def install(self):
+        """Route every update the bot receives through the worker queues."""
+        self.bot.process_new_updates = self.submit
+        return self
+
+    def stop(self, timeout: float = None):
+        """Let the workers finish what is already queued, then exit."""
+        for q in self.queues:
+            q.put(_STOP)
+        for t in self.threads:
+            t.join(timeout)
+        self.bot.process_new_updates = self._process
+
+    # ── Dispatch ─────────────────────────────────────────
+
+    def submit(self, updates: list, process=None):
+        """Drop-in for TeleBot.process_new_updates: enqueue instead of handling.
+        process handles them instead of the bot's own (shops.py: several bots share the workers)."""
+        now = time.perf_counter()
+        process = process or self._process
+        for update in updates:
+            if update.update_id > self.bot.last_update_id:
+                self.bot.last_update_id = update.update_id
+            i = update_user_id(update) % len(self.queues)
+            q = self.queues[i]
+            # Blocks the poller when a queue is full — back-pressure on getUpdates
+            q.put((now, update, process))
+            depth = q.qsize()
+            if depth > self.max_depth[i]:
+                self.max_depth[i] = depth
+
+    def _run(self, i: int):
+        q = self.queues[i]
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            enqueued_at, update, process = item
+            started = time.perf_counter()
+            self.queue_wait.observe(started - enqueued_at)
+            try:
+                process([update])
+            except Exception as e:
+                self.failed[i] += 1
+                logger.error(f"Update {update.update_id} failed on worker {i}: {e}", exc_info=True)
+            finally:
+                self.handled[i] += 1
+                self.handler_time.observe(time.perf_counter() - started)
+                if self.on_done is not None:
+                    self.on_done(update)
+
+    # ── Metrics ──────────────────────────────────────────
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.queues),
+            "depth": [q.qsize() for q in self.queues],
+            "max_depth": list(self.max_depth),
+            "handled": sum(self.handled),
+            "failed": sum(self.failed),
+            "queue_wait": self.queue_wait.snapshot(),
+            "handler_time": self.handler_time.snapshot(),
+        }
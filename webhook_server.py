@@ -0,0 +1,161 @@
+"""
+Webhook Server
+--------------
+Receives updates pushed by Telegram instead of long polling getUpdates.
+
+A stdlib ThreadingHTTPServer accepts POSTs on WEBHOOK_PATH, checks the
+X-Telegram-Bot-Api-Secret-Token header, queues the raw body and answers
+200 right away — before any parsing or handler work — so Telegram never
+waits on the bot. A batcher thread drains the queue and hands updates to
+bot.process_new_updates() in batches (the update_workers queues when
+installed).
+
+When the queue is full the request is answered 503 and Telegram retries
+it later, so a burst can never grow memory without bound.
+"""
+
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY      = 1 << 20   # Telegram updates are far below 1 MiB
+
+
+class WebhookServer:
+    def __init__(self, bot, host: str, port: int, path: str, secret: str,
+                 batch_size: int = 100, batch_wait: float = 0.005, queue_size: int = 10000):
+        self.bot        = bot
+        self.path       = path
+        self.secret     = secret.encode()
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue      = queue.Queue(maxsize=queue_size)
+        self.counters   = {"received": 0, "rejected": 0, "dropped": 0, "invalid": 0, "batches": 0}
+        self._counters_lock = threading.Lock()   # bumped from request threads and the batcher
+        self._stop      = threading.Event()
+        self._batcher   = None
+        self.httpd      = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive for Telegram's pooled connections
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length <= 0 or length > MAX_BODY:
+                    self.close_connection = True
+                    return self._reply(413 if length > MAX_BODY else 400)
+                # Always consume the body so the keep-alive connection stays in sync
+                body = self.rfile.read(length)
+                if self.path != server.path:
+                    return self._reply(404)
+                token = (self.headers.get(SECRET_HEADER) or "").encode()
+                if server.secret and not hmac.compare_digest(token, server.secret):
+                    server._count("rejected")
+                    return self._reply(403)
+                try:
+                    server.queue.put_nowait(body)
+                except queue.Full:
+                    server._count("dropped")
+                    return self._reply(503)
+                server._count("received")
+                self._reply(200)
+
+            def _reply(self, code: int):
+                self.send_response(code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, fmt, *args):
+                logger.debug("webhook: " + fmt, *args)
+
+        return Handler
+
+    def _count(self, name: str):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    # ── Batching ─────────────────────────────────────────
+
+    def _next_batch(self) -> list:
+        """Block for one update, then take whatever else arrives within batch_wait."""
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batcher(self):
+        while not self._stop.is_set() or not self.queue.empty():
+            raw = self._next_batch()
+            if not raw:
+                continue
+            updates = []
+            for body in raw:
+                try:
+                    updates.append(types.Update.de_json(json.loads(body)))
+                except Exception as e:
+                    self._count("invalid")
+                    logger.warning(f"Skipping malformed webhook update: {e}")
+            if not updates:
+                continue
+            self._count("batches")
+            try:
+                self.bot.process_new_updates(updates)
+            except Exception as e:
+                logger.error(f"Webhook batch of {len(updates)} failed: {e}", exc_info=True)
+
+    # ── Lifecycle ────────────────────────────────────────
+
+    def start(self):
+        """Serve in background threads; returns immediately."""
+        self._batcher = threading.Thread(target=self._run_batcher, name="webhook-batcher", daemon=True)
+        self._batcher.start()
+        threading.Thread(target=self.httpd.serve_forever, name="webhook-http", daemon=True).start()
+        logger.info(f"Webhook server listening on port {self.port}{self.path}")
+        return self
+
+    def serve_forever(self):
+        """Serve on the calling thread until stop() (or Ctrl+C)."""
+        self._batcher = threading.Thread(target=self._run_batcher, name="webhook-batcher", daemon=True)
+        self._batcher.start()
+        logger.info(f"Webhook server listening on port {self.port}{self.path}")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._stop.set()
+        if self._batcher is not None:
+            self._batcher.join(5)
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {**counters, "queued": self.queue.qsize()}